@@ -0,0 +1,181 @@
+"""
+Headless benchmark suite for the Roomba strategies.
+
+Times Roomba.step (through Roomba.advance, which also moves the robot) for every strategy
+over a grid of room sizes, numbers of obstacles and sensor ranges, and reports for each
+configuration:
+
+steps_per_sec: number of steps per second until the target coverage or the step limit is reached
+time_to_target: seconds needed to reach the target coverage (None if it was not reached)
+peak_memory: peak memory allocated while creating the robot and running a few steps, in bytes
+
+The results are written to a JSON file. With --compare, the results are checked against a
+saved baseline file and every configuration that got slower or bigger by more than the
+threshold is reported as a regression (the exit code is then 1).
+
+Example:
+python benchmark.py --output baseline.json
+python benchmark.py --output new.json --compare baseline.json
+"""
+from classes import SetUp, Roomba
+from experiment import STRATEGIES
+import numpy as np
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+# For every metric, True if bigger is better
+METRICS = {'steps_per_sec': True,'time_to_target': False,'peak_memory': False}
+
+
+def make_robot(size,num_obstacle,sensor_range,seed,robot_args=None,room_args=None):
+    """
+    Create a room of size x size cells and a robot in it, both drawn from the given seed
+    """
+    rng = np.random.default_rng(seed)
+    room = SetUp(nx=size,ny=size,num_obstacle=num_obstacle,**(room_args or {}))
+    room.create_obstacle(rng=rng)
+    return Roomba(room,sensor_range=sensor_range,rng=rng,**(robot_args or {}))
+
+def bench_config(strategy,size,num_obstacle,sensor_range,target=50,max_steps=100,memory_steps=5,trials=1,
+                 robot_args=None,room_args=None):
+    """
+    Benchmark one configuration
+    Input:
+    strategy, size, num_obstacle, sensor_range: the configuration
+    target: coverage percentage to reach
+    max_steps: maximum number of steps per trial
+    memory_steps: number of steps run while tracing the memory
+    trials: number of rooms, the metrics are averaged over them (seeds 0 to trials-1)
+    robot_args: dictionary of other keyword arguments for Roomba
+    room_args: dictionary of other keyword arguments for SetUp, e.g. compact
+    Return:
+    A dictionary with the configuration and its metrics
+    """
+    result = {'strategy': strategy,'size': size,'num_obstacle': num_obstacle,'sensor_range': sensor_range}
+    steps_per_sec = []
+    time_to_target = []
+    peak_memory = []
+    obstacle_fraction = []
+    for seed in range(trials):
+        r = make_robot(size,num_obstacle,sensor_range,seed,robot_args,room_args)
+        obstacle_fraction.append(r.cell_count[2] / r.layout.size)
+        reached = None
+        start = time.perf_counter()
+        for i in range(max_steps):
+            r.advance(strategy)
+            if r.calculate_coverage() >= target:
+                reached = time.perf_counter() - start
+                break
+        elapsed = time.perf_counter() - start
+        steps_per_sec.append((i+1) / elapsed)
+        time_to_target.append(reached)
+
+        # Memory is measured in a separate run, tracing slows everything down
+        tracemalloc.start()
+        r = make_robot(size,num_obstacle,sensor_range,seed,robot_args,room_args)
+        for i in range(memory_steps):
+            r.advance(strategy)
+        peak_memory.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    result['obstacle_fraction'] = float(np.mean(obstacle_fraction))
+    result['steps_per_sec'] = float(np.mean(steps_per_sec))
+    # Only reported if the target was reached in every trial
+    result['time_to_target'] = None if None in time_to_target else float(np.mean(time_to_target))
+    result['peak_memory'] = int(np.max(peak_memory))
+    return result
+
+def run_suite(strategies=STRATEGIES,sizes=(10,20),obstacles=(5,10),sensor_ranges=(1,3),verbose=True,**kwargs):
+    """
+    Benchmark every combination of the given strategies, room sizes, numbers of obstacles and sensor ranges
+    Other keyword arguments are passed to bench_config.
+    Return: a list with the result dictionary of every configuration
+    """
+    results = []
+    for config in itertools.product(strategies,sizes,obstacles,sensor_ranges):
+        try:
+            result = bench_config(*config,**kwargs)
+        except RuntimeError as error:
+            # e.g. a room without any free cell to start from
+            result = dict(zip(('strategy','size','num_obstacle','sensor_range'),config),error=str(error))
+        if verbose:
+            print(format_result(result))
+        results.append(result)
+    return results
+
+def config_key(result):
+    return (result['strategy'],result['size'],result['num_obstacle'],result['sensor_range'])
+
+def format_result(result):
+    name = "{0} size={1} obstacles={2} sensor_range={3}".format(*config_key(result))
+    if 'error' in result:
+        return "{0}: error: {1}".format(name,result['error'])
+    target = 'not reached' if result['time_to_target'] is None else "{0:.3g} s".format(result['time_to_target'])
+    return "{0}: {1:.4g} steps/s, target coverage {2}, peak memory {3:.1f} kB".format(
+        name,result['steps_per_sec'],target,result['peak_memory']/1024)
+
+def compare(results,baseline,threshold=0.2):
+    """
+    Compare the results against the results of a baseline run
+    Input:
+    results, baseline: lists of result dictionaries from run_suite
+    threshold: relative change above which a metric is a regression, 0.2 means 20% worse
+    Return: a list of strings describing the regressions
+    """
+    old = {config_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = old.get(config_key(result))
+        if before is None or 'error' in result or 'error' in before:
+            continue
+        for metric,higher_is_better in METRICS.items():
+            if before[metric] is None:
+                continue
+            if result[metric] is None:
+                regressions.append("{0}: {1} is not reached anymore".format(config_key(result),metric))
+                continue
+            change = (result[metric] - before[metric]) / before[metric]
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append("{0}: {1} went from {2:.4g} to {3:.4g} ({4:+.0%})".format(
+                    config_key(result),metric,before[metric],result[metric],change))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the strategies over a grid of rooms")
+    parser.add_argument('--strategies',nargs='+',default=STRATEGIES,help="strategies to benchmark")
+    parser.add_argument('--sizes',nargs='+',type=int,default=[10,20],help="room sizes (square rooms)")
+    parser.add_argument('--obstacles',nargs='+',type=int,default=[5,10],help="numbers of obstacles")
+    parser.add_argument('--sensor-ranges',nargs='+',type=int,default=[1,3],help="sensor ranges")
+    parser.add_argument('--target',type=float,default=50,help="target coverage percentage")
+    parser.add_argument('--max-steps',type=int,default=100,help="maximum number of steps per trial")
+    parser.add_argument('--trials',type=int,default=1,help="number of rooms per configuration")
+    parser.add_argument('--ga-engine',choices=['loop','array'],default='loop',help="genetic algorithm implementation")
+    parser.add_argument('--compact',action='store_true',help="use the compact room representation")
+    parser.add_argument('--output',default='benchmark.json',help="file to write the results to")
+    parser.add_argument('--compare',default=None,help="baseline results file to compare against")
+    parser.add_argument('--threshold',type=float,default=0.2,help="relative change flagged as a regression")
+    args = parser.parse_args()
+
+    results = run_suite(args.strategies,args.sizes,args.obstacles,args.sensor_ranges,target=args.target,
+                        max_steps=args.max_steps,trials=args.trials,robot_args={'ga_engine': args.ga_engine},
+                        room_args={'compact': args.compact})
+    info = {'python': platform.python_version(),'numpy': np.__version__,'machine': platform.machine(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),'ga_engine': args.ga_engine,'compact': args.compact}
+    with open(args.output,'w') as f:
+        json.dump({'info': info,'results': results},f,indent=1)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results,baseline,args.threshold)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            sys.exit(1)
+        print("No regression against", args.compare)
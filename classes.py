@@ -3,6 +3,64 @@ import matplotlib.pyplot as plt
 from matplotlib import colors
 import math
 import time
+import heapq
+import weakref
+import itertools
+import operator
+from collections import deque, OrderedDict
+
+# Moves tried by the random walk, in order. The random walk has never considered
+# the (0,1) move, it is left out here as well so results stay comparable
+RANDOM_WALK_MOVES = [(-1,-1),(-1,0),(-1,1),(0,-1),(1,-1),(1,0),(1,1)]
+# All the moves to the 8 neighbor cells, in the order create_minipath tries them
+NEIGHBOR_MOVES = [(x,y) for x in range(-1,2) for y in range(-1,2) if x!=0 or y!=0]
+
+# Lookup tables for the neighbor bit masks of compact rooms (bit j set if the j-th move is legal):
+# the number of legal moves of every mask, and the indices of the legal moves in order
+_MASK_COUNT = np.array([bin(mask).count('1') for mask in range(256)],dtype=np.uint8)
+_MASK_MOVES = np.array([[j for j in range(8) if mask >> j & 1] + [-1]*(8-bin(mask).count('1'))
+                        for mask in range(256)],dtype=np.int8)
+
+# Distance field value of the free cells from which no uncleaned cell can be reached
+FAR = np.iinfo(np.int32).max
+# The 8 cells around a cell, going around it. The odd ones are side cells, two side cells next to
+# the same corner are neighbors even when the corner is an obstacle
+_RING = [(-1,-1),(-1,0),(-1,1),(0,1),(1,1),(1,0),(1,-1),(0,-1)]
+
+
+def _randint(rng,low,high=None,size=None):
+    """
+    Draw a random integer (or an array of the given size) in [low, high) from rng, a numpy Generator.
+    If rng is None, the global numpy random state is used.
+    """
+    if rng is None:
+        return np.random.randint(low,high,size)
+    return rng.integers(low,high,size)
+
+def _rand(rng):
+    """
+    Draw a random float in [0, 1) from rng, or from the global numpy random state if rng is None
+    """
+    if rng is None:
+        return np.random.rand()
+    return rng.random()
+
+def _random(rng,size):
+    """
+    Draw an array of random floats in [0, 1) from rng, or from the global numpy random state if rng is None
+    """
+    if rng is None:
+        return np.random.random(size)
+    return rng.random(size)
+
+def _choice(rng,n):
+    """
+    Draw a random index in [0, n) from rng, or from the global numpy random state if rng is None
+    """
+    if rng is None:
+        return np.random.choice(n)
+    return rng.choice(n)
+
 
 class SetUp(object):
 
@@ -15,39 +73,504 @@ class SetUp(object):
     nx: The width of the room
     ny: The length of the room
     num_obstacle: The number of obstacles in the room (note: obstacles can have different size)
+    compact: If True, layout is stored with one byte per cell and the robots share it instead of copying it,
+    neighbors are kept as one bit mask per cell instead of a CSR index. Meant for very large rooms.
+    version: Counter increased every time the layout changes
+    robots: The robots created in the room, they are told about the obstacle events
+    free_neighbor_count: Number of non-obstacle neighbor cells of every cell (computed on demand)
+    components: Label of the connected group of free cells of every cell, -1 for obstacles (computed on demand)
 
     Methods:
 
-    create_obstacle(self,seed=None): Randomly mark some cells as obstacle, size of obstacles are random
+    create_obstacle(self,seed=None,rng=None): Randomly mark some cells as obstacle, size of obstacles are random
+    from_layout(cls,layout,num_obstacle,compact): Create a room around an existing layout array, without copying it
+    from_scenario(cls,path,index,compact): Load one room of a scenario file (see scenarios.py), without copying it
+    layout_changed(self): Record that the layout was modified so the derived structures are rebuilt
+    add_obstacles(self,cells): Turn some free cells into obstacles during a run
+    remove_obstacles(self,cells): Turn some obstacle cells into free (uncleaned) cells during a run
+    move_obstacles(self,cells,dx,dy): Move some obstacle cells by (dx,dy) during a run
+    update_obstacles(self,cells,obstacle): Obstacle event, repairing the derived structures and every robot locally
+    neighbor_index(self,moves): Return the index of the non-obstacle neighbors of every cell in CSR form
+    neighbor_mask(self,moves): Return a bit mask of the legal moves of every cell, used by compact rooms
+    neighbors(self,cell,moves): Return the non-obstacle neighbors of one cell
+    random_neighbors(self,cells,draws,moves): Pick one non-obstacle neighbor for each cell of an array
+    neighbor_cells(self,cells,moves): Return the non-obstacle neighbors of all the cells of an array
+    bfs_levels(self,sources,seen,moves): Breadth-first search from some cells, one array of cells per distance
+    flood_fill(self,cell,moves): Return the cells that can be reached from one cell
+    dead_ends(self): Return the coordinates of the free cells without any free neighbor
     display(self): Display the current state of the room
     """
 
-    def __init__(self,nx=10,ny=10,num_obstacle=10):
+    def __init__(self,nx=10,ny=10,num_obstacle=10,compact=False):
         """
         obstacle: number of obstacles
+        compact: use the compact representation for very large rooms
         """
         self.nx = nx
         self.ny = ny
+        self.compact = compact
         # Initialize an empty room
-        self.layout = np.zeros((nx,ny))
+        self.layout = np.zeros((nx,ny),dtype=np.uint8 if compact else float)
         # Color code: white - empty uncleaned area, grey - obstacles, green - cleaned
         # Number code: 0 - empty uncleaned area, 1 - cleaned area, 2 - obstacle
         self.num_obstacle = num_obstacle
+        self.version = 0
+        # Neighbor indices (or masks for compact rooms) built from the current layout, one per move set
+        self._neighbor_index = {}
+        self._free_neighbor_count = None
+        self._components = None
+        self._next_label = 0
+        # Weak references to the robots in the room, see Roomba
+        self._robots = []
 
+    @property
+    def robots(self):
+        self._robots = [ref for ref in self._robots if ref() is not None]
+        return [ref() for ref in self._robots]
 
+    def __getstate__(self):
+        # The robots are not sent along with a pickled room
+        state = self.__dict__.copy()
+        state['_robots'] = []
+        return state
+
+    @classmethod
+    def from_layout(cls,layout,num_obstacle=0,compact=False):
+        """
+        Create a room using the given layout array as its layout, without copying it
+        """
+        room = cls(nx=layout.shape[0],ny=layout.shape[1],num_obstacle=num_obstacle,compact=compact)
+        room.layout = layout
+        return room
+
+    @classmethod
+    def from_scenario(cls,path,index,compact=False):
+        """
+        Load the room number index of the scenario file path. The layout is a read-only view of the
+        memory-mapped file.
+        """
+        from scenarios import open_scenarios
+        return open_scenarios(path).room(index,compact=compact)
 
-    def create_obstacle(self,seed=None):
+    def create_obstacle(self,seed=None,rng=None):
+        """
+        seed: seed for the global numpy random state
+        rng: a numpy Generator to draw the obstacles from instead of the global random state
+        """
         if seed != None:
             np.random.seed(seed)
         for obs in range(self.num_obstacle):
             # x-coordinate of the obstacle
-            rx = np.random.randint(low=1,high=self.nx)
+            rx = _randint(rng,1,self.nx)
             # y-coordinate of the obstacle
-            ry = np.random.randint(low=1,high=self.ny)
+            ry = _randint(rng,1,self.ny)
             # size of obstacle
-            size_x = np.random.randint(low=0,high=self.nx//2)
-            size_y = np.random.randint(low=0,high=self.ny//2)
+            size_x = _randint(rng,0,self.nx//2)
+            size_y = _randint(rng,0,self.ny//2)
             self.layout[rx:(rx+size_x)%self.nx,ry:(ry+size_y)%self.ny] = 2
+        self.layout_changed()
+
+    def layout_changed(self):
+        """
+        Record that the layout was modified. Must be called after changing layout in place,
+        the neighbor indices are rebuilt from the new layout the next time they are needed.
+        """
+        self.version += 1
+        self._neighbor_index = {}
+        self._free_neighbor_count = None
+        self._components = None
+
+    def add_obstacles(self,cells):
+        """
+        Turn the given free cells into obstacles, see update_obstacles
+        """
+        return self.update_obstacles(cells,True)
+
+    def remove_obstacles(self,cells):
+        """
+        Turn the given obstacle cells into free uncleaned cells, see update_obstacles
+        """
+        return self.update_obstacles(cells,False)
+
+    def move_obstacles(self,cells,dx,dy):
+        """
+        Move the given obstacle cells by (dx,dy), the cells moved out of the room disappear.
+        Raise ValueError, without changing the room, if a cell is outside the room or an obstacle would
+        move onto a robot.
+        Return: the cells freed and the cells turned into obstacles
+        """
+        cells = self._check_cells(cells)
+        cells = cells[self.layout[cells[:,0],cells[:,1]] == 2]
+        target = cells + (dx,dy)
+        target = target[(target[:,0] >= 0) & (target[:,0] < self.nx) & (target[:,1] >= 0) & (target[:,1] < self.ny)]
+        old = set(map(tuple,cells.tolist()))
+        new = set(map(tuple,target.tolist()))
+        # Checked before freeing anything, so a move that fails leaves the room unchanged
+        for r in self.robots:
+            if (r.current_x,r.current_y) in new - old:
+                raise ValueError("Cannot put an obstacle on a robot at {0}".format((r.current_x,r.current_y)))
+        freed = self.remove_obstacles(sorted(old - new))
+        added = self.add_obstacles(sorted(new - old))
+        return freed,added
+
+    def update_obstacles(self,cells,obstacle):
+        """
+        Obstacle event: turn cells into obstacles (obstacle True) or into free uncleaned cells (obstacle False)
+        during a run. Instead of rebuilding everything like layout_changed, the neighbor indices and masks,
+        the free neighbor counts and the components are repaired around the changed cells, and every robot
+        of the room updates its own view, counters and distance field the same way. The components are only
+        labelled again from scratch when the event may split or join groups of free cells.
+        Input:
+        cells: list or array of (x,y) coordinates, a ValueError is raised before changing anything if one of
+        them is outside the room
+        obstacle: True to add obstacles, False to remove them
+        Return: an array with the coordinates of the cells that actually changed
+        """
+        cells = np.unique(self._check_cells(cells),axis=0)
+        cells = cells[(self.layout[cells[:,0],cells[:,1]] == 2) != obstacle]
+        if len(cells) == 0:
+            return cells
+        robots = self.robots
+        if obstacle:
+            for r in robots:
+                if np.any((cells[:,0] == r.current_x) & (cells[:,1] == r.current_y)):
+                    raise ValueError("Cannot put an obstacle on a robot at {0}".format((r.current_x,r.current_y)))
+        if not self.layout.flags.writeable:
+            # e.g. a room of a scenario file, the robots sharing its layout share the copy
+            layout = np.array(self.layout)
+            for r in robots:
+                if isinstance(r.layout,CompactLayout) and r.layout.shared:
+                    r.layout.base = layout
+            self.layout = layout
+        numbers = cells[:,0]*self.ny + cells[:,1]
+        # Nothing to repair in labels nobody asked for yet
+        old_labels = self._components.ravel()[numbers] if self._components is not None else None
+
+        for (x,y),cell in zip(cells.tolist(),numbers.tolist()):
+            self.layout[x,y] = 2 if obstacle else 0
+            if self._components is not None:
+                self._update_component(x,y,obstacle)
+        for key in list(self._neighbor_index):
+            self._repair_neighbors(key,numbers)
+        if self._free_neighbor_count is not None:
+            affected = self._affected_cells(numbers,NEIGHBOR_MOVES)
+            if self.compact:
+                counts = _MASK_COUNT[self.neighbor_mask().ravel()[affected]]
+            else:
+                indptr,indices = self.neighbor_index()
+                counts = indptr[affected+1] - indptr[affected]
+            self._free_neighbor_count.ravel()[affected] = counts
+        self.version += 1
+        # The components are labelled again (if needed) before the robots look at them
+        topology_changed = self._components is None
+        for r in robots:
+            r.obstacles_changed(cells,obstacle,old_labels,topology_changed)
+        return cells
+
+    def _check_cells(self,cells):
+        """
+        Return the cells as an integer array of shape (n, 2), raise ValueError if one of them is outside the room
+        """
+        cells = np.asarray(cells,dtype=np.int64).reshape(-1,2)
+        outside = (cells[:,0] < 0) | (cells[:,0] >= self.nx) | (cells[:,1] < 0) | (cells[:,1] >= self.ny)
+        if np.any(outside):
+            raise ValueError("Cell {0} is outside the room".format(tuple(cells[outside][0].tolist())))
+        return cells
+
+    def _update_component(self,x,y,obstacle):
+        """
+        Update the component labels after the cell (x,y) changed, or forget them if groups may have split or joined
+        """
+        labels = self._components
+        ring = [(x+dx,y+dy) for dx,dy in _RING]
+        free = [0 <= i < self.nx and 0 <= j < self.ny and self.layout[i,j] != 2 for i,j in ring]
+        if obstacle:
+            # The cells around are still connected without (x,y) if the free ones form one group around it
+            group = list(range(8))
+            def find(i):
+                while group[i] != i:
+                    i = group[i]
+                return i
+            for i in range(8):
+                for j in ((i+1) % 8,(i+2) % 8 if i % 2 == 1 else None):
+                    if j is not None and free[i] and free[j]:
+                        group[find(i)] = find(j)
+            if len({find(i) for i in range(8) if free[i]}) > 1:
+                self._components = None
+            else:
+                labels[x,y] = -1
+        else:
+            around = {int(labels[i,j]) for (i,j),is_free in zip(ring,free) if is_free}
+            if len(around) > 1:
+                self._components = None
+            elif len(around) == 1:
+                labels[x,y] = around.pop()
+            else:
+                if self._next_label > np.iinfo(labels.dtype).max:
+                    self._components = labels = labels.astype(np.min_scalar_type(-self._next_label-1))
+                labels[x,y] = self._next_label
+                self._next_label += 1
+
+    def _affected_cells(self,cells,moves):
+        """
+        Return the sorted cell numbers that have one of the given cells as neighbor through moves
+        """
+        x,y = np.divmod(cells,self.ny)
+        dx = np.array([move[0] for move in moves])
+        dy = np.array([move[1] for move in moves])
+        nbr_x = (x[:,None] - dx).ravel()
+        nbr_y = (y[:,None] - dy).ravel()
+        inside = (nbr_x >= 0) & (nbr_x < self.nx) & (nbr_y >= 0) & (nbr_y < self.ny)
+        return np.unique(nbr_x[inside]*self.ny + nbr_y[inside])
+
+    def _legal_moves(self,cells,moves):
+        """
+        Return the cell numbers of the neighbors of the given cells through every move, one row per cell,
+        and a boolean array, True where the neighbor is inside the room and not an obstacle
+        """
+        x,y = np.divmod(cells,self.ny)
+        dx = np.array([move[0] for move in moves])
+        dy = np.array([move[1] for move in moves])
+        nbr_x = x[:,None] + dx
+        nbr_y = y[:,None] + dy
+        legal = (nbr_x >= 0) & (nbr_x < self.nx) & (nbr_y >= 0) & (nbr_y < self.ny)
+        legal[legal] = self.layout[nbr_x[legal],nbr_y[legal]] != 2
+        return nbr_x*self.ny + nbr_y,legal
+
+    def _repair_neighbors(self,key,cells):
+        """
+        Rebuild the rows of a cached neighbor index or mask for the cells next to the changed cells
+        """
+        moves = list(key[1:]) if key[0] == 'mask' else list(key)
+        affected = self._affected_cells(cells,moves)
+        nbrs,legal = self._legal_moves(affected,moves)
+        if key[0] == 'mask':
+            bits = (legal.astype(np.uint8) << np.arange(len(moves),dtype=np.uint8)).sum(axis=1,dtype=np.uint8)
+            self._neighbor_index[key].ravel()[affected] = bits
+            return
+        indptr,indices = self._neighbor_index[key]
+        # Splice the new rows between the unchanged parts of indices and shift indptr after each row
+        counts = legal.sum(axis=1)
+        rows = np.split(nbrs[legal],np.cumsum(counts)[:-1])
+        pieces = []
+        end = 0
+        for cell,row in zip(affected.tolist(),rows):
+            pieces.append(indices[end:indptr[cell]])
+            pieces.append(row)
+            end = indptr[cell+1]
+        pieces.append(indices[end:])
+        shift = np.zeros(len(indptr),dtype=np.int64)
+        shift[affected+1] = counts - (indptr[affected+1] - indptr[affected])
+        self._neighbor_index[key] = (indptr + np.cumsum(shift),np.concatenate(pieces))
+
+    def neighbor_index(self,moves=NEIGHBOR_MOVES):
+        """
+        Index of the non-obstacle neighbors of every cell, built once per layout
+        Input:
+        moves: list of the (dx,dy) moves allowed
+        Return:
+        indptr, indices: the neighbors of the cell (x,y) are indices[indptr[c]:indptr[c+1]] with c = x*ny+y,
+        stored as cell numbers x*ny+y in the order of moves
+        """
+        key = tuple(moves)
+        if key not in self._neighbor_index:
+            # One row per cell, one column per move
+            nbrs,legal = self._legal_moves(np.arange(self.nx*self.ny),moves)
+            indptr = np.zeros(self.nx*self.ny+1,dtype=np.int64)
+            np.cumsum(legal.sum(axis=1),out=indptr[1:])
+            indices = nbrs[legal]
+            self._neighbor_index[key] = (indptr,indices)
+        return self._neighbor_index[key]
+
+    def neighbor_mask(self,moves=NEIGHBOR_MOVES):
+        """
+        Bit masks of the legal moves of every cell, built once per layout. Needs 1 byte per cell
+        instead of up to 8 indices per cell for neighbor_index.
+        Input:
+        moves: list of up to 8 (dx,dy) moves allowed
+        Return:
+        A uint8 array shaped like the layout, bit j of a cell is set if moves[j] leads to a non-obstacle cell
+        """
+        key = ('mask',) + tuple(moves)
+        if key not in self._neighbor_index:
+            free = self.layout != 2
+            mask = np.zeros((self.nx,self.ny),dtype=np.uint8)
+            for j,(dx,dy) in enumerate(moves):
+                # Cells whose neighbor (x+dx,y+dy) is inside the room, and those neighbors
+                cells = (slice(max(0,-dx),self.nx-max(0,dx)),slice(max(0,-dy),self.ny-max(0,dy)))
+                nbrs = (slice(max(0,dx),self.nx-max(0,-dx)),slice(max(0,dy),self.ny-max(0,-dy)))
+                mask[cells] |= free[nbrs].astype(np.uint8) << j
+            self._neighbor_index[key] = mask
+        return self._neighbor_index[key]
+
+    def neighbors(self,cell,moves=NEIGHBOR_MOVES):
+        """
+        Return an array with the non-obstacle neighbors of the cell number cell = x*ny+y,
+        as cell numbers in the order of moves
+        """
+        if not self.compact:
+            indptr,indices = self.neighbor_index(moves)
+            return indices[indptr[cell]:indptr[cell+1]]
+        bits = self.neighbor_mask(moves)[cell // self.ny,cell % self.ny]
+        legal = _MASK_MOVES[bits,:_MASK_COUNT[bits]]
+        return cell + np.array([dx*self.ny + dy for dx,dy in moves])[legal]
+
+    def random_neighbors(self,cells,draws,moves=NEIGHBOR_MOVES):
+        """
+        Pick one non-obstacle neighbor for each cell of an array of cell numbers
+        Input:
+        cells: array of cell numbers x*ny+y
+        draws: array of random numbers in [0, 1), one per cell, the neighbor picked is the
+        int(draw*count)-th of the count neighbors of the cell
+        moves: list of the (dx,dy) moves allowed
+        Return: an array with the cell numbers of the neighbors
+        """
+        if not self.compact:
+            indptr,indices = self.neighbor_index(moves)
+            start = indptr[cells]
+            count = indptr[cells+1] - start
+        else:
+            bits = self.neighbor_mask(moves)[cells // self.ny,cells % self.ny]
+            count = _MASK_COUNT[bits]
+        if np.any(count == 0):
+            raise RuntimeError("No possible tile to move from {0}".format(divmod(int(cells[count == 0][0]),self.ny)))
+        pick = (draws*count).astype(int)
+        if not self.compact:
+            return indices[start + pick]
+        offsets = np.array([dx*self.ny + dy for dx,dy in moves])
+        return cells + offsets[_MASK_MOVES[bits,pick]]
+
+    def neighbor_cells(self,cells,moves=NEIGHBOR_MOVES):
+        """
+        Return one array with the non-obstacle neighbors of all the cells of an array of cell numbers,
+        the neighbors of the first cell first
+        """
+        if not self.compact:
+            indptr,indices = self.neighbor_index(moves)
+            start = indptr[cells]
+            count = indptr[cells+1] - start
+            # Position in indices of every neighbor: start of its cell plus its rank among the neighbors of the cell
+            return indices[np.repeat(start - np.cumsum(count) + count,count) + np.arange(count.sum())]
+        bits = self.neighbor_mask(moves).ravel()[cells]
+        return np.concatenate([cells[(bits >> j) & 1 == 1] + dx*self.ny + dy for j,(dx,dy) in enumerate(moves)])
+
+    def bfs_levels(self,sources,seen,moves=NEIGHBOR_MOVES):
+        """
+        Breadth-first search over the non-obstacle cells
+        Input:
+        sources: array of cell numbers x*ny+y at distance 0
+        seen: flat boolean array with one value per cell, the search never enters the cells that are True.
+        It is updated in place with the cells reached.
+        Yield: the array of the cells at distance 0, 1, 2, ... in turn
+        """
+        frontier = np.unique(np.asarray(sources,dtype=np.int64))
+        frontier = frontier[~seen[frontier]]
+        seen[frontier] = True
+        while len(frontier) > 0:
+            yield frontier
+            nbrs = np.unique(self.neighbor_cells(frontier,moves))
+            frontier = nbrs[~seen[nbrs]]
+            seen[frontier] = True
+
+    def flood_fill(self,cell,moves=NEIGHBOR_MOVES):
+        """
+        Return a boolean array shaped like the layout, True for the cells that can be reached from the cell number cell
+        """
+        seen = (self.layout == 2).ravel()
+        reached = np.zeros(self.nx*self.ny,dtype=bool)
+        for level in self.bfs_levels([cell],seen,moves):
+            reached[level] = True
+        return reached.reshape(self.nx,self.ny)
+
+    @property
+    def components(self):
+        """
+        Label of every cell, the same for the free cells connected by NEIGHBOR_MOVES and -1 for the obstacles.
+        The groups are numbered in the order of their first cell. An array shaped like the layout, of the
+        smallest signed integer dtype that holds the labels.
+        """
+        if self._components is None:
+            self._label_components()
+        return self._components
+
+    def _row_runs(self,rows):
+        """
+        Return a boolean array, True on the first cell of every run of free cells along y, for the given rows
+        """
+        free = self.layout[rows] != 2
+        return free & ~np.pad(free[:,:-1],((0,0),(1,0))),free
+
+    def _label_components(self,block=1<<22):
+        """
+        Label the groups of free cells in linear time: find the runs of free cells of every row, join the runs
+        touching a run of the next row (diagonals included) with a union-find, then write the label of every run.
+        The rows are read block cells at a time.
+        """
+        rows = max(1,block // self.ny)
+        blocks = [slice(x,x+rows) for x in range(0,self.nx,rows)]
+        # Row, first and last column of every run, in the order of the cells
+        row = []
+        first = []
+        last = []
+        for part in blocks:
+            starts,free = self._row_runs(part)
+            x,y = np.nonzero(starts)
+            row.append(x + part.start)
+            first.append(y)
+            last.append(np.nonzero(free & ~np.pad(free[:,1:],((0,0),(0,1))))[1])
+        row,first,last = (np.concatenate(values).astype(np.int64) for values in (row,first,last))
+        n = len(row)
+        # The runs of the next row touching a run are a contiguous range of runs
+        width = self.ny + 2
+        low = np.searchsorted(row*width + last,(row+1)*width + first - 1,'left')
+        count = np.maximum(np.searchsorted(row*width + first,(row+1)*width + last + 1,'right') - low,0)
+        a = np.repeat(np.arange(n),count)
+        b = np.repeat(low - np.cumsum(count) + count,count) + np.arange(count.sum())
+        # Hook the larger root of every pair of touching runs to the smaller one and compress the paths, until
+        # every pair has the same root, the smallest run of its group
+        parent = np.arange(n)
+        while len(a) > 0:
+            root_a = parent[a]
+            root_b = parent[b]
+            apart = root_a != root_b
+            a,b,root_a,root_b = a[apart],b[apart],root_a[apart],root_b[apart]
+            np.minimum.at(parent,np.maximum(root_a,root_b),np.minimum(root_a,root_b))
+            while True:
+                grand = parent[parent]
+                if np.array_equal(grand,parent):
+                    break
+                parent = grand
+        roots,run_labels = np.unique(parent,return_inverse=True)
+        labels = np.full((self.nx,self.ny),-1,dtype=np.min_scalar_type(-max(len(roots),1)))
+        run = 0
+        for part in blocks:
+            starts,free = self._row_runs(part)
+            # Run of every free cell, from the number of runs started before it
+            cells = np.cumsum(starts.ravel()) - 1 + run
+            run = int(cells[-1]) + 1 if len(cells) > 0 else run
+            free = free.ravel()
+            labels[part].reshape(-1)[free] = run_labels[cells[free]]
+        self._components = labels
+        self._next_label = len(roots)
+
+    @property
+    def free_neighbor_count(self):
+        """
+        Number of non-obstacle neighbors of every cell, an array shaped like the layout
+        """
+        if self._free_neighbor_count is None:
+            if self.compact:
+                self._free_neighbor_count = _MASK_COUNT[self.neighbor_mask()]
+            else:
+                indptr,indices = self.neighbor_index()
+                self._free_neighbor_count = np.diff(indptr).reshape(self.nx,self.ny)
+        return self._free_neighbor_count
+
+    def dead_ends(self):
+        """
+        Return an array with the coordinates of the free cells that have no free neighbor
+        """
+        return np.argwhere((self.layout != 2) & (self.free_neighbor_count == 0))
 
     def display(self):
         fig,ax = plt.subplots(figsize=(10,10))
@@ -61,6 +584,163 @@ class SetUp(object):
         plt.show()
 
 
+class CompactLayout(object):
+
+    """
+    The layout of a robot in a compact room
+
+    The room's one byte per cell layout is shared by all the robots instead of being copied,
+    and the cells cleaned by the robot are kept in a private bitset (one bit per cell).
+    The shared layout is only copied the first time the robot changes something else than
+    cleaning a cell, e.g. adding an obstacle (copy-on-write).
+    Reading and writing cells works like with the layout array: layout[x,y] with x and y
+    integers or integer arrays, np.asarray(layout) builds the full array.
+
+    Attributes:
+
+    base: The layout of the room, or the robot's own copy once it has been written to
+    shared: True as long as base is the room's layout
+    cleaned: Bitset of the cells cleaned by the robot, bit c is for the cell c = x*ny+y
+    shape, size: Shape and number of cells of the layout
+    """
+
+    def __init__(self,base):
+        self.base = base
+        self.shared = True
+        self.shape = base.shape
+        self.size = base.size
+        self.cleaned = np.zeros((base.size+7)//8,dtype=np.uint8)
+
+    def _cleaned_bits(self,cells):
+        return (self.cleaned[cells >> 3] >> (cells & 7).astype(np.uint8)) & 1
+
+    def __getitem__(self,index):
+        x,y = index
+        state = self.base[x,y]
+        cleaned = self._cleaned_bits(np.asarray(x)*self.shape[1] + np.asarray(y))
+        value = np.where(state == 2,2,np.maximum(state,cleaned)).astype(np.uint8)
+        return int(value) if value.ndim == 0 else value
+
+    def __setitem__(self,index,value):
+        x,y = index
+        if np.ndim(x) or np.ndim(y) or np.ndim(value):
+            self._set_cells(x,y,value)
+            return
+        cell = x*self.shape[1] + y
+        if value == 1 and self.base[x,y] != 2:
+            self.cleaned[cell >> 3] |= np.uint8(1 << (cell & 7))
+            return
+        if self.shared:
+            self.base = self.base.copy()
+            self.shared = False
+        self.base[x,y] = value
+        self.cleaned[cell >> 3] &= np.uint8(~(1 << (cell & 7)) & 0xff)
+
+    def _set_cells(self,x,y,value):
+        """
+        Write the cells of integer arrays x and y, value being one value or one per cell
+        """
+        x,y,value = (np.ravel(array) for array in np.broadcast_arrays(x,y,value))
+        cells = x.astype(np.int64)*self.shape[1] + y
+        clean = (value == 1) & (self.base[x,y] != 2)
+        np.bitwise_or.at(self.cleaned,cells[clean] >> 3,(1 << (cells[clean] & 7)).astype(np.uint8))
+        other = ~clean
+        if not np.any(other):
+            return
+        if self.shared:
+            self.base = self.base.copy()
+            self.shared = False
+        self.base[x[other],y[other]] = value[other]
+        np.bitwise_and.at(self.cleaned,cells[other] >> 3,(~(1 << (cells[other] & 7)) & 0xff).astype(np.uint8))
+
+    def room_changed(self,x,y,value):
+        """
+        The room's layout changed to value at the cell (x,y) (see SetUp.update_obstacles): forget that the cell
+        was cleaned and, if the robot has its own copy of the layout, write the new value to it
+        """
+        if not self.shared:
+            self.base[x,y] = value
+        cell = x*self.shape[1] + y
+        self.cleaned[cell >> 3] &= np.uint8(~(1 << (cell & 7)) & 0xff)
+
+    def __array__(self,dtype=None,copy=None):
+        cleaned = np.unpackbits(self.cleaned,bitorder='little')[:self.size].reshape(self.shape)
+        layout = np.where(self.base == 2,2,np.maximum(self.base,cleaned)).astype(np.uint8)
+        return layout if dtype is None else layout.astype(dtype)
+
+
+class FitnessCache(object):
+
+    """
+    A bounded least-recently-used cache of fitness scores
+
+    The scores are only valid for one state of the robot's layout and visits, identified
+    by the robot's version counter, position and fitness weights. The cache empties itself
+    when the version changes. The keys are the bytes of the minipaths.
+
+    Attributes:
+
+    maxsize: Maximum number of scores kept
+    hits: Number of scores found in the cache
+    misses: Number of scores that had to be computed
+    version: The robot version the cached scores belong to
+
+    Methods:
+
+    sync(self,version): Empty the cache if the scores belong to another version
+    get(self,key): Return the cached score for key, or None
+    put(self,key,score): Store the score for key, dropping the least recently used score if full
+    get_many(self,keys): Return the cached scores of a list of keys, None for the missing ones
+    put_many(self,keys,scores): Store the scores of a list of keys
+    """
+
+    def __init__(self,maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.version = None
+        self._scores = OrderedDict()
+
+    def __len__(self):
+        return len(self._scores)
+
+    def sync(self,version):
+        if version != self.version:
+            self._scores.clear()
+            self.version = version
+
+    def get(self,key):
+        score = self._scores.get(key)
+        if score is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._scores.move_to_end(key)
+        return score
+
+    def put(self,key,score):
+        self._scores[key] = score
+        self._scores.move_to_end(key)
+        if len(self._scores) > self.maxsize:
+            self._scores.popitem(last=False)
+
+    def get_many(self,keys):
+        # One pass of C calls over the keys instead of a get call per key
+        scores = list(map(self._scores.get,keys))
+        misses = scores.count(None)
+        self.misses += misses
+        self.hits += len(scores) - misses
+        found = itertools.compress(keys,map(operator.is_not,scores,itertools.repeat(None)))
+        deque(map(self._scores.move_to_end,found),maxlen=0)
+        return scores
+
+    def put_many(self,keys,scores):
+        # The keys are missing from the cache, they are added as the most recently used ones
+        self._scores.update(zip(keys,scores))
+        for i in range(len(self._scores) - self.maxsize):
+            self._scores.popitem(last=False)
+
+
 class Roomba(object):
 
     """
@@ -72,90 +752,370 @@ class Roomba(object):
 
     x_start, y_start: Starting place for the Roomba
     room: The input room object
-    layout: A copy of the layout of the room
+    layout: A copy of the layout of the room (a CompactLayout sharing the room's layout for compact rooms)
     sensor_range: The number of cells the robot can check from its current position
-    pass_through: A mental map of all the place it has been through to avoid repeated cells
+    visits: A mental map counting how many times the robot has been on each cell, used to avoid repeated cells
+    trajectory: Optional bounded buffer with the last cells visited in order (None if not kept)
     dist_travelled: Total distance travelled by the robot so far
     repeated_cell: Total number of repeated cells
+    cell_count: Running number of uncleaned, cleaned and obstacle cells in layout, indexed by the number code
+    debug: If True, cross-check cell_count against a full recount of layout after every change
+    rng: The numpy Generator used by all the strategies (None to use the global random state)
+    ga_engine: 'loop' to run the genetic algorithm with ga_step, 'array' to run it with ga_step_array
+    warm_start: If True, ga_step_array starts from the surviving genes of the previous plan shifted by the
+    cells moved since then, instead of a population created from scratch
+    commit: Number of cells of each plan executed by advance before planning again
+    ga_args: Keyword arguments of ga_step or ga_step_array used by step, e.g. population (generations is
+    always 1 for the greedy algorithm)
+    fitness_weights: Weights A, B, C and D of the fitness function used by the genetic and greedy algorithms,
+    as keyword arguments of evaluate_fitness_batch (the defaults of evaluate_fitness_batch for the missing ones)
+    plan: The cells of the current plan still to be executed by advance
+    version: Counter increased every time the layout or the visits of the robot change
+    fitness_cache: Optional FitnessCache used by evaluate_fitness_batch (None if disabled)
+    telemetry: Optional telemetry.Telemetry recording the time spent in each phase (None if disabled)
+    team: The robots sharing layout, visits and cell_count with this one (see fleet.py), the first one owns them.
+    Just [self] for a robot on its own.
+    component: Label in room.components of the cells the robot can reach from its starting point
+    unreachable: Number of uncleaned cells the robot cannot reach, left out of the coverage
+    (component and unreachable are only worked out, labelling the room, the first time they are needed)
+    distance: Distance field of the frontier strategy, number of moves from every cell to the nearest reachable
+    uncleaned cell (FAR if there is none, -1 for obstacles and unreachable cells). None until the strategy is used.
 
     Methods:
 
     step(self,strategy): Calculate the next step to move based on the input strategy
+    advance(self,strategy): Move by one cell, following the current plan and planning again with
+    the input strategy once the first commit cells of the plan have been executed
     random_step(self): Calculate the next step to move based on random walk strategy
+    frontier_step(self): Calculate the shortest path to the nearest reachable uncleaned cell with the distance field
+    obstacles_changed(self,cells,obstacle,old_labels,topology_changed): Update the robot after an obstacle event
+    of its room, called by SetUp.update_obstacles
     ga_step(self,population=50,generations=300,cross_over=0.85,mutation=0.2): Calculate
     the next step to move based on genetic algorithm with the given hyperparameters.
     Note that in this implementation we reuse the ga_step function for greedy algorithm
     by simply changing the hyperparameters.
+    ga_step_array(self,population=50,generations=300,cross_over=0.85,mutation=0.2,elite=20,patience=50):
+    A variant of the genetic algorithm of ga_step with the population kept in preallocated arrays, the genetic
+    operations done as masked array operations and early stopping once the best score stops improving. Its
+    selection differs, so it does not give the same paths as ga_step for the same seed: the parents are only
+    drawn from the elite, and the best gene of the final pool, last children included, is returned.
     create_minipath(self): Create one minipath based on the robot's current position. Used
     for genetic algorithm and greedy algorithm.
+    create_minipaths(self,n): Create n minipaths at once as an array of shape (n, sensor_range, 2)
     evaluate_fitness(self,minipath,A,B,C,D): Evaluate the fitness score for a given minipath (gene)
     using the fitness formula A*dist_minipath + B*free_cell + C*dist_x + D*repeated_cell. Used
     for genetic algorithm and greedy algorithm.
+    evaluate_fitness_batch(self,paths,A,B,C,D): Evaluate the fitness score of a whole population
+    of minipaths given as one integer array of shape (population, sensor_range, 2). Used by ga_step.
     check_clean(self): Check if the whole floor is cleaned. Return a boolean.
     move_to(self,x,y): Change the position of the robot and change the state of the visited cells
+    set_cell(self,x,y,value): Change the state of one cell of the layout and keep cell_count up to date
+    check_counters(self): Recount the whole layout and raise an error if cell_count is out of sync
     calculate_coverage(self): Return the percentage of coverage so far in the simulation
 
     """
-    def __init__(self,room,sensor_range=1):
+    def __init__(self,room,sensor_range=1,trajectory_length=None,debug=False,rng=None,ga_engine='loop',
+                 warm_start=False,commit=1,fitness_cache=None,share=None,ga_args=None,fitness_weights=None):
         """
         room_setup: an array represents the set up of the room
+        trajectory_length: number of most recent cells to keep in the trajectory buffer, None to keep none
+        debug: cross-check the cell counters against a full recount after every change
+        rng: a numpy Generator for the starting point and the strategies, None to use the global random state
+        ga_engine: 'loop' to use ga_step for the genetic and greedy algorithms, 'array' to use ga_step_array
+        warm_start: seed the population of ga_step_array with the shifted survivors of the previous plan, only
+        with ga_engine 'array'
+        commit: number of cells of each plan executed by advance before planning again
+        fitness_cache: maximum number of fitness scores to memoize, None to disable the cache
+        share: another robot in the same room to share the cleaned cells, visits and counters with, instead of
+        having a private copy of the layout. The robot then starts on a cell nobody has cleaned yet.
+        ga_args: dictionary of hyperparameters for the genetic algorithm, e.g. {'population': 20,'mutation': 0.1}
+        fitness_weights: dictionary of fitness weights, e.g. {'A': -30,'B': 50}
         """
         # Choose a starting point at the corner
         self.x_start = 0
         self.y_start = 0
         self.room = room
-        self.layout = np.copy(room.layout)
+        self.rng = rng
+        self.ga_engine = ga_engine
+        if warm_start and ga_engine != 'array':
+            raise ValueError("warm_start needs ga_engine='array', ga_step always starts from a new population")
+        self.warm_start = warm_start
+        self.commit = commit
+        self.ga_args = dict(ga_args or {})
+        self.fitness_weights = dict(fitness_weights or {})
+        self.plan = deque()
+        self.version = 0
+        self.fitness_cache = FitnessCache(fitness_cache) if fitness_cache else None
+        # Set by telemetry.Telemetry.attach
+        self.telemetry = None
+        # Elite of the last ga_step_array call and number of cells moved since then, for warm starts
+        self._survivors = None
+        self._moves_since_plan = 0
+        if share is not None:
+            self.layout = share.layout
+            self.visits = share.visits
+            self.cell_count = share.cell_count
+            self.team = share.team
+        else:
+            if room.compact:
+                # Visit counts are 16 bits in compact rooms. They only stop growing (and fitness scores only
+                # differ from a dense room) once a cell has been visited 65535 times, repeated cells are still
+                # all counted.
+                self.layout = CompactLayout(room.layout)
+                self.visits = np.zeros(room.layout.shape,dtype=np.uint16)
+            else:
+                self.layout = np.copy(room.layout)
+                self.visits = np.zeros(room.layout.shape,dtype=np.int32)
+            # Number of uncleaned, cleaned and obstacle cells, so coverage does not need a full scan
+            self.cell_count = [int(np.count_nonzero(room.layout == code)) for code in range(3)]
+            self.team = []
+        self._max_visits = np.iinfo(self.visits.dtype).max
         self.sensor_range = sensor_range
-        self.pass_through = []
+        self.trajectory = deque(maxlen=trajectory_length) if trajectory_length else None
         self.dist_travelled = 0
         self.repeated_cell = 0
         self.movement = 0
+        self.debug = debug
+
+        # Dead-end cells are not used as starting point, the robot could not move from there
+        free_neighbor_count = room.free_neighbor_count
+        uncleaned = room.layout == 0 if share is None else np.asarray(self.layout) == 0
+        if not np.any(uncleaned & (free_neighbor_count > 0)):
+            raise RuntimeError("The room has no free cell the robot can start from")
+        while self.layout[self.x_start,self.y_start] != 0 or free_neighbor_count[self.x_start,self.y_start] == 0:
+            self.x_start = _randint(self.rng,0,room.nx)
+            self.y_start = _randint(self.rng,0,room.ny)
 
-        while self.layout[self.x_start,self.y_start] != 0:
-            self.x_start = np.random.randint(low=0,high=room.nx)
-            self.y_start = np.random.randint(low=0,high=room.ny)
+        # Cells outside the connected group of the starting point can never be cleaned, they do not count
+        # in the coverage. Labelling the groups of a large room is slow, it waits until they are needed.
+        self._component = None
+        self._unreachable = None
+        self.distance = None
+        self._field_changes = []
+        self.team.append(self)
 
         self.current_x = self.x_start
         self.current_y = self.y_start
         self.move_to(self.x_start,self.y_start)
+        room._robots.append(weakref.ref(self))
+
+    def __getstate__(self):
+        # A pickled robot (e.g. sent to a worker process to plan) leaves its team and telemetry behind
+        state = self.__dict__.copy()
+        state['team'] = None
+        state['telemetry'] = None
+        return state
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self.team = [self]
+
+    @property
+    def component(self):
+        if self._component is None:
+            self._component = self.room.components[self.current_x,self.current_y]
+        return self._component
+
+    @property
+    def unreachable(self):
+        if self._unreachable is None:
+            labels = self.room.components
+            self._unreachable = int(np.count_nonzero((np.asarray(self.layout) == 0) & (labels != self.component)))
+        return self._unreachable
 
     def step(self,strategy):
         """
         Calculate the next step to move based on the input strategy
         Input:
-        strategy: string. Either "random_walk", "genetic_algorithm" or "greedy_algorithm"
+        strategy: string. Either "random_walk", "genetic_algorithm", "greedy_algorithm" or "frontier"
         Return:
         The x and y index indicating the next position the robot should go to
         """
         if strategy == 'random_walk':
             return self.random_step()
-        elif strategy == 'genetic_algorithm':
-            return self.ga_step()
+        if strategy == 'frontier':
+            return self.frontier_step()
+        ga_step = self.ga_step_array if self.ga_engine == 'array' else self.ga_step
+        if strategy == 'genetic_algorithm':
+            return ga_step(**self.ga_args)
         else:
-            return self.ga_step(generations=1)
+            return ga_step(**dict(self.ga_args,generations=1))
+
+    def advance(self,strategy):
+        """
+        Move the robot by one cell with the input strategy. A new plan is only computed once the
+        first commit cells of the previous plan have been executed (receding horizon).
+        A plan made of the current cell means there is nothing left to do, the robot stays where it is.
+        Return:
+        The x and y index of the cell the robot moved to
+        """
+        if not self.plan:
+            self.plan.extend((int(x),int(y)) for x,y in self.step(strategy)[:self.commit])
+        x,y = self.plan.popleft()
+        if (x,y) != (self.current_x,self.current_y):
+            self.move_to(x,y)
+        return x,y
 
     def random_step(self):
         """
         Determine the next tile to get to using random walk strategy
         Return the coordinate of that tile.
         """
-        possible_tiles = []
-        for x in range(-1,2):
-            for y in range(-1,2):
-                if x==0 and y == 0:
-                    break
-                else:
-                    # Check to ensure it's valid coordinate
-                    if ((self.current_x+x)<self.room.nx) and ((self.current_x+x)>=0) and \
-                    ((self.current_y+y)<self.room.ny) and ((self.current_y+y)>=0):
-                        # If the tile is not an obstacle
-                        if self.layout[self.current_x+x,self.current_y+y] != 2:
-                            possible_tiles.append([self.current_x+x,self.current_y+y])
-        next_tile = np.random.choice(len(possible_tiles))
-        x = possible_tiles[next_tile][0]
-        y = possible_tiles[next_tile][1]
+        cell = self.current_x*self.room.ny + self.current_y
+        possible_tiles = self.room.neighbors(cell,RANDOM_WALK_MOVES)
+        next_tile = _choice(self.rng,len(possible_tiles))
+        x,y = divmod(int(possible_tiles[next_tile]),self.room.ny)
         return [[x,y]]
 
+    def frontier_step(self):
+        """
+        Determine the shortest path to the nearest uncleaned cell the robot can reach, by going down the
+        distance field. The field is built the first time and then only repaired around the cells that
+        changed since the last call.
+        Return the coordinates of the cells of the path, or of the current cell if no uncleaned cell can be reached
+        """
+        if self.distance is None:
+            self._build_distance_field()
+        elif self._field_changes:
+            self._repair_distance_field()
+        ny = self.room.ny
+        cell = self.current_x*ny + self.current_y
+        d = self.distance[cell]
+        if d == FAR or d <= 0:
+            return [[self.current_x,self.current_y]]
+        path = []
+        while d > 0:
+            # First neighbor in move order one step closer to an uncleaned cell
+            for nbr in self.room.neighbors(cell).tolist():
+                if self.distance[nbr] == d-1:
+                    break
+            cell = nbr
+            d -= 1
+            path.append(list(divmod(cell,ny)))
+        return path
+
+    def _build_distance_field(self):
+        """
+        Compute the distance field from scratch with a breadth-first search from all the reachable uncleaned cells
+        """
+        inside = (self.room.components == self.component).ravel()
+        self.distance = np.where(inside,FAR,-1).astype(np.int32)
+        sources = np.flatnonzero(inside & (np.asarray(self.layout).ravel() == 0))
+        for d,level in enumerate(self.room.bfs_levels(sources,~inside)):
+            self.distance[level] = d
+        self._field_changes = []
+
+    def _repair_distance_field(self):
+        """
+        Update the distance field after some cells changed state, only visiting the cells whose distance changes
+        """
+        dist = self.distance
+        ny = self.room.ny
+        neighbors = lambda cell: self.room.neighbors(cell).tolist()
+        labels = self.room.components.ravel()
+        # Cells that stopped being uncleaned, that became obstacles, that became free and the new uncleaned cells
+        raised = []
+        removed = []
+        joined = []
+        lowered = []
+        for cell in sorted(set(self._field_changes)):
+            state = self.layout[divmod(cell,ny)]
+            if state == 2 or labels[cell] != self.component:
+                if dist[cell] >= 0:
+                    removed.append(cell)
+            elif state == 0 and dist[cell] != 0:
+                lowered.append(cell)
+            elif dist[cell] < 0:
+                joined.append(cell)
+            elif state != 0 and dist[cell] == 0:
+                raised.append(cell)
+        self._field_changes = []
+
+        # Raise: invalidate, in order of distance, the cells left without any valid neighbor one step closer
+        invalid = set(raised + removed)
+        queue = [(int(dist[cell]),cell) for cell in invalid]
+        heapq.heapify(queue)
+        while queue:
+            d,cell = heapq.heappop(queue)
+            for nbr in neighbors(cell):
+                if nbr in invalid or dist[nbr] != d+1:
+                    continue
+                if not any(dist[other] == d and other not in invalid for other in neighbors(nbr)):
+                    invalid.add(nbr)
+                    heapq.heappush(queue,(d+1,nbr))
+
+        # Lower: give the invalid cells the distance of their best valid neighbor and spread it, with the new
+        # uncleaned cells, like Dijkstra's algorithm
+        for cell in removed:
+            dist[cell] = -1
+        invalid = invalid.difference(removed).union(joined)
+        for cell in invalid.union(lowered):
+            dist[cell] = FAR
+        heap = [(0,cell) for cell in lowered]
+        for cell in invalid:
+            best = min([dist[nbr] for nbr in neighbors(cell) if dist[nbr] >= 0],default=FAR)
+            if best < FAR:
+                heap.append((int(best)+1,cell))
+        heapq.heapify(heap)
+        while heap:
+            d,cell = heapq.heappop(heap)
+            if d >= dist[cell]:
+                continue
+            dist[cell] = d
+            for nbr in neighbors(cell):
+                if dist[nbr] > d+1:
+                    heapq.heappush(heap,(d+1,nbr))
+
+    def obstacles_changed(self,cells,obstacle,old_labels,topology_changed):
+        """
+        Update the robot's view of the room after an obstacle event, see SetUp.update_obstacles
+        Input:
+        cells: array with the (x,y) coordinates of the cells that changed
+        obstacle: True if they became obstacles, False if they became free uncleaned cells
+        old_labels: labels of the cells in room.components before the event
+        topology_changed: True if the components were labelled again, the reachable cells are then counted again
+        """
+        if self.team[0] is not self:
+            # The robot owning the shared layout updates the whole team
+            return
+        ny = self.room.ny
+        new = 2 if obstacle else 0
+        olds = []
+        for x,y in cells.tolist():
+            if isinstance(self.layout,CompactLayout):
+                old = 2 if not obstacle else int(self.layout._cleaned_bits(np.int64(x*ny + y)))
+                self.layout.room_changed(x,y,new)
+            else:
+                old = int(self.layout[x,y])
+                self.layout[x,y] = new
+            self.cell_count[old] -= 1
+            self.cell_count[new] += 1
+            olds.append(old)
+        for robot in self.team:
+            robot._update_view(cells,olds,new,old_labels,topology_changed)
+
+    def _update_view(self,cells,olds,new,old_labels,topology_changed):
+        """
+        Update the reachable cells, distance field and plan of the robot after an obstacle event
+        """
+        if topology_changed:
+            # Whole groups of cells may have become reachable or unreachable, they are counted again when needed
+            self._component = None
+            self._unreachable = None
+            self.distance = None
+        else:
+            if self._unreachable is not None:
+                for (x,y),old,old_label in zip(cells.tolist(),olds,old_labels.tolist()):
+                    self._unreachable += (int(new == 0 and self.room.components[x,y] != self._component) -
+                                          int(old == 0 and old_label != self._component))
+            if self.distance is not None:
+                self._field_changes.extend((cells[:,0]*self.room.ny + cells[:,1]).tolist())
+        # The current plan may go through the new obstacles
+        self.plan.clear()
+        self.version += 1
+        if self.debug:
+            self.check_counters()
+
     def ga_step(self,population=50,generations=300,cross_over=0.85,mutation=0.2):
         """
         Determine the next tile to get to using genetic algorithm
@@ -163,39 +1123,40 @@ class Roomba(object):
         """
         # Create mini paths
         gene_pool = []
-        score_array = []
         # Initialize population
         for i in range(population):
-            mini_path = self.create_minipath()
-            score = self.evaluate_fitness(mini_path)
-            gene_pool.append(mini_path)
-            score_array.append(score)
+            gene_pool.append(self.create_minipath())
+        score_array = self.evaluate_fitness_batch(gene_pool,**self.fitness_weights)
 
         # Iterate over generations
         for i in range(generations):
+            if self.telemetry is not None:
+                start = time.perf_counter()
             gene_pool = np.array(gene_pool)
             score_array = np.array(score_array)
             # Get the 20 best genes
             best = np.argsort(score_array)[::-1][:20]
             gene_pool = gene_pool[best]
             score_array = score_array[best]
+            if self.telemetry is not None:
+                self.telemetry.generation(time.perf_counter()-start,score_array[0],2*(population//2))
 
             # Genetic operation
             for j in range(population//2):
-                parent1 = np.random.randint(len(gene_pool))
-                parent2 = np.random.randint(len(gene_pool))
+                parent1 = _randint(self.rng,len(gene_pool))
+                parent2 = _randint(self.rng,len(gene_pool))
                 child1 = np.copy(gene_pool[parent1])
                 child2 = np.copy(gene_pool[parent2])
                 for k in range(1,self.sensor_range):
                     # Cross over
-                    if np.random.rand() < cross_over:
+                    if _rand(self.rng) < cross_over:
                         # Check if it's a reasonable new path before crossing
                         if abs(gene_pool[parent2][k][0]-child1[k-1][0]) <= 1 and abs(gene_pool[parent2][k][1]-child1[k-1][1])<=1:
                             child1[k] = gene_pool[parent2][k]
                         if abs(gene_pool[parent1][k][0]-child2[k-1][0]) <= 1 and abs(gene_pool[parent1][k][1]-child2[k-1][1])<=1:
                             child2[k] = gene_pool[parent1][k]
                     # Mutation
-                    if np.random.rand() < mutation:
+                    if _rand(self.rng) < mutation:
                         # Check if it's a reasonable new path before mutate
                         if (child1[k][0]+1) < self.room.nx and (child1[k][1]-1) >= 0:
                             child1[k][0] += 1
@@ -209,9 +1170,9 @@ class Roomba(object):
                 gene_pool = list(gene_pool)
                 gene_pool.append(child1)
                 gene_pool.append(child2)
-                score_array = list(score_array)
-                score_array.append(self.evaluate_fitness(child1))
-                score_array.append(self.evaluate_fitness(child2))
+            # Score all the children of this generation at once
+            children = np.array(gene_pool[len(score_array):])
+            score_array = np.concatenate((score_array,self.evaluate_fitness_batch(children,**self.fitness_weights)))
         # If the best solution is to stay where the robot is
         if score_array[0] == 0:
             # Just randomly go somewhere else, otherwise we would get stuck in a region
@@ -219,36 +1180,140 @@ class Roomba(object):
             return path
         return gene_pool[0]
 
+    def ga_step_array(self,population=50,generations=300,cross_over=0.85,mutation=0.2,elite=20,patience=50):
+        """
+        Determine the next tile to get to using genetic algorithm, with the whole population kept in arrays.
+        This is a variant of ga_step, not the same algorithm: ga_step draws the parents from the pool as it
+        grows, children of the current generation included, and returns the best gene of the elite selected
+        before the last generation, while here the parents of a generation are all drawn from its elite and
+        the best gene of the final pool, last children included, is returned.
+        Input:
+        population: number of genes created at the start and number of children per generation
+        generations: maximum number of generations
+        cross_over, mutation: probability of cross over and mutation at each position of a child
+        elite: number of best genes kept from one generation to the next
+        patience: stop after this many generations without improvement of the best score, None to never stop early
+        Return the coordinate of that tile.
+        """
+        n_children = 2*(population//2)
+        # Preallocated gene pool: the elite first, then the children of the current generation
+        size = max(population,elite+n_children)
+        gene_pool = np.zeros((size,self.sensor_range,2),dtype=int)
+        score_array = np.full(size,-np.inf)
+        warm = self._warm_genes()[:population] if self.warm_start else np.zeros((0,self.sensor_range,2),dtype=int)
+        gene_pool[:len(warm)] = warm
+        gene_pool[len(warm):population] = self.create_minipaths(population-len(warm))
+        score_array[:population] = self.evaluate_fitness_batch(gene_pool[:population],**self.fitness_weights)
+        alive = population
+        best_score = score_array[:alive].max()
+        stale = 0
+        positions = range(1,self.sensor_range)
+
+        for i in range(generations):
+            if self.telemetry is not None:
+                start = time.perf_counter()
+            # Keep the best genes at the front of the pool
+            best = np.argsort(score_array[:alive])[::-1][:elite]
+            n_elite = len(best)
+            gene_pool[:n_elite] = gene_pool[best]
+            score_array[:n_elite] = score_array[best]
+            if self.telemetry is not None:
+                self.telemetry.generation(time.perf_counter()-start,score_array[0],n_children)
+
+            # Genetic operation on all the pairs of parents at once
+            father = gene_pool[_randint(self.rng,n_elite,size=n_children//2)]
+            mother = gene_pool[_randint(self.rng,n_elite,size=n_children//2)]
+            child1 = father.copy()
+            child2 = mother.copy()
+            for k in positions:
+                # Cross over, only where the new cell is next to the previous cell of the child
+                cross = _random(self.rng,len(child1)) < cross_over
+                take1 = cross & np.all(np.abs(mother[:,k]-child1[:,k-1]) <= 1,axis=1)
+                take2 = cross & np.all(np.abs(father[:,k]-child2[:,k-1]) <= 1,axis=1)
+                child1[take1,k] = mother[take1,k]
+                child2[take2,k] = father[take2,k]
+                # Mutation, only where the shifted cell is still inside the room
+                mutate = _random(self.rng,len(child1)) < mutation
+                for child in (child1,child2):
+                    shift = mutate & (child[:,k,0]+1 < self.room.nx) & (child[:,k,1]-1 >= 0)
+                    child[shift,k] += (1,-1)
+
+            gene_pool[n_elite:n_elite+n_children:2] = child1
+            gene_pool[n_elite+1:n_elite+n_children:2] = child2
+            alive = n_elite + n_children
+            score_array[n_elite:alive] = self.evaluate_fitness_batch(gene_pool[n_elite:alive],**self.fitness_weights)
+
+            # Early stopping once the best score does not improve anymore
+            generation_best = score_array[:alive].max()
+            if generation_best > best_score:
+                best_score = generation_best
+                stale = 0
+            else:
+                stale += 1
+                if patience is not None and stale >= patience:
+                    break
+
+        best = np.argmax(score_array[:alive])
+        if self.warm_start:
+            self._survivors = gene_pool[np.argsort(score_array[:alive])[::-1][:elite]].copy()
+            self._moves_since_plan = 0
+        # If the best solution is to stay where the robot is
+        if score_array[best] == 0:
+            # Just randomly go somewhere else, otherwise we would get stuck in a region
+            return self.create_minipath()
+        return gene_pool[best].copy()
+
     def create_minipath(self):
         """
         Create one minipath based on the robot's current position.
         Return a list containing the coordinates to visit sequentially
         """
         path = []
-        current_x = self.current_x
-        current_y = self.current_y
+        cell = self.current_x*self.room.ny + self.current_y
         for i in range(self.sensor_range):
-            possible_tiles = []
-            for x in range(-1,2):
-                for y in range(-1,2):
-                    # We do not want to include the current position in the possible tiles
-                    if x!=0 or y!=0:
-                        # Check to ensure it's valid coordinate
-                        if ((current_x+x)<self.room.nx) and ((current_x+x)>=0) and \
-                        ((current_y+y)<self.room.ny) and ((current_y+y)>=0):
-                            # If the tile is not an obstacle
-                            if self.layout[current_x+x,current_y+y] != 2:
-                                possible_tiles.append([current_x+x,current_y+y])
+            possible_tiles = self.room.neighbors(cell)
             if len(possible_tiles) == 0:
-                print("No possible tile to move")
-                print(current_x,current_y)
-                time.sleep(100000)
-            next_tile = np.random.choice(len(possible_tiles))
-            path.append(possible_tiles[next_tile])
-            current_x = possible_tiles[next_tile][0]
-            current_y = possible_tiles[next_tile][1]
+                raise RuntimeError("No possible tile to move from {0}".format(divmod(cell,self.room.ny)))
+            cell = int(possible_tiles[_choice(self.rng,len(possible_tiles))])
+            path.append(list(divmod(cell,self.room.ny)))
         return path
 
+    def create_minipaths(self,n):
+        """
+        Create n minipaths based on the robot's current position, all at once.
+        Return an integer array of shape (n, sensor_range, 2)
+        """
+        paths = np.zeros((n,self.sensor_range,2),dtype=int)
+        cells = np.full(n,self.current_x*self.room.ny + self.current_y)
+        for i in range(self.sensor_range):
+            cells = self._random_neighbors(cells)
+            paths[:,i,0],paths[:,i,1] = np.divmod(cells,self.room.ny)
+        return paths
+
+    def _random_neighbors(self,cells):
+        """
+        Draw one random free neighbor for each cell of an array of cell numbers x*ny+y
+        """
+        return self.room.random_neighbors(cells,_random(self.rng,len(cells)))
+
+    def _warm_genes(self):
+        """
+        Shift the survivors of the previous plan by the number of cells moved since then.
+        Only the survivors that went through the robot's current position are kept, they are
+        completed with random cells to get back to sensor_range cells.
+        Return an integer array of shape (n, sensor_range, 2)
+        """
+        moved = self._moves_since_plan
+        if self._survivors is None or moved == 0 or moved >= self.sensor_range:
+            return np.zeros((0,self.sensor_range,2),dtype=int)
+        genes = self._survivors[np.all(self._survivors[:,moved-1] == (self.current_x,self.current_y),axis=1)]
+        genes = np.concatenate((genes[:,moved:],np.zeros((len(genes),moved,2),dtype=int)),axis=1)
+        cells = genes[:,-moved-1,0]*self.room.ny + genes[:,-moved-1,1]
+        for i in range(self.sensor_range-moved,self.sensor_range):
+            cells = self._random_neighbors(cells)
+            genes[:,i,0],genes[:,i,1] = np.divmod(cells,self.room.ny)
+        return genes
+
     def evaluate_fitness(self,minipath,A=-30,B=50,C=-12,D=-1):
         """
         Input:
@@ -257,44 +1322,81 @@ class Roomba(object):
         Return:
         Fitness score based on the fitness function: A*dist_minipath + B*free_cell + C*dist_x + D*repeated_cell
         """
-        dist = 0
-        uncleaned_cells = 0
-        #delta_dist: the distance on the x-axis between the current robot position and the unclean cell position
-        delta_dist = 0
-        current_x = self.current_x
-        current_y = self.current_y
-        pass_through = []
-        repeat = 0
-        for index,cell in enumerate(minipath):
-            # Evaluate the distance of the minipath
-            x = minipath[index][0]
-            y = minipath[index][1]
-            if abs(x-current_x) > 1 or abs(y-current_y) > 1:
-                dist += float('inf')
-            elif self.layout[x,y] == 2:
-                dist += float('inf')
-            else:
-                # Euclidean distance
-                dist += math.sqrt(((current_x-x))**2 + ((current_y-y))**2)
+        return self.evaluate_fitness_batch([minipath],A,B,C,D)[0]
+
+    def evaluate_fitness_batch(self,paths,A=-30,B=50,C=-12,D=-1):
+        """
+        Evaluate the fitness score of a whole population of minipaths at once
+        Input:
+        paths: an integer array of shape (population, sensor_range, 2), one minipath per row
+
+        Return:
+        An array with the fitness score of every minipath, using the same formula as evaluate_fitness
+        """
+        if self.fitness_cache is None or len(paths) == 0:
+            return self._score_paths(paths,A,B,C,D)
+        paths = np.ascontiguousarray(paths,dtype=np.int64).reshape(len(paths),-1)
+        cache = self.fitness_cache
+        cache.sync((self.version,self.current_x,self.current_y,A,B,C,D))
+        # The bytes of every minipath, all made at once from a view with one void item per row
+        keys = paths.view(np.dtype((np.void,paths.shape[1]*paths.itemsize))).ravel().tolist()
+        cached = cache.get_many(keys)
+        # A miss is a None from the cache, not a NaN score, which can be a cached score too
+        missing = np.flatnonzero(np.equal(np.array(cached,dtype=object),None))
+        scores = np.array(cached,dtype=float)
+        if len(missing) > 0:
+            scores[missing] = self._score_paths(paths[missing].reshape(len(missing),-1,2),A,B,C,D)
+            cache.put_many([keys[i] for i in missing],scores[missing].tolist())
+        return scores
 
-            # Evaluate the number of unvisited cells
-            if self.layout[x,y] == 0 and (x,y) not in pass_through:
-                uncleaned_cells += 1
-                # Evaluate delta_dist
-                delta_dist += y - current_y
-            current_x = x
-            current_y = y
-            pass_through.append((x,y))
+    def _score_paths(self,paths,A,B,C,D):
+        """
+        Compute the fitness scores of evaluate_fitness_batch, without the cache
+        """
+        if len(paths) == 0:
+            return np.zeros(0)
+        paths = np.asarray(paths,dtype=int)
+        xs = paths[:,:,0]
+        ys = paths[:,:,1]
+        # The cell each gene cell is reached from, starting at the robot's position
+        prev_x = np.empty_like(xs)
+        prev_y = np.empty_like(ys)
+        prev_x[:,0] = self.current_x
+        prev_y[:,0] = self.current_y
+        prev_x[:,1:] = xs[:,:-1]
+        prev_y[:,1:] = ys[:,:-1]
+        dx = xs - prev_x
+        dy = ys - prev_y
+        states = self.layout[xs,ys]
+
+        # Evaluate the distance of the minipaths, jumps and obstacles cost an infinite distance
+        step_dist = np.sqrt((dx**2 + dy**2).astype(float))
+        step_dist[(np.abs(dx) > 1) | (np.abs(dy) > 1) | (states == 2)] = float('inf')
+        # Add up in path order so the total is the same as adding cell by cell
+        dist = np.zeros(len(paths))
+        for k in range(paths.shape[1]):
+            dist += step_dist[:,k]
+
+        # Evaluate the number of unvisited cells, a cell only counts the first time it appears in a path
+        cells = xs*self.layout.shape[1] + ys
+        seen = np.zeros(xs.shape,dtype=bool)
+        for k in range(1,paths.shape[1]):
+            seen[:,k] = np.any(cells[:,:k] == cells[:,k:k+1],axis=1)
+        new_cells = (states == 0) & ~seen
+        uncleaned_cells = new_cells.sum(axis=1)
+        #delta_dist: the distance on the x-axis between the current robot position and the unclean cell position
+        delta_dist = np.where(new_cells,dy,0).sum(axis=1)
 
-            repeat += self.pass_through.count((x,y))
+        # Evaluate how many times the robot has already been on each cell
+        repeat = self.visits[xs,ys].sum(axis=1,dtype=np.int64)
 
         return (A*dist + B*uncleaned_cells + C*delta_dist + D*repeat)
 
     def check_clean(self):
         """
-        Check if the entire floor is clean. Return a boolean
+        Check if the entire floor the robot can reach is clean. Return a boolean
         """
-        return not(np.any(self.layout==0))
+        return self.cell_count[0] - self.unreachable == 0
 
     def move_to(self,x,y):
         """
@@ -304,15 +1406,54 @@ class Roomba(object):
         """
         # Euclidean distance
         self.dist_travelled += math.sqrt(((self.current_x-x))**2 + ((self.current_y-y))**2)
-        if (x,y) in self.pass_through:
+        if self.visits[x,y] > 0:
             self.repeated_cell += 1
-        self.layout[x,y] = 1
+        self.set_cell(x,y,1)
         self.current_x = x
         self.current_y = y
-        self.pass_through.append((x,y))
+        self._moves_since_plan += 1
+        # The visits are shared by the whole team
+        for robot in self.team:
+            robot.version += 1
+        if self.visits[x,y] < self._max_visits:
+            self.visits[x,y] += 1
+        if self.trajectory is not None:
+            self.trajectory.append((x,y))
 
     def calculate_coverage(self):
         """
-        Return: The coverage percentage so far
+        Return: The coverage percentage so far, of the cells the robot can reach
+        """
+        return (self.cell_count[1] / (self.cell_count[0] - self.unreachable + self.cell_count[1]))*100
+
+    def set_cell(self,x,y,value):
+        """
+        Change the state of one cell of the layout and update the cell counters
+        Input:
+        x,y: coordinate of the cell
+        value: new number code of the cell (0 - uncleaned, 1 - cleaned, 2 - obstacle)
+        """
+        old = int(self.layout[x,y])
+        if old != value:
+            self.cell_count[old] -= 1
+            self.cell_count[value] += 1
+            self.layout[x,y] = value
+            self.version += 1
+            for robot in self.team:
+                if robot is not self:
+                    robot.version += 1
+                if robot._unreachable is not None and self.room.components[x,y] != robot._component:
+                    robot._unreachable += int(value == 0) - int(old == 0)
+                if robot.distance is not None:
+                    robot._field_changes.append(x*self.room.ny + y)
+        if self.debug:
+            self.check_counters()
+
+    def check_counters(self):
+        """
+        Recount the cells of the layout and raise a RuntimeError if cell_count does not match
         """
-        return ((self.layout==1).sum() / ( (self.layout==0).sum() + (self.layout==1).sum() ))*100
+        layout = np.asarray(self.layout)
+        recount = [int((layout==code).sum()) for code in range(3)]
+        if recount != self.cell_count:
+            raise RuntimeError("Cell counters out of sync: tracked {0}, recounted {1}".format(self.cell_count,recount))
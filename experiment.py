@@ -0,0 +1,303 @@
+"""
+Monte Carlo experiment runner.
+
+Every trial creates one room, or loads it from a scenario file (see scenarios.py), and
+runs each strategy on its own robot in that room. A trial draws all its random numbers
+(obstacles, starting points, strategies) from its own numpy Generator, spawned from a
+single SeedSequence, so the results only depend on the seed and not on how the trials
+are split between worker processes.
+
+Methods:
+
+single_step(r,strategy): Move the robot r by one cell using the given strategy and
+return the coverage percentage
+run_trial(seed_seq,room_index,steps,strategies,room_args,sensor_range,robot_args,scenario,stop_when_clean,log_dir):
+Run one room for every strategy and return the coverage trace, repeated cells, distance travelled,
+compute time and number of cells covered, optionally logging the trajectories
+run_experiment(trials,steps,strategies,seed,workers,room_args,sensor_range,robot_args,scenario):
+Run many trials over a process pool and aggregate the results per strategy
+run_campaign(path,trials,chunk,...): Run many trials like run_experiment but stream the results to
+a ResultStore, resuming from its checkpoint if the campaign was interrupted
+run_summary(trials,batch,...): Run many trials like run_experiment but only keep constant-memory
+StrategySummary statistics, merged over the worker processes
+run_adaptive(half_width,confidence,...): Run trials for every strategy until the confidence intervals
+of its coverage, repeated cells and distance means are narrower than half_width
+"""
+from classes import SetUp, Roomba
+from results_store import ResultStore
+from streaming_stats import StrategySummary
+from trajectory_log import TrajectoryLog
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import json
+import os
+import time
+
+STRATEGIES = ['random_walk','genetic_algorithm','greedy_algorithm']
+
+
+def single_step(r,strategy):
+    r.advance(strategy)
+    return r.calculate_coverage()
+
+def run_trial(seed_seq,room_index=None,steps=100,strategies=STRATEGIES,room_args=None,sensor_range=1,robot_args=None,
+              scenario=None,stop_when_clean=False,log_dir=None):
+    """
+    Run one trial: create a room and move one robot per strategy for the given number of steps
+    Input:
+    seed_seq: the np.random.SeedSequence of this trial
+    room_index: index of the room in the scenario file
+    steps: number of steps per robot
+    strategies: list of strategies to run
+    room_args: dictionary of keyword arguments for SetUp (only compact when the room comes from a scenario file)
+    sensor_range: sensor range of the robots
+    robot_args: dictionary of other keyword arguments for Roomba, e.g. ga_engine, warm_start or commit
+    scenario: path of a scenario file to load the room from, None to create a random room
+    stop_when_clean: if True, a robot stops moving as soon as its room is clean, its coverage stays at 100
+    for the remaining steps
+    log_dir: directory to write the trajectory log of every robot to, as <strategy>/trial_<room_index>.trj
+    (see trajectory_log.py), None to not log the trajectories
+    Return:
+    A dictionary mapping each strategy to a dictionary with the coverage per step ('coverage'), the
+    repeated cells ('repeat'), the distance travelled ('dist'), the seconds spent stepping the robot
+    ('time'), the number of cells it cleaned ('cells'), the number of steps it moved ('steps') and the
+    fitness cache hits and misses ('cache_hits', 'cache_misses', both 0 when the robot has no fitness cache)
+    """
+    rng = np.random.default_rng(seed_seq)
+    if scenario is not None:
+        room = SetUp.from_scenario(scenario,room_index,**(room_args or {}))
+    else:
+        room = SetUp(**(room_args or {}))
+        room.create_obstacle(rng=rng)
+    robots = [Roomba(room,sensor_range=sensor_range,rng=rng,**(robot_args or {})) for strategy in strategies]
+    logs = []
+    if log_dir is not None:
+        for r,strategy in zip(robots,strategies):
+            os.makedirs(os.path.join(log_dir,strategy),exist_ok=True)
+            path = os.path.join(log_dir,strategy,'trial_{0}.trj'.format(room_index))
+            meta = {'strategy': strategy,'spawn_key': list(seed_seq.spawn_key),'scenario': scenario,
+                    'room_args': room_args,'sensor_range': sensor_range,'robot_args': robot_args}
+            logs.append(TrajectoryLog(path,seed=seed_seq.entropy,room_id=room_index,meta=meta).attach(r))
+    coverage = [[] for strategy in strategies]
+    seconds = [0.0 for strategy in strategies]
+    moved = [0 for strategy in strategies]
+    for i in range(steps):
+        for j,(r,strategy) in enumerate(zip(robots,strategies)):
+            if stop_when_clean and r.check_clean():
+                coverage[j].append(r.calculate_coverage())
+                continue
+            moved[j] += 1
+            start = time.perf_counter()
+            coverage[j].append(single_step(r,strategy))
+            seconds[j] += time.perf_counter() - start
+    for log in logs:
+        log.detach()
+    outcome = {}
+    for j,(r,strategy) in enumerate(zip(robots,strategies)):
+        cache = r.fitness_cache
+        outcome[strategy] = {'coverage': coverage[j],'repeat': r.repeated_cell,'dist': r.dist_travelled,
+                             'time': seconds[j],'cells': r.cell_count[1],'steps': moved[j],
+                             'cache_hits': cache.hits if cache else 0,'cache_misses': cache.misses if cache else 0}
+    return outcome
+
+def run_experiment(trials=100,steps=100,strategies=STRATEGIES,seed=None,workers=None,room_args=None,sensor_range=1,
+                   robot_args=None,scenario=None,stop_when_clean=False,log_dir=None):
+    """
+    Run many trials in parallel and gather the statistics
+    Input:
+    trials: number of rooms to simulate
+    steps: number of steps per robot
+    strategies: list of strategies to compare
+    seed: seed of the experiment, the same seed always gives the same results
+    workers: number of worker processes, None for one per core and 1 to run in this process
+    room_args: dictionary of keyword arguments for SetUp
+    sensor_range: sensor range of the robots
+    robot_args: dictionary of other keyword arguments for Roomba
+    scenario: path of a scenario file, trial i then runs in room i of the file instead of a random room
+    stop_when_clean: if True, every robot stops as soon as its room is clean
+    log_dir: directory to write the trajectory log of every robot to, None to not log them (see run_trial)
+    Return:
+    A dictionary mapping each strategy to a dictionary with the arrays 'coverage' (trials x steps),
+    'repeat', 'dist', 'time', 'cells', 'steps', 'time_per_cell', 'cache_hits' and 'cache_misses' (one value
+    per trial), in trial order.
+    Only the timings depend on the worker count.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(trials)
+    trial = partial(run_trial,steps=steps,strategies=strategies,room_args=room_args,sensor_range=sensor_range,
+                    robot_args=robot_args,scenario=scenario,stop_when_clean=stop_when_clean,log_dir=log_dir)
+    if workers == 1:
+        outcomes = list(map(trial,seeds,range(trials)))
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            outcomes = list(pool.map(trial,seeds,range(trials)))
+
+    results = {}
+    for strategy in strategies:
+        results[strategy] = {key: np.array([outcome[strategy][key] for outcome in outcomes])
+                             for key in outcomes[0][strategy]}
+        results[strategy]['time_per_cell'] = results[strategy]['time'] / results[strategy]['cells']
+    return results
+
+def run_campaign(path,trials=100,steps=100,strategies=STRATEGIES,seed=None,workers=None,room_args=None,sensor_range=1,
+                 robot_args=None,scenario=None,stop_when_clean=False,chunk=50,log_dir=None):
+    """
+    Run many trials and stream their results to a ResultStore instead of keeping them in memory.
+    The results are appended every chunk trials. If the store already holds a checkpoint of the
+    same campaign, the trials finished before it are skipped, so an interrupted campaign is resumed
+    by calling run_campaign again with the same arguments. The trials have the same seeds as in
+    run_experiment, the stored results are the same as the ones it returns.
+    Input:
+    path: directory of the store
+    seed: seed of the campaign, None to draw a new one or to reuse the one of the stored campaign
+    chunk: number of trials between two checkpoints
+    log_dir: directory to write the trajectory log of every robot to, not part of the campaign settings
+    Other arguments as for run_experiment
+    Return: the ResultStore, see ResultStore.results to read it
+    """
+    store = ResultStore(path)
+    if seed is None:
+        # The seed is stored so that a resumed campaign draws the same rooms
+        seed = store.config['seed'] if store.exists() else np.random.SeedSequence().entropy
+    config = {'steps': steps,'strategies': list(strategies),'seed': seed,'room_args': room_args,
+              'sensor_range': sensor_range,'robot_args': robot_args,'scenario': scenario,
+              'stop_when_clean': stop_when_clean}
+    if not store.exists():
+        store.create(config)
+    elif store.config != _json_roundtrip(config):
+        raise ValueError("{0} holds a different campaign: {1}".format(path,store.config))
+
+    seeds = np.random.SeedSequence(seed).spawn(trials)
+    trial = partial(run_trial,steps=steps,strategies=strategies,room_args=room_args,sensor_range=sensor_range,
+                    robot_args=robot_args,scenario=scenario,stop_when_clean=stop_when_clean,log_dir=log_dir)
+    pool = ProcessPoolExecutor(workers) if workers != 1 else None
+    try:
+        for start in range(store.trials,trials,chunk):
+            indices = range(start,min(start+chunk,trials))
+            chunk_seeds = [seeds[i] for i in indices]
+            if pool is None:
+                outcomes = list(map(trial,chunk_seeds,indices))
+            else:
+                outcomes = list(pool.map(trial,chunk_seeds,indices))
+            store.append(outcomes)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return store
+
+def summarize_trials(seed_seqs,room_indices,steps=100,strategies=STRATEGIES,summary_args=None,**trial_args):
+    """
+    Run some trials one after the other and summarize them
+    Input:
+    seed_seqs, room_indices: the SeedSequence and room index of every trial
+    summary_args: dictionary of keyword arguments for StrategySummary, e.g. coverage_bins
+    Other keyword arguments are passed to run_trial
+    Return: a dictionary mapping each strategy to its StrategySummary
+    """
+    summaries = {strategy: StrategySummary(steps,**(summary_args or {})) for strategy in strategies}
+    for seed_seq,room_index in zip(seed_seqs,room_indices):
+        outcome = run_trial(seed_seq,room_index,steps=steps,strategies=strategies,**trial_args)
+        for strategy in strategies:
+            summaries[strategy].update(outcome[strategy])
+    return summaries
+
+def run_summary(trials=100,steps=100,strategies=STRATEGIES,seed=None,workers=None,room_args=None,sensor_range=1,
+                robot_args=None,scenario=None,stop_when_clean=False,batch=100,summary_args=None):
+    """
+    Run many trials and keep only their StrategySummary statistics, whose memory does not grow with
+    the number of trials. Every batch of trials is summarized by a worker and the summaries are merged
+    in trial order. The trials have the same seeds as in run_experiment.
+    Input:
+    batch: number of trials summarized by one worker task
+    summary_args: dictionary of keyword arguments for StrategySummary
+    Other arguments as for run_experiment
+    Return: a dictionary mapping each strategy to its StrategySummary
+    """
+    seeds = np.random.SeedSequence(seed).spawn(trials)
+    task = partial(summarize_trials,steps=steps,strategies=strategies,summary_args=summary_args,room_args=room_args,
+                   sensor_range=sensor_range,robot_args=robot_args,scenario=scenario,stop_when_clean=stop_when_clean)
+    starts = range(0,trials,batch)
+    seed_batches = [seeds[start:start+batch] for start in starts]
+    index_batches = [range(start,min(start+batch,trials)) for start in starts]
+    summaries = {strategy: StrategySummary(steps,**(summary_args or {})) for strategy in strategies}
+    pool = ProcessPoolExecutor(workers) if workers != 1 else None
+    try:
+        for part in (pool.map if pool is not None else map)(task,seed_batches,index_batches):
+            for strategy in strategies:
+                summaries[strategy].merge(part[strategy])
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return summaries
+
+def _run_strategy_trial(seed_seq,room_index,strategy,**trial_args):
+    return run_trial(seed_seq,room_index,strategies=[strategy],**trial_args)[strategy]
+
+def _trials_needed(summary,half_width,confidence,min_trials):
+    """
+    Return the number of trials a strategy still needs for all its confidence intervals to be narrower than
+    half_width, estimated from the current variances
+    """
+    if summary.count < min_trials:
+        return min_trials - summary.count
+    needed = 0
+    for key,stats in (('coverage',summary.coverage),('repeat',summary.repeat.stats),('dist',summary.dist.stats)):
+        # The half-width shrinks as one over the square root of the number of trials
+        ratio = np.max(stats.half_width(confidence)) / half_width[key]
+        needed = max(needed,int(np.ceil(summary.count*ratio**2)))
+    return max(needed - summary.count,0)
+
+def run_adaptive(half_width=1.0,confidence=0.95,min_trials=10,max_trials=10000,batch=10,steps=100,
+                 strategies=STRATEGIES,seed=None,workers=None,room_args=None,sensor_range=1,robot_args=None,
+                 scenario=None,stop_when_clean=True,summary_args=None):
+    """
+    Run trials until the estimates of every strategy converge (sequential stopping).
+    Every strategy gets its own trials, trial i being in room i for all of them. A strategy stops getting
+    new trials once the confidence intervals of its mean coverage at every step, mean repeated cells and
+    mean distance travelled are all narrower than half_width, or after max_trials trials. Each round gives
+    every strategy the number of trials its current variance says it still needs, at most batch, so the
+    strategies with a small variance finish early and the noisy ones get the compute.
+    Input:
+    half_width: target half-width of the confidence intervals, one value for all the metrics or a dictionary
+    with the keys 'coverage' (percentage points), 'repeat' (cells) and 'dist'
+    confidence: confidence level of the intervals
+    min_trials: number of trials of every strategy before its variance is trusted
+    max_trials: maximum number of trials of every strategy
+    batch: maximum number of trials added to one strategy in one round
+    Other arguments as for run_summary, but robots stop as soon as their room is clean by default
+    Return: a dictionary mapping each strategy to its StrategySummary, whose count is its number of trials
+    """
+    if not isinstance(half_width,dict):
+        half_width = {'coverage': half_width,'repeat': half_width,'dist': half_width}
+    root = np.random.SeedSequence(seed)
+    task = partial(_run_strategy_trial,steps=steps,room_args=room_args,sensor_range=sensor_range,
+                   robot_args=robot_args,scenario=scenario,stop_when_clean=stop_when_clean)
+    summaries = {strategy: StrategySummary(steps,**(summary_args or {})) for strategy in strategies}
+    pool = ProcessPoolExecutor(workers) if workers != 1 else None
+    try:
+        while True:
+            scheduled = []
+            for strategy in strategies:
+                count = summaries[strategy].count
+                todo = min(_trials_needed(summaries[strategy],half_width,confidence,min_trials),batch,
+                           max_trials - count)
+                scheduled.extend((strategy,i) for i in range(count,count+todo))
+            if not scheduled:
+                break
+            # Child i of the root, the same SeedSequence as np.random.SeedSequence(seed).spawn(...)[i]
+            seeds = [np.random.SeedSequence(root.entropy,spawn_key=root.spawn_key+(i,),pool_size=root.pool_size)
+                     for strategy,i in scheduled]
+            indices = [i for strategy,i in scheduled]
+            names = [strategy for strategy,i in scheduled]
+            for strategy,outcome in zip(names,(pool.map if pool is not None else map)(task,seeds,indices,names)):
+                summaries[strategy].update(outcome)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return summaries
+
+def _json_roundtrip(value):
+    """
+    Return value as it is read back from a JSON file (tuples become lists)
+    """
+    return json.loads(json.dumps(value))
@@ -0,0 +1,347 @@
+"""
+Fleet of robots cleaning the same room together.
+
+All the robots of a fleet share one layout, one visit map and one set of cell counters
+(see the share argument of Roomba), so every robot sees the cells cleaned by the others
+and a fleet of N robots needs one copy of the grid instead of N. The robots are stepped
+together, one tick at a time:
+
+1. planning: every robot without a plan runs its strategy on the state of the room at
+the start of the tick. Plans only read the shared state and every robot draws from its
+own random Generator, so they can be computed concurrently on a thread or process pool
+and the results do not depend on the pool.
+2. conflict resolution: the robots claim the first cell of their plan one after the other,
+in an order rotating by one robot every tick. A robot whose cell was already claimed, or
+is occupied by another robot, waits for this tick and plans again.
+3. moves: the robots move to the cells they claimed, in the same order.
+
+With executor='process', the room and the robots are sent to the planning processes once,
+when the pool starts (and again after an obstacle event changes the room). The layout, the
+visits and the distance fields of the robots are moved to shared memory blocks the processes
+read from, so every task only carries the position and the PLANNING_STATE of one robot.
+
+Example:
+fleet = Fleet(room,['greedy_algorithm']*4,seed=0,executor='thread')
+metrics = fleet.run(500)
+fleet.close()
+"""
+from classes import SetUp, Roomba
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from collections import deque
+import numpy as np
+import argparse
+import copy
+import time
+
+# Robot attributes changed by planning, sent to the planning processes with every task and sent back
+PLANNING_STATE = ('rng','fitness_cache','_field_changes','_survivors','_moves_since_plan')
+
+# The room, the robots and the shared memory blocks of the fleet in a planning process, set by _init_worker
+_worker = {}
+
+
+def _init_worker(room,robots,arrays):
+    """
+    Keep the room and the robots of the fleet in the planning process, with their layout, visits and
+    distance fields read from the shared memory blocks of the fleet
+    arrays: the name, shape and dtype of the shared memory block of every array
+    """
+    blocks = {key: shared_memory.SharedMemory(name=name) for key,(name,shape,dtype) in arrays.items()}
+    views = {key: np.ndarray(shape,dtype=dtype,buffer=blocks[key].buf) for key,(name,shape,dtype) in arrays.items()}
+    layout = robots[0].layout
+    if room.compact:
+        layout.cleaned = views['layout']
+        if layout.shared:
+            layout.base = room.layout
+    else:
+        layout = views['layout']
+    for robot in robots:
+        robot.layout = layout
+        robot.visits = views['visits']
+    _worker.update(room=room,robots=robots,blocks=blocks,views=views)
+
+def _plan_remote(i,strategy,position,version,field,state):
+    """
+    Plan the next cells of robot i of the fleet in a planning process
+    Input: the position and version of the robot, whether its distance field is built (the field itself is in
+    shared memory) and the values of its PLANNING_STATE attributes
+    Return: the plan, whether the distance field is built and the new values of the PLANNING_STATE attributes
+    """
+    robot = _worker['robots'][i]
+    shared = _worker['views'].get(('distance',i))
+    robot.current_x,robot.current_y = position
+    robot.version = version
+    robot.distance = shared if field else None
+    for key,value in state.items():
+        setattr(robot,key,value)
+    plan = robot.step(strategy)
+    if robot.distance is not None and robot.distance is not shared:
+        # Built from scratch by the strategy, the shared field is updated in place otherwise
+        shared[:] = robot.distance
+        robot.distance = shared
+    return plan,robot.distance is not None,{key: getattr(robot,key) for key in PLANNING_STATE}
+
+
+class Fleet(object):
+
+    """
+    Several robots sharing one room and one cleaned/visit state
+
+    Input: The room, created by SetUp, and the strategy of every robot
+
+    Attributes:
+
+    room: The room
+    robots: The robots, the first one owns the shared layout, visits and cell_count
+    strategies: The strategy of every robot
+    tick: Number of ticks run so far
+    conflicts: Number of ticks each robot had to wait because its cell was taken
+    moves: Number of cells each robot moved
+    planning_time: Total seconds spent planning
+
+    Methods:
+
+    step(self): Run one tick and return the coverage of the fleet
+    run(self,ticks,stop_when_clean): Run ticks until the room is clean and return the fleet metrics
+    calculate_coverage(self): Return the percentage of the cells the fleet can reach that are cleaned
+    check_clean(self): Check if every cell the fleet can reach is cleaned
+    close(self): Shut the planning pool down
+    """
+
+    def __init__(self,room,strategies,seed=None,sensor_range=1,executor=None,workers=None,robot_args=None):
+        """
+        strategies: list with the strategy of every robot, e.g. ['greedy_algorithm']*4
+        seed: seed or SeedSequence of the fleet, every robot gets its own Generator spawned from it
+        executor: None to plan in this thread, 'thread' or 'process' to plan concurrently on a pool
+        workers: number of threads or processes of the pool
+        robot_args: dictionary of other keyword arguments for Roomba
+        """
+        self.room = room
+        self.strategies = list(strategies)
+        if not isinstance(seed,np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        rngs = [np.random.default_rng(child) for child in seed.spawn(len(self.strategies))]
+        self.robots = []
+        for rng in rngs:
+            share = self.robots[0] if self.robots else None
+            self.robots.append(Roomba(room,sensor_range=sensor_range,rng=rng,share=share,**(robot_args or {})))
+        self.tick = 0
+        self.conflicts = [0 for robot in self.robots]
+        self.moves = [0 for robot in self.robots]
+        self.planning_time = 0.0
+        self.executor = executor
+        self._workers = workers
+        self._pool = ThreadPoolExecutor(workers) if executor == 'thread' else None
+        # Shared memory blocks and the arrays over them, and the room version the planning processes have
+        self._blocks = {}
+        self._arrays = {}
+        self._pool_version = None
+        if executor == 'process':
+            self._share_arrays()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._blocks:
+            # The robots get private copies of the shared arrays back
+            self._set_arrays({key: np.array(array) for key,array in self._arrays.items()})
+            for block in self._blocks.values():
+                block.close()
+                block.unlink()
+            self._blocks = {}
+
+    def _share_arrays(self):
+        """
+        Move the layout, the visits and the distance fields of the frontier robots to shared memory blocks,
+        read by the planning processes without being sent to them
+        """
+        owner = self.robots[0]
+        arrays = {'layout': owner.layout.cleaned if self.room.compact else owner.layout,'visits': owner.visits}
+        for i,strategy in enumerate(self.strategies):
+            if strategy == 'frontier':
+                arrays['distance',i] = np.zeros(self.room.nx*self.room.ny,dtype=np.int32)
+        views = {}
+        for key,array in arrays.items():
+            self._blocks[key] = shared_memory.SharedMemory(create=True,size=max(array.nbytes,1))
+            views[key] = np.ndarray(array.shape,dtype=array.dtype,buffer=self._blocks[key].buf)
+            views[key][...] = array
+        self._set_arrays(views)
+
+    def _set_arrays(self,arrays):
+        """
+        Give the robots the layout (the cleaned bitset in a compact room), visits and distance field arrays
+        """
+        for i,robot in enumerate(self.robots):
+            if self.room.compact:
+                robot.layout.cleaned = arrays['layout']
+            else:
+                robot.layout = arrays['layout']
+            robot.visits = arrays['visits']
+            if robot.distance is not None:
+                robot.distance = arrays['distance',i]
+        self._arrays = arrays
+
+    def _start_pool(self):
+        """
+        Start the planning processes, sending them the room and the robots without their shared arrays
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+        layout = None
+        if self.room.compact:
+            layout = copy.copy(self.robots[0].layout)
+            layout.cleaned = None
+            if layout.shared:
+                layout.base = None
+        robots = []
+        for robot in self.robots:
+            robot = copy.copy(robot)
+            robot.layout = layout
+            robot.visits = None
+            robot.distance = None
+            robot.cell_count = None
+            robot.plan = deque()
+            robot.trajectory = None
+            for key in PLANNING_STATE:
+                setattr(robot,key,None)
+            robots.append(robot)
+        arrays = {key: (block.name,self._arrays[key].shape,self._arrays[key].dtype.str)
+                  for key,block in self._blocks.items()}
+        self._pool = ProcessPoolExecutor(self._workers,initializer=_init_worker,initargs=(self.room,robots,arrays))
+        self._pool_version = self.room.version
+
+    def _plan(self):
+        """
+        Give a plan to every robot that has none left
+        """
+        start = time.perf_counter()
+        needing = [i for i,robot in enumerate(self.robots) if not robot.plan]
+        if self.executor is None:
+            plans = [self.robots[i].step(self.strategies[i]) for i in needing]
+        elif self.executor == 'thread':
+            plans = list(self._pool.map(lambda i: self.robots[i].step(self.strategies[i]),needing))
+        else:
+            if self._pool_version != self.room.version:
+                # First tick, or the room changed since the processes got it
+                self._start_pool()
+            robots = [self.robots[i] for i in needing]
+            results = self._pool.map(_plan_remote,needing,[self.strategies[i] for i in needing],
+                                     [(robot.current_x,robot.current_y) for robot in robots],
+                                     [robot.version for robot in robots],
+                                     [robot.distance is not None for robot in robots],
+                                     [{key: getattr(robot,key) for key in PLANNING_STATE} for robot in robots])
+            plans = []
+            for i,(plan,field,state) in zip(needing,results):
+                robot = self.robots[i]
+                robot.distance = self._arrays['distance',i] if field else None
+                for key,value in state.items():
+                    setattr(robot,key,value)
+                plans.append(plan)
+        for i,plan in zip(needing,plans):
+            robot = self.robots[i]
+            robot.plan.extend((int(x),int(y)) for x,y in plan[:robot.commit])
+        self.planning_time += time.perf_counter() - start
+
+    def step(self):
+        """
+        Run one tick: plan, resolve the conflicts and move every robot by at most one cell
+        Return: the coverage percentage of the fleet after the tick
+        """
+        self._plan()
+        n = len(self.robots)
+        occupied = {(robot.current_x,robot.current_y) for robot in self.robots}
+        claimed = set()
+        for k in range(n):
+            i = (self.tick + k) % n
+            robot = self.robots[i]
+            target = robot.plan[0]
+            if target == (robot.current_x,robot.current_y):
+                # Nothing left to do for this robot
+                robot.plan.popleft()
+            elif target in claimed or target in occupied:
+                self.conflicts[i] += 1
+                robot.plan.clear()
+            else:
+                robot.plan.popleft()
+                robot.move_to(*target)
+                self.moves[i] += 1
+                claimed.add(target)
+        self.tick += 1
+        return self.calculate_coverage()
+
+    def _unreachable(self):
+        """
+        Number of uncleaned cells no robot of the fleet can reach
+        """
+        components = {robot.component for robot in self.robots}
+        if len(components) == 1:
+            return self.robots[0].unreachable
+        labels = self.room.components
+        return int(np.count_nonzero((np.asarray(self.robots[0].layout) == 0) & ~np.isin(labels,list(components))))
+
+    def calculate_coverage(self):
+        cell_count = self.robots[0].cell_count
+        return (cell_count[1] / (cell_count[0] - self._unreachable() + cell_count[1]))*100
+
+    def check_clean(self):
+        return self.robots[0].cell_count[0] - self._unreachable() == 0
+
+    def run(self,ticks=1000,stop_when_clean=True):
+        """
+        Run the fleet for the given number of ticks, or until every reachable cell is clean
+        Return:
+        A dictionary with the coverage after every tick ('coverage'), the number of ticks needed to clean
+        the whole room ('time_to_clean', None if it was not reached), and per robot the repeated cells
+        ('repeat'), distance travelled ('dist'), cells moved ('moves') and ticks spent waiting ('conflicts'),
+        plus the seconds spent planning ('planning_time')
+        """
+        coverage = []
+        time_to_clean = self.tick if self.check_clean() else None
+        for i in range(ticks):
+            if stop_when_clean and time_to_clean is not None:
+                break
+            coverage.append(self.step())
+            if time_to_clean is None and self.check_clean():
+                time_to_clean = self.tick
+        return {'coverage': np.array(coverage),'time_to_clean': time_to_clean,
+                'repeat': np.array([robot.repeated_cell for robot in self.robots]),
+                'dist': np.array([robot.dist_travelled for robot in self.robots]),
+                'moves': np.array(self.moves),'conflicts': np.array(self.conflicts),
+                'planning_time': self.planning_time}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Clean one room with a fleet of robots")
+    parser.add_argument('--robots',type=int,default=4,help="number of robots")
+    parser.add_argument('--strategy',default='greedy_algorithm',help="strategy of the robots")
+    parser.add_argument('--size',type=int,default=30,help="room size (square room)")
+    parser.add_argument('--obstacles',type=int,default=10,help="number of obstacles")
+    parser.add_argument('--ticks',type=int,default=2000,help="maximum number of ticks")
+    parser.add_argument('--seed',type=int,default=None,help="seed of the room and the fleet")
+    parser.add_argument('--executor',choices=['thread','process'],default=None,help="pool used to plan concurrently")
+    parser.add_argument('--workers',type=int,default=None,help="number of threads or processes")
+    parser.add_argument('--ga-engine',choices=['loop','array'],default='array',help="genetic algorithm implementation")
+    args = parser.parse_args()
+
+    room_seed,fleet_seed = np.random.SeedSequence(args.seed).spawn(2)
+    room = SetUp(nx=args.size,ny=args.size,num_obstacle=args.obstacles)
+    room.create_obstacle(rng=np.random.default_rng(room_seed))
+    with Fleet(room,[args.strategy]*args.robots,seed=fleet_seed,executor=args.executor,workers=args.workers,
+               robot_args={'ga_engine': args.ga_engine}) as fleet:
+        metrics = fleet.run(args.ticks)
+    if metrics['time_to_clean'] is None:
+        print("Coverage after {0} ticks: {1:.1f}%".format(args.ticks,metrics['coverage'][-1]))
+    else:
+        print("Room cleaned in {0} ticks".format(metrics['time_to_clean']))
+    for i in range(args.robots):
+        print("robot {0}: {1} moves, {2} repeated cells, distance {3:.1f}, {4} conflicts".format(
+            i,metrics['moves'][i],metrics['repeat'][i],metrics['dist'][i],metrics['conflicts'][i]))
+    print("{0:.3g} s planning".format(metrics['planning_time']))
@@ -0,0 +1,206 @@
+"""
+Vectorized random walk engine.
+
+Runs the random walk strategy for many independent rooms at once. The N room layouts
+are stored as one (N, nx, ny) array and the N robot positions as arrays, so one step
+of every robot is a single neighbor-mask-and-sample operation instead of N calls to
+Roomba.random_step. Every robot follows the same rules as Roomba: it starts at the
+corner if it is free and has a free neighbor (otherwise on a random free cell with a free
+neighbor), picks uniformly among the legal RANDOM_WALK_MOVES and keeps track of coverage, repeated cells and distance. Like
+for Roomba, the cells that cannot be reached from the starting point are left out of the
+coverage.
+
+run_random_walk(trials,steps,seed,room_args) returns the statistics in the same format
+as one strategy of experiment.run_experiment.
+"""
+from classes import SetUp, RANDOM_WALK_MOVES, NEIGHBOR_MOVES
+import numpy as np
+
+
+class RandomWalkBatch(object):
+
+    """
+    A batch of random walk robots, one per room
+
+    Input: An array of room layouts of shape (N, nx, ny), with the SetUp number code
+
+    Attributes:
+
+    layout: The (N, nx, ny) layouts of the rooms, updated as the robots clean them
+    nx, ny: The size of the rooms
+    current_x, current_y: The positions of the N robots
+    visits: Number of times each robot has been on each cell of its room
+    cell_count: Number of uncleaned, cleaned and obstacle cells in each room, shape (N, 3)
+    dist_travelled: Total distance travelled by each robot
+    repeated_cell: Total number of repeated cells of each robot
+    stuck: True for the robots that have no legal move left
+    unreachable: Number of uncleaned cells each robot cannot reach from its starting point
+    rng: The numpy Generator used for the starting points and the moves
+
+    Methods:
+
+    from_rooms(cls,n,rng,**room_args): Create n random rooms with SetUp and a batch for them
+    step(self): Move every robot by one cell
+    run(self,steps): Run the given number of steps and return the coverage of every trial after each step
+    calculate_coverage(self): Return the coverage percentage of every trial
+    check_clean(self): Return a boolean array, True for the rooms that are fully cleaned
+    """
+
+    def __init__(self,layouts,rng=None):
+        """
+        layouts: array of shape (N, nx, ny) with the room layouts
+        rng: numpy Generator, a new unseeded one is created if None
+        """
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.layout = np.array(layouts,dtype=np.uint8)
+        n,self.nx,self.ny = self.layout.shape
+        self.visits = np.zeros(self.layout.shape,dtype=np.int32)
+        self.cell_count = np.stack([(self.layout==code).sum(axis=(1,2)) for code in range(3)],axis=1)
+        self.dist_travelled = np.zeros(n)
+        self.repeated_cell = np.zeros(n,dtype=int)
+        self.stuck = np.zeros(n,dtype=bool)
+        self._trials = np.arange(n)
+        self._moves = np.array(RANDOM_WALK_MOVES)
+        self._move_dist = np.sqrt((self._moves**2).sum(axis=1))
+
+        # Start at the corner if it is free, otherwise on a uniformly chosen free cell. Like for Roomba,
+        # the cells without a free neighbor are left out, the robot could not move from there
+        self.current_x = np.zeros(n,dtype=int)
+        self.current_y = np.zeros(n,dtype=int)
+        starts = (self.layout == 0) & self._free_neighbor()
+        if not np.all(starts.any(axis=(1,2))):
+            raise RuntimeError("Room {0} has no free cell the robot can start from".format(
+                int(np.flatnonzero(~starts.any(axis=(1,2)))[0])))
+        blocked = np.flatnonzero(~starts[:,0,0])
+        if len(blocked) > 0:
+            free = starts[blocked].reshape(len(blocked),-1)
+            keys = np.where(free,self.rng.random(free.shape),-1)
+            start = np.argmax(keys,axis=1)
+            self.current_x[blocked] = start // self.ny
+            self.current_y[blocked] = start % self.ny
+        self.unreachable = np.count_nonzero((self.layout == 0) & ~self._reachable(),axis=(1,2))
+        self._visit(self._trials,self.current_x,self.current_y)
+
+    @classmethod
+    def from_rooms(cls,n,rng=None,**room_args):
+        """
+        Create n random rooms with SetUp.create_obstacle and a batch of robots for them
+        Input:
+        n: number of rooms
+        rng: numpy Generator used for the obstacles and then for the robots
+        room_args: keyword arguments for SetUp
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        layouts = []
+        for i in range(n):
+            room = SetUp(**room_args)
+            room.create_obstacle(rng=rng)
+            layouts.append(room.layout)
+        return cls(np.array(layouts),rng=rng)
+
+    def _free_neighbor(self):
+        """
+        Return a boolean array shaped like the layouts, True for the cells with at least one non-obstacle
+        neighbor (through NEIGHBOR_MOVES, like SetUp.free_neighbor_count)
+        """
+        free = self.layout != 2
+        found = np.zeros(self.layout.shape,dtype=bool)
+        for dx,dy in NEIGHBOR_MOVES:
+            cells = (slice(None),slice(max(0,-dx),self.nx-max(0,dx)),slice(max(0,-dy),self.ny-max(0,dy)))
+            nbrs = (slice(None),slice(max(0,dx),self.nx-max(0,-dx)),slice(max(0,dy),self.ny-max(0,-dy)))
+            found[cells] |= free[nbrs]
+        return found
+
+    def _reachable(self):
+        """
+        Flood fill every room at once from the starting points, growing the reached cells by one move at a time
+        Return: a boolean array shaped like the layouts, True for the cells each robot can reach
+        """
+        free = self.layout != 2
+        reached = np.zeros(self.layout.shape,dtype=bool)
+        reached[self._trials,self.current_x,self.current_y] = True
+        while True:
+            grown = reached.copy()
+            for dx,dy in NEIGHBOR_MOVES:
+                cells = (slice(None),slice(max(0,-dx),self.nx-max(0,dx)),slice(max(0,-dy),self.ny-max(0,dy)))
+                nbrs = (slice(None),slice(max(0,dx),self.nx-max(0,-dx)),slice(max(0,dy),self.ny-max(0,-dy)))
+                grown[nbrs] |= reached[cells]
+            grown &= free
+            if np.array_equal(grown,reached):
+                return reached
+            reached = grown
+
+    def _visit(self,trials,x,y):
+        """
+        Mark the cells (x,y) of the given trials as visited and cleaned
+        """
+        self.repeated_cell[trials] += self.visits[trials,x,y] > 0
+        self.visits[trials,x,y] += 1
+        old = self.layout[trials,x,y]
+        self.cell_count[trials,old] -= 1
+        self.cell_count[trials,1] += 1
+        self.layout[trials,x,y] = 1
+
+    def step(self):
+        """
+        Move every robot to a random legal neighbor cell. Robots without a legal move stay where they are.
+        """
+        x = self.current_x[:,None] + self._moves[:,0]
+        y = self.current_y[:,None] + self._moves[:,1]
+        inside = (x >= 0) & (x < self.nx) & (y >= 0) & (y < self.ny)
+        states = self.layout[self._trials[:,None],np.clip(x,0,self.nx-1),np.clip(y,0,self.ny-1)]
+        legal = inside & (states != 2)
+
+        # A uniform choice among the legal moves: the legal move with the largest random key
+        keys = np.where(legal,self.rng.random(legal.shape),-1)
+        move = np.argmax(keys,axis=1)
+        self.stuck = ~legal.any(axis=1)
+        moving = ~self.stuck
+
+        new_x = np.where(moving,x[self._trials,move],self.current_x)
+        new_y = np.where(moving,y[self._trials,move],self.current_y)
+        self.dist_travelled += np.where(moving,self._move_dist[move],0)
+        # Robots that are stuck are not counted as visiting their cell again
+        self._visit(self._trials[moving],new_x[moving],new_y[moving])
+        self.current_x = new_x
+        self.current_y = new_y
+
+    def run(self,steps):
+        """
+        Run the given number of steps
+        Return: an array of shape (N, steps) with the coverage percentage of every trial after each step
+        """
+        coverage = np.empty((len(self._trials),steps))
+        for i in range(steps):
+            self.step()
+            coverage[:,i] = self.calculate_coverage()
+        return coverage
+
+    def calculate_coverage(self):
+        """
+        Return: The coverage percentage of every trial so far, of the cells the robot can reach
+        """
+        return (self.cell_count[:,1] / (self.cell_count[:,0] - self.unreachable + self.cell_count[:,1]))*100
+
+    def check_clean(self):
+        """
+        Return a boolean array, True for the rooms where the entire floor is clean
+        """
+        return self.cell_count[:,0] - self.unreachable == 0
+
+
+def run_random_walk(trials=10000,steps=100,seed=None,room_args=None):
+    """
+    Run the random walk strategy on many random rooms at once
+    Input:
+    trials: number of rooms to simulate
+    steps: number of steps per robot
+    seed: seed of the experiment
+    room_args: dictionary of keyword arguments for SetUp
+    Return:
+    A dictionary with the arrays 'coverage' (trials x steps), 'repeat' and 'dist', in the same
+    format as one strategy of experiment.run_experiment
+    """
+    batch = RandomWalkBatch.from_rooms(trials,rng=np.random.default_rng(seed),**(room_args or {}))
+    coverage = batch.run(steps)
+    return {'coverage': coverage,'repeat': batch.repeated_cell,'dist': batch.dist_travelled}
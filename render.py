@@ -0,0 +1,272 @@
+"""
+Headless rendering of the robot runs to images and videos.
+
+Frames are built straight from the robot's layout array as image buffers, without turtle or
+a display: every cell becomes a cell_size x cell_size block of pixels, white for uncleaned
+cells, light green for cleaned cells and grey for obstacles, with the last cells of the path
+in green and the robot in red. The room is drawn the same way up as visualize.py (x going up
+and y going right).
+
+The frames are streamed to a writer chosen from the output path:
+
+run.gif: animated GIF (the frames are kept as one byte per pixel paletted images until the end)
+run.mp4: MP4 video, the frames are piped to ffmpeg, which must be installed
+frames/ or frames/step_{0:05d}.png: one PNG file per frame
+
+Long runs are decimated: only every every-th step is drawn (or just enough steps for at most
+max_frames frames), the first and last states always being drawn.
+
+record runs a robot and draws it as it goes, render_log draws a run recorded in a trajectory log
+(see trajectory_log.py) without running its strategy again.
+
+Example:
+room = SetUp(nx=100,ny=100,num_obstacle=20)
+room.create_obstacle(seed=0)
+record(Roomba(room),'random_walk','run.gif',steps=5000,max_frames=200)
+"""
+from classes import SetUp, Roomba
+from trajectory_log import TrajectoryReplay
+from collections import deque
+from PIL import Image
+import numpy as np
+import argparse
+import os
+import shutil
+import subprocess
+
+# Colors of the uncleaned, cleaned and obstacle cells (the layout codes), then of the path and the robot
+PALETTE = np.array([[255,255,255],[170,220,170],[128,128,128],[0,128,0],[220,0,0]],dtype=np.uint8)
+PATH = 3
+ROBOT = 4
+
+
+def render_frame(layout,path=(),position=None,cell_size=4):
+    """
+    Draw the room as an image
+    Input:
+    layout: the layout array of a robot (or a CompactLayout), 0 uncleaned, 1 cleaned, 2 obstacle
+    path: cells (x,y) to draw as the path of the robot
+    position: cell (x,y) of the robot, None to not draw it
+    cell_size: size of a cell in pixels
+    Return: a uint8 array of shape (nx*cell_size, ny*cell_size) with the PALETTE index of every pixel
+    """
+    index = np.array(layout,dtype=np.uint8)
+    if len(path):
+        x,y = np.asarray(path).T
+        index[x,y] = PATH
+    if position is not None:
+        index[position[0],position[1]] = ROBOT
+    # x goes up the image like in visualize.py
+    return np.repeat(np.repeat(index[::-1],cell_size,axis=0),cell_size,axis=1)
+
+def to_rgb(frame):
+    """
+    Return the RGB image, shape (height, width, 3), of a frame from render_frame
+    """
+    return PALETTE[frame]
+
+def to_image(frame):
+    """
+    Return a paletted PIL image of a frame from render_frame
+    """
+    image = Image.fromarray(frame)
+    image.putpalette(PALETTE.ravel().tolist())
+    return image
+
+
+class GifWriter(object):
+
+    """
+    Animated GIF of the frames, written when the writer is closed
+    """
+
+    def __init__(self,path,fps=10):
+        self.path = path
+        self.fps = fps
+        self.frames = []
+
+    def write(self,frame):
+        self.frames.append(to_image(frame))
+
+    def close(self):
+        if self.frames:
+            self.frames[0].save(self.path,save_all=True,append_images=self.frames[1:],duration=int(1000/self.fps),
+                                loop=0)
+        self.frames = []
+
+
+class VideoWriter(object):
+
+    """
+    MP4 video of the frames, streamed to an ffmpeg process
+    """
+
+    def __init__(self,path,fps=10):
+        self.path = path
+        self.fps = fps
+        self.process = None
+        if shutil.which('ffmpeg') is None:
+            raise RuntimeError("ffmpeg is needed to write {0}, write a .gif or PNG frames instead".format(path))
+
+    def write(self,frame):
+        # H.264 needs even sizes, the last row and column are repeated if needed
+        frame = np.pad(frame,((0,frame.shape[0] % 2),(0,frame.shape[1] % 2)),mode='edge')
+        if self.process is None:
+            height,width = frame.shape
+            self.process = subprocess.Popen(['ffmpeg','-y','-loglevel','error','-f','rawvideo','-pix_fmt','rgb24',
+                                             '-s','{0}x{1}'.format(width,height),'-r',str(self.fps),'-i','-',
+                                             '-vcodec','libx264','-pix_fmt','yuv420p',self.path],
+                                            stdin=subprocess.PIPE)
+        self.process.stdin.write(to_rgb(frame).tobytes())
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            if self.process.wait() != 0:
+                raise RuntimeError("ffmpeg failed to write {0}".format(self.path))
+            self.process = None
+
+
+class PngWriter(object):
+
+    """
+    One PNG file per frame, named with a format pattern numbered from 0
+    """
+
+    def __init__(self,pattern):
+        self.pattern = pattern
+        self.count = 0
+        directory = os.path.dirname(pattern)
+        if directory:
+            os.makedirs(directory,exist_ok=True)
+
+    def write(self,frame):
+        to_image(frame).save(self.pattern.format(self.count))
+        self.count += 1
+
+    def close(self):
+        pass
+
+
+def open_writer(path,fps=10):
+    """
+    Return the frame writer for the output path: GifWriter for a .gif file, VideoWriter for a .mp4 file
+    and PngWriter for a .png pattern such as frames/step_{0:05d}.png or a directory
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.gif':
+        return GifWriter(path,fps)
+    if extension == '.mp4':
+        return VideoWriter(path,fps)
+    if extension == '.png':
+        return PngWriter(path)
+    if extension == '':
+        return PngWriter(os.path.join(path,'frame_{0:05d}.png'))
+    raise ValueError("Unknown output format {0}, use .gif, .mp4, .png or a directory".format(path))
+
+def _decimation(steps,every,max_frames):
+    """
+    Return the number of steps between two frames
+    """
+    if every is not None:
+        return every
+    return 1 if max_frames is None else max(1,-(-steps // max(max_frames - 1,1)))
+
+def record(r,strategy,path,steps=1000,every=None,max_frames=None,cell_size=None,fps=10,trail=50,
+           stop_when_clean=True):
+    """
+    Run the robot with the given strategy and write the run to path
+    Input:
+    r: the robot, it is moved with Roomba.advance
+    strategy: the strategy of the robot
+    path: output path, see open_writer
+    steps: maximum number of steps
+    every: draw every every-th step, None to draw every step or to use max_frames
+    max_frames: maximum number of frames, sets every when it is None
+    cell_size: size of a cell in pixels, None for a room about 500 pixels wide
+    fps: frames per second of the GIF or video
+    trail: number of last cells of the path drawn
+    stop_when_clean: stop as soon as the room is clean
+    Return: the number of frames written
+    """
+    every = _decimation(steps,every,max_frames)
+    if cell_size is None:
+        cell_size = max(1,500 // max(r.room.nx,r.room.ny))
+    path_cells = deque([(r.current_x,r.current_y)],maxlen=trail)
+    writer = open_writer(path,fps)
+    frames = 0
+    try:
+        drawn = False
+        for i in range(steps+1):
+            if i > 0:
+                path_cells.append(r.advance(strategy))
+                drawn = False
+            if i % every == 0:
+                writer.write(render_frame(r.layout,path_cells,(r.current_x,r.current_y),cell_size))
+                frames += 1
+                drawn = True
+            if stop_when_clean and r.check_clean():
+                break
+        if not drawn:
+            writer.write(render_frame(r.layout,path_cells,(r.current_x,r.current_y),cell_size))
+            frames += 1
+    finally:
+        writer.close()
+    return frames
+
+def render_log(log,path,every=None,max_frames=None,cell_size=None,fps=10,trail=50):
+    """
+    Draw a run from its trajectory log
+    Input:
+    log: path of the trajectory log
+    Other arguments as for record, the moves of the log being the steps
+    Return: the number of frames written
+    """
+    replay = TrajectoryReplay(log)
+    every = _decimation(replay.steps,every,max_frames)
+    if cell_size is None:
+        cell_size = max(1,500 // max(replay.nx,replay.ny))
+    positions = replay.positions()
+    steps = list(range(0,replay.steps+1,every))
+    if steps[-1] != replay.steps:
+        steps.append(replay.steps)
+    writer = open_writer(path,fps)
+    try:
+        for state in replay.states(steps):
+            step = state['step']
+            writer.write(render_frame(state['layout'],positions[max(0,step+1-trail):step+1],state['position'],
+                                      cell_size))
+    finally:
+        writer.close()
+    return len(steps)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render a robot run to a GIF, an MP4 video or PNG frames")
+    parser.add_argument('--strategy',default='random_walk',help="strategy of the robot")
+    parser.add_argument('--size',type=int,default=10,help="room size (square room)")
+    parser.add_argument('--obstacles',type=int,default=10,help="number of obstacles")
+    parser.add_argument('--sensor-range',type=int,default=1,help="sensor range of the robot")
+    parser.add_argument('--steps',type=int,default=1000,help="maximum number of steps")
+    parser.add_argument('--seed',type=int,default=None,help="seed of the room and the robot")
+    parser.add_argument('--every',type=int,default=None,help="draw every n-th step")
+    parser.add_argument('--max-frames',type=int,default=None,help="maximum number of frames")
+    parser.add_argument('--cell-size',type=int,default=None,help="size of a cell in pixels")
+    parser.add_argument('--fps',type=int,default=10,help="frames per second")
+    parser.add_argument('--ga-engine',choices=['loop','array'],default='loop',help="genetic algorithm implementation")
+    parser.add_argument('--output',default='run.gif',help="output .gif, .mp4, .png pattern or directory")
+    parser.add_argument('--log',default=None,help="draw the run of this trajectory log instead of running a robot")
+    args = parser.parse_args()
+
+    if args.log is not None:
+        frames = render_log(args.log,args.output,every=args.every,max_frames=args.max_frames,
+                            cell_size=args.cell_size,fps=args.fps)
+        print("{0} frames written to {1}".format(frames,args.output))
+    else:
+        rng = np.random.default_rng(args.seed)
+        room = SetUp(nx=args.size,ny=args.size,num_obstacle=args.obstacles)
+        room.create_obstacle(rng=rng)
+        r = Roomba(room,sensor_range=args.sensor_range,rng=rng,ga_engine=args.ga_engine)
+        frames = record(r,args.strategy,args.output,steps=args.steps,every=args.every,max_frames=args.max_frames,
+                        cell_size=args.cell_size,fps=args.fps)
+        print("{0} frames written to {1}, coverage {2:.1f}%".format(frames,args.output,r.calculate_coverage()))
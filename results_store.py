@@ -0,0 +1,178 @@
+"""
+Append-only columnar store for the results of long experiment campaigns.
+
+A store is a directory with one binary file per strategy and result key, e.g.
+genetic_algorithm/coverage.bin, holding one fixed-size row per trial, and a
+checkpoint.json file with the campaign settings, the dtype and row shape of every
+column and the number of finished trials. Trials are appended in chunks: every column
+file is written and flushed to disk first, then the checkpoint is replaced atomically,
+so after a crash the checkpoint always points to the end of the last complete chunk and
+anything written after it is cut off when the store is opened again. A copy of the
+checkpoint is kept in checkpoint.json.bak and read instead if checkpoint.json is damaged,
+and a column file cut short drops the trials it lost, so they are run again on resume.
+
+Columns are read back lazily as read-only memory maps, so plotting a campaign does not
+need all the traces in memory at once.
+
+Example:
+store = ResultStore('campaign')
+store.create({'trials': 1000,'steps': 100})
+store.append(outcomes)
+coverage = store.column('random_walk','coverage')
+"""
+import numpy as np
+import json
+import os
+
+CHECKPOINT = 'checkpoint.json'
+# Copy of the checkpoint, written after it
+BACKUP = 'checkpoint.json.bak'
+
+
+class ResultStore(object):
+
+    """
+    Results of a campaign stored on disk
+
+    Input: the path of the store directory
+
+    Attributes:
+
+    path: Path of the store directory
+    config: The campaign settings given to create, used to check that a resumed campaign is the same
+    columns: dtype and row shape of every column, {strategy: {key: [dtype, shape]}}
+    trials: Number of finished trials stored
+
+    Methods:
+
+    exists(self): Return True if the directory holds a store
+    create(self,config): Start a new empty store with the given settings
+    append(self,outcomes): Append the outcomes of some finished trials and move the checkpoint
+    column(self,strategy,key): Return the stored values of one column as a read-only array
+    results(self): Return all the columns in the format of experiment.run_experiment
+    """
+
+    def __init__(self,path):
+        self.path = path
+        self.config = None
+        self.columns = {}
+        self.trials = 0
+        if self.exists():
+            self._load()
+
+    def exists(self):
+        return any(os.path.exists(os.path.join(self.path,name)) for name in (CHECKPOINT,BACKUP))
+
+    def _file(self,strategy,key):
+        return os.path.join(self.path,strategy,key + '.bin')
+
+    def _row_bytes(self,strategy,key):
+        dtype,shape = self.columns[strategy][key]
+        return np.dtype(dtype).itemsize*int(np.prod(shape,dtype=int))
+
+    def _read_checkpoint(self):
+        """
+        Return the checkpoint, or its backup if the checkpoint is missing or damaged
+        """
+        for name in (CHECKPOINT,BACKUP):
+            try:
+                with open(os.path.join(self.path,name)) as f:
+                    checkpoint = json.load(f)
+                return checkpoint['config'],checkpoint['columns'],int(checkpoint['trials'])
+            except (OSError,ValueError,KeyError,TypeError):
+                continue
+        raise ValueError("{0} has no readable checkpoint".format(self.path))
+
+    def _load(self):
+        self.config,self.columns,self.trials = self._read_checkpoint()
+        # Only keep the trials whose rows are complete in every column
+        trials = self.trials
+        for strategy in self.columns:
+            for key in self.columns[strategy]:
+                row_bytes = self._row_bytes(strategy,key)
+                path = self._file(strategy,key)
+                if row_bytes > 0:
+                    trials = min(trials,(os.path.getsize(path) if os.path.exists(path) else 0) // row_bytes)
+        # Drop the rows of a chunk that was being written when the campaign stopped, or after the lost trials
+        for strategy in self.columns:
+            for key in self.columns[strategy]:
+                size = trials*self._row_bytes(strategy,key)
+                if os.path.exists(self._file(strategy,key)) and os.path.getsize(self._file(strategy,key)) > size:
+                    os.truncate(self._file(strategy,key),size)
+        if trials != self.trials:
+            self.trials = trials
+            self._save()
+
+    def _save(self):
+        checkpoint = {'config': self.config,'columns': self.columns,'trials': self.trials}
+        # The backup is written once the checkpoint is complete, one of the two can always be read
+        for name in (CHECKPOINT,BACKUP):
+            temporary = os.path.join(self.path,name + '.tmp')
+            with open(temporary,'w') as f:
+                json.dump(checkpoint,f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary,os.path.join(self.path,name))
+
+    def create(self,config):
+        """
+        Start a new empty store, removing the columns of a previous campaign in the same directory
+        config: JSON serializable dictionary of the campaign settings
+        """
+        os.makedirs(self.path,exist_ok=True)
+        for strategy in self.columns:
+            for key in self.columns[strategy]:
+                os.remove(self._file(strategy,key))
+        self.config = config
+        self.columns = {}
+        self.trials = 0
+        self._save()
+
+    def append(self,outcomes):
+        """
+        Append finished trials to the store
+        Input:
+        outcomes: list of dictionaries returned by experiment.run_trial, in trial order
+        """
+        if len(outcomes) == 0:
+            return
+        if not self.columns:
+            # The dtype and shape of every column are taken from the first trial
+            for strategy,outcome in outcomes[0].items():
+                os.makedirs(os.path.join(self.path,strategy),exist_ok=True)
+                self.columns[strategy] = {}
+                for key,value in outcome.items():
+                    value = np.asarray(value)
+                    self.columns[strategy][key] = [value.dtype.str,list(value.shape)]
+        for strategy in self.columns:
+            for key,(dtype,shape) in self.columns[strategy].items():
+                rows = np.array([outcome[strategy][key] for outcome in outcomes],dtype=dtype)
+                if rows.shape[1:] != tuple(shape):
+                    raise ValueError("{0} {1} has shape {2} instead of {3}".format(strategy,key,rows.shape[1:],shape))
+                with open(self._file(strategy,key),'ab') as f:
+                    f.write(rows.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+        self.trials += len(outcomes)
+        self._save()
+
+    def column(self,strategy,key):
+        """
+        Return: the values of one column for every stored trial, a read-only memory map of shape (trials,) + row shape
+        """
+        dtype,shape = self.columns[strategy][key]
+        if self.trials == 0:
+            return np.empty([0]+shape,dtype=dtype)
+        return np.memmap(self._file(strategy,key),dtype=dtype,mode='r',shape=tuple([self.trials]+shape))
+
+    def results(self):
+        """
+        Return: a dictionary mapping each strategy to a dictionary of its columns, like
+        experiment.run_experiment, with 'time_per_cell' computed from the stored times and cells
+        """
+        results = {}
+        for strategy in self.columns:
+            results[strategy] = {key: self.column(strategy,key) for key in self.columns[strategy]}
+            if 'time' in results[strategy] and 'cells' in results[strategy]:
+                results[strategy]['time_per_cell'] = results[strategy]['time'] / results[strategy]['cells']
+        return results
@@ -0,0 +1,150 @@
+"""
+Scenario library: fixed sets of rooms stored on disk.
+
+generate_scenarios creates many rooms at once and stores their layouts in a single
+memory-mapped .npy file, one (nx, ny) uint8 layout per room, next to a JSON metadata
+index with the size, seed, obstacle density and number of free cells of every room.
+Every room is the same as SetUp(nx,ny,num_obstacle).create_obstacle(rng=np.random.default_rng(seed))
+with its seed from the index, but the obstacles of a whole chunk of rooms are drawn as
+arrays instead of one rectangle at a time.
+
+Rooms are loaded without copying with SetUp.from_scenario(path,index) or ScenarioSet(path).room(index):
+the layout is a read-only view of the memory-mapped file, so parallel workers opening
+the same file share its pages.
+
+Example:
+scenarios = generate_scenarios('rooms.npy',10000,seed=0)
+room = SetUp.from_scenario('rooms.npy',42)
+"""
+from classes import SetUp
+import numpy as np
+import json
+import os
+
+# Scenario sets already opened by this process, by path
+_opened = {}
+
+
+def index_path(path):
+    """
+    Return the path of the metadata index of the scenario file path
+    """
+    return os.path.splitext(path)[0] + '.json'
+
+def draw_obstacles(seeds,nx,ny,num_obstacle):
+    """
+    Draw the obstacles of one room per seed, the same way SetUp.create_obstacle does
+    Return: an integer array of shape (rooms, num_obstacle, 4) with rx, ry, size_x and size_y of every obstacle
+    """
+    low = [1,1,0,0]
+    high = [nx,ny,nx//2,ny//2]
+    return np.array([np.random.default_rng(seed).integers(low,high,size=(num_obstacle,4)) for seed in seeds],
+                    dtype=int).reshape(len(seeds),num_obstacle,4)
+
+def rasterize(obstacles,nx,ny):
+    """
+    Build the layouts of many rooms at once from their obstacles
+    Input:
+    obstacles: integer array of shape (rooms, num_obstacle, 4) from draw_obstacles
+    Return: a uint8 array of shape (rooms, nx, ny), 2 on the obstacles and 0 elsewhere
+    """
+    rx,ry,size_x,size_y = np.moveaxis(obstacles,2,0)
+    # Like the slices of create_obstacle, an obstacle going past the border of the room is empty
+    end_x = np.where(rx+size_x < nx,rx+size_x,0)
+    end_y = np.where(ry+size_y < ny,ry+size_y,0)
+    rows = np.arange(nx)
+    cols = np.arange(ny)
+    in_x = ((rows >= rx[...,None]) & (rows < end_x[...,None])).astype(np.float32)
+    in_y = ((cols >= ry[...,None]) & (cols < end_y[...,None])).astype(np.float32)
+    # Number of obstacles covering every cell
+    cover = np.matmul(in_x.transpose(0,2,1),in_y)
+    return (cover > 0).astype(np.uint8)*2
+
+def generate_scenarios(path,n,nx=10,ny=10,num_obstacle=10,seed=None,chunk_cells=2**24):
+    """
+    Generate n rooms and store them as a scenario file
+    Input:
+    path: path of the .npy file to create, the index is written next to it (see index_path)
+    n: number of rooms
+    nx, ny, num_obstacle: size and number of obstacles of the rooms, as for SetUp
+    seed: seed of the scenario set, every room gets its own seed spawned from it
+    chunk_cells: number of cells generated at once, limits the memory used
+    Return: the ScenarioSet
+    """
+    seeds = [int(child.generate_state(1,np.uint64)[0]) for child in np.random.SeedSequence(seed).spawn(n)]
+    layouts = np.lib.format.open_memmap(path,mode='w+',dtype=np.uint8,shape=(n,nx,ny))
+    rooms = []
+    chunk = max(1,chunk_cells // (nx*ny))
+    for start in range(0,n,chunk):
+        block = rasterize(draw_obstacles(seeds[start:start+chunk],nx,ny,num_obstacle),nx,ny)
+        layouts[start:start+len(block)] = block
+        obstacle_cells = (block == 2).sum(axis=(1,2))
+        for i in range(len(block)):
+            rooms.append({'index': start+i,'nx': nx,'ny': ny,'num_obstacle': num_obstacle,'seed': seeds[start+i],
+                          'obstacle_density': float(obstacle_cells[i]/(nx*ny)),
+                          'free_cells': int(nx*ny - obstacle_cells[i])})
+    layouts.flush()
+    del layouts
+    with open(index_path(path),'w') as f:
+        json.dump({'count': n,'nx': nx,'ny': ny,'rooms': rooms},f)
+    _opened.pop(path,None)
+    return open_scenarios(path)
+
+def open_scenarios(path):
+    """
+    Return the ScenarioSet of the file path, opening it only once per process
+    """
+    if path not in _opened:
+        _opened[path] = ScenarioSet(path)
+    return _opened[path]
+
+
+class ScenarioSet(object):
+
+    """
+    A set of rooms stored in a scenario file
+
+    Attributes:
+
+    path: Path of the .npy scenario file
+    layouts: Read-only memory map of all the layouts, shape (rooms, nx, ny)
+    rooms: Metadata of every room (index, nx, ny, num_obstacle, seed, obstacle_density, free_cells)
+
+    Methods:
+
+    room(self,index,compact=False): Return a SetUp for one room, sharing the memory-mapped layout
+    select(self,**conditions): Return the indices of the rooms whose metadata match the conditions
+    """
+
+    def __init__(self,path):
+        self.path = path
+        self.layouts = np.load(path,mmap_mode='r')
+        with open(index_path(path)) as f:
+            self.rooms = json.load(f)['rooms']
+
+    def __len__(self):
+        return len(self.rooms)
+
+    def __getitem__(self,index):
+        return self.layouts[index]
+
+    def room(self,index,compact=False):
+        meta = self.rooms[index]
+        return SetUp.from_layout(self.layouts[index],num_obstacle=meta['num_obstacle'],compact=compact)
+
+    def select(self,**conditions):
+        """
+        Return the indices of the rooms matching all the conditions. A condition is either a value
+        or a (min, max) tuple, e.g. select(obstacle_density=(0.1,0.3))
+        """
+        selected = []
+        for meta in self.rooms:
+            ok = True
+            for key,value in conditions.items():
+                if isinstance(value,tuple):
+                    ok = ok and value[0] <= meta[key] <= value[1]
+                else:
+                    ok = ok and meta[key] == value
+            if ok:
+                selected.append(meta['index'])
+        return selected
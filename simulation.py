@@ -1,138 +1,153 @@
-from classes import SetUp, Roomba
-from visualize import visualize
+from experiment import STRATEGIES, run_experiment, run_campaign, run_summary, run_adaptive
+from streaming_stats import StrategySummary
 import numpy as np
 import matplotlib.pyplot as plt
-# Coverage
-coverage_rw = []
-coverage_ga = []
-coverage_gd = []
-
-repeat_rw = []
-repeat_ga = []
-repeat_gd = []
-
-dist_rw = []
-dist_ga = []
-dist_gd = []
-
-
-def single_step(r,strategy):
-    step = r.step(strategy)[0]
-    x = step[0]
-    y = step[1]
-    r.move_to(x,y)
-    return r.calculate_coverage()
-
-for i in range(100):
-    print(i)
-    temp_rw = []
-    temp_ga = []
-    temp_gd = []
-    room = SetUp()
-    room.create_obstacle()
-    rw = Roomba(room)
-    ga = Roomba(room)
-    gd = Roomba(room)
-    for i in range(100):
-        temp_rw.append(single_step(rw,'random_walk'))
-        temp_ga.append(single_step(ga,'genetic_algorithm'))
-        temp_gd.append(single_step(gd,'greedy_algorithm'))
-
-    coverage_rw.append(temp_rw)
-    coverage_ga.append(temp_ga)
-    coverage_gd.append(temp_gd)
-
-    repeat_rw.append(rw.repeated_cell)
-    repeat_ga.append(ga.repeated_cell)
-    repeat_gd.append(gd.repeated_cell)
-
-    dist_rw.append(rw.dist_travelled)
-    dist_ga.append(ga.dist_travelled)
-    dist_gd.append(gd.dist_travelled)
-
-coverage_rw = np.array(coverage_rw)
-coverage_ga = np.array(coverage_ga)
-coverage_gd = np.array(coverage_gd)
-
-repeat_rw = np.array(repeat_rw)
-repeat_ga = np.array(repeat_ga)
-repeat_gd = np.array(repeat_gd)
-
-dist_rw = np.array(dist_rw)
-dist_ga = np.array(dist_ga)
-dist_gd = np.array(dist_gd)
-
-x = np.arange(100)
-
-y_rw = np.mean(coverage_rw,axis=0).flatten()
-y_rw_25 = np.percentile(coverage_rw,25,axis=0).flatten()
-y_rw_75 = np.percentile(coverage_rw,75,axis=0).flatten()
-
-y_ga = np.mean(coverage_ga,axis=0).flatten()
-y_ga_25 = np.percentile(coverage_ga,25,axis=0).flatten()
-y_ga_75 = np.percentile(coverage_ga,75,axis=0).flatten()
-
-y_gd = np.mean(coverage_gd,axis=0).flatten()
-y_gd_25 = np.percentile(coverage_gd,25,axis=0).flatten()
-y_gd_75 = np.percentile(coverage_gd,75,axis=0).flatten()
-
-
-plt.plot(x,y_rw,color='purple',label='Random walk')
-plt.fill_between(x,y_rw_25,y_rw_75,color='purple',alpha=0.1)
-
-plt.plot(x,y_ga,color='blue',label='Genetic algorithm')
-plt.fill_between(x,y_ga_25,y_ga_75,color='blue',alpha=0.1)
-
-plt.plot(x,y_gd,color='red',label='Greedy algorithm')
-plt.fill_between(x,y_gd_25,y_gd_75,color='red',alpha=0.1)
-
-plt.xlabel("Step")
-plt.ylabel("Coverage percentage (%)")
-plt.title("Coverage percentage by different algorithms")
-plt.legend()
-plt.show()
-plt.clf()
-
-# Repeated cell distribution
-plt.hist(repeat_rw,histtype='bar',color='purple',rwidth=0.8,alpha=0.6)
-plt.axvline(repeat_rw.mean(), color='k', linestyle='dashed', linewidth=1)
-plt.suptitle("Repeated cells distribution for random walk")
-string = "25% and 75% range: [{0},{1}]".format(np.percentile(repeat_rw,25),np.percentile(repeat_rw,75))
-plt.title(string)
-plt.show()
-plt.clf()
-
-plt.hist(repeat_ga,histtype='bar',color='blue',rwidth=0.8,alpha=0.6)
-plt.axvline(repeat_ga.mean(), color='k', linestyle='dashed', linewidth=1)
-plt.suptitle("Repeated cells distribution for genetic algorithm")
-string = "25% and 75% range: [{0},{1}]".format(np.percentile(repeat_ga,25),np.percentile(repeat_ga,75))
-plt.title(string)
-plt.show()
-plt.clf()
-
-plt.hist(repeat_gd,histtype='bar',color='red',rwidth=0.8,alpha=0.6)
-plt.axvline(repeat_gd.mean(), color='k', linestyle='dashed', linewidth=1)
-plt.suptitle("Repeated cells distribution for greedy algorithm")
-string = "25% and 75% range: [{0},{1}]".format(np.percentile(repeat_gd,25),np.percentile(repeat_gd,75))
-plt.title(string)
-plt.show()
-plt.clf()
-
-# Distance travelled distribution
-plt.hist(dist_rw,histtype='bar',color='purple',rwidth=0.8,alpha=0.6)
-plt.axvline(dist_rw.mean(), color='k', linestyle='dashed', linewidth=1)
-plt.suptitle("Distance travelled distribution for random walk")
-string = "25% and 75% range: [{0},{1}]".format(round(np.percentile(dist_rw,25),2),round(np.percentile(dist_rw,75),2))
-plt.title(string)
-plt.show()
-plt.clf()
-
-plt.hist(dist_ga,histtype='bar',color='blue',rwidth=0.8,alpha=0.6)
-plt.title("Distance travelled distribution for genetic algorithm")
-plt.show()
-plt.clf()
-
-plt.hist(dist_gd,histtype='bar',color='red',rwidth=0.8,alpha=0.6)
-plt.title("Distance travelled distribution for greedy algorithm")
-plt.show()
-plt.clf()
+import argparse
+
+# Color and label of every strategy in the plots
+STYLES = {'random_walk': ('purple','Random walk'),'genetic_algorithm': ('blue','Genetic algorithm'),
+          'greedy_algorithm': ('red','Greedy algorithm'),'frontier': ('orange','Frontier planner')}
+
+
+def coverage_band(coverage,block=256):
+    """
+    Compute the mean and the 25th and 75th percentiles of the coverage at every step
+    Input:
+    coverage: array of shape (trials, steps), e.g. a memory map from ResultStore.column
+    block: number of steps read at once, so that a stored campaign is never loaded in memory entirely
+    Return: the mean, 25th and 75th percentile arrays, one value per step
+    """
+    steps = coverage.shape[1]
+    mean = np.empty(steps)
+    low = np.empty(steps)
+    high = np.empty(steps)
+    for start in range(0,steps,block):
+        part = np.asarray(coverage[:,start:start+block])
+        mean[start:start+block] = np.mean(part,axis=0)
+        low[start:start+block] = np.percentile(part,25,axis=0)
+        high[start:start+block] = np.percentile(part,75,axis=0)
+    return mean,low,high
+
+def strategy_band(result):
+    """
+    Return the mean and the 25th and 75th percentiles of the coverage per step of one strategy,
+    from its results arrays or from its StrategySummary
+    """
+    if isinstance(result,StrategySummary):
+        return result.coverage_band()
+    return coverage_band(result['coverage'])
+
+def strategy_hist(result,key,**style):
+    """
+    Draw the histogram of the repeated cells (key 'repeat') or distance travelled (key 'dist') of one strategy,
+    from its results arrays or from its StrategySummary
+    Return: the mean and the 25th and 75th percentiles of the values
+    """
+    if isinstance(result,StrategySummary):
+        histogram = getattr(result,key)
+        counts,edges = histogram.rebin()
+        plt.hist(edges[:-1],bins=edges,weights=counts,**style)
+        return histogram.mean(),float(histogram.quantile(25)),float(histogram.quantile(75))
+    values = result[key]
+    plt.hist(values,**style)
+    return values.mean(),np.percentile(values,25),np.percentile(values,75)
+
+def plot_results(results):
+    """
+    Plot the coverage curves and the repeated cells and distance travelled distributions
+    Input:
+    results: the dictionary returned by experiment.run_experiment, ResultStore.results or experiment.run_summary
+    """
+    strategies = [strategy for strategy in STYLES if strategy in results]
+
+    for strategy in strategies:
+        color,label = STYLES[strategy]
+        y,y_25,y_75 = strategy_band(results[strategy])
+        x = np.arange(len(y))
+        plt.plot(x,y,color=color,label=label)
+        plt.fill_between(x,y_25,y_75,color=color,alpha=0.1)
+
+    plt.xlabel("Step")
+    plt.ylabel("Coverage percentage (%)")
+    plt.title("Coverage percentage by different algorithms")
+    plt.legend()
+    plt.show()
+    plt.clf()
+
+    # Repeated cell distribution
+    for strategy in strategies:
+        color,label = STYLES[strategy]
+        mean,low,high = strategy_hist(results[strategy],'repeat',histtype='bar',color=color,rwidth=0.8,alpha=0.6)
+        plt.axvline(mean, color='k', linestyle='dashed', linewidth=1)
+        plt.suptitle("Repeated cells distribution for {0}".format(label.lower()))
+        string = "25% and 75% range: [{0},{1}]".format(low,high)
+        plt.title(string)
+        plt.show()
+        plt.clf()
+
+    # Distance travelled distribution
+    for strategy in strategies:
+        color,label = STYLES[strategy]
+        mean,low,high = strategy_hist(results[strategy],'dist',histtype='bar',color=color,rwidth=0.8,alpha=0.6)
+        plt.axvline(mean, color='k', linestyle='dashed', linewidth=1)
+        plt.suptitle("Distance travelled distribution for {0}".format(label.lower()))
+        string = "25% and 75% range: [{0},{1}]".format(round(low,2),round(high,2))
+        plt.title(string)
+        plt.show()
+        plt.clf()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the strategies over many random rooms")
+    parser.add_argument('--trials',type=int,default=100,help="number of rooms to simulate")
+    parser.add_argument('--steps',type=int,default=100,help="number of steps per robot")
+    parser.add_argument('--strategies',nargs='+',default=STRATEGIES,choices=list(STYLES),help="strategies to compare")
+    parser.add_argument('--seed',type=int,default=None,help="seed of the experiment")
+    parser.add_argument('--workers',type=int,default=None,help="number of worker processes")
+    parser.add_argument('--ga-engine',choices=['loop','array'],default='loop',help="genetic algorithm implementation")
+    parser.add_argument('--warm-start',action='store_true',help="seed each GA population with the previous survivors")
+    parser.add_argument('--commit',type=int,default=1,help="number of cells of each plan executed before replanning")
+    parser.add_argument('--fitness-cache',type=int,default=None,help="number of fitness scores to memoize per robot")
+    parser.add_argument('--output',default=None,
+                        help="directory to stream the results to, an interrupted campaign is resumed from it")
+    parser.add_argument('--chunk',type=int,default=50,help="number of trials between two checkpoints of --output")
+    parser.add_argument('--stop-when-clean',action='store_true',help="stop every robot as soon as its room is clean")
+    parser.add_argument('--half-width',type=float,default=None,
+                        help="adaptive campaign: run trials until every confidence interval is narrower than this")
+    parser.add_argument('--confidence',type=float,default=0.95,help="confidence level of the adaptive campaign")
+    parser.add_argument('--max-trials',type=int,default=10000,help="maximum trials per strategy of the adaptive campaign")
+    parser.add_argument('--log-dir',default=None,
+                        help="directory to write the trajectory log of every robot to (not with --streaming or --half-width)")
+    parser.add_argument('--streaming',action='store_true',
+                        help="only keep constant-memory statistics instead of every trial (percentiles are approximate)")
+    args = parser.parse_args()
+    if args.warm_start and args.ga_engine != 'array':
+        parser.error("--warm-start needs --ga-engine array")
+
+    robot_args = {'ga_engine': args.ga_engine,'warm_start': args.warm_start,'commit': args.commit,
+                  'fitness_cache': args.fitness_cache}
+    if args.half_width is not None:
+        results = run_adaptive(args.half_width,args.confidence,max_trials=args.max_trials,steps=args.steps,
+                               strategies=args.strategies,seed=args.seed,workers=args.workers,robot_args=robot_args)
+        for strategy,summary in results.items():
+            print("{0}: {1} trials, {2:.1f} steps on average".format(strategy,summary.count,float(summary.moves.mean)))
+    elif args.streaming:
+        results = run_summary(trials=args.trials,steps=args.steps,strategies=args.strategies,seed=args.seed,
+                              workers=args.workers,robot_args=robot_args,stop_when_clean=args.stop_when_clean)
+    elif args.output is None:
+        results = run_experiment(trials=args.trials,steps=args.steps,strategies=args.strategies,seed=args.seed,
+                                 workers=args.workers,robot_args=robot_args,stop_when_clean=args.stop_when_clean,
+                                 log_dir=args.log_dir)
+    else:
+        results = run_campaign(args.output,trials=args.trials,steps=args.steps,strategies=args.strategies,
+                               seed=args.seed,workers=args.workers,robot_args=robot_args,
+                               stop_when_clean=args.stop_when_clean,chunk=args.chunk,log_dir=args.log_dir).results()
+    for strategy,result in results.items():
+        if isinstance(result,StrategySummary):
+            time_per_cell,hits,misses = float(result.time_per_cell.mean),result.cache_hits,result.cache_misses
+        else:
+            time_per_cell,hits,misses = result['time_per_cell'].mean(),result['cache_hits'].sum(),result['cache_misses'].sum()
+        print("{0}: {1:.3g} ms per cell covered".format(strategy,1000*time_per_cell))
+        if hits + misses > 0:
+            print("{0}: {1:.1%} fitness cache hit rate".format(strategy,hits/(hits + misses)))
+    plot_results(results)
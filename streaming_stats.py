@@ -0,0 +1,270 @@
+"""
+Constant-memory statistics of experiment results.
+
+The aggregators are updated one trial (or one batch of trials) at a time and never keep
+the trials themselves, so their memory only depends on the number of steps and bins:
+
+RunningStats: running count, mean and variance, elementwise over an array shape (e.g. one value per step)
+QuantileSketch: fixed-bin counts per position, giving approximate quantiles with an error below one bin width
+Histogram: a one-dimensional QuantileSketch with an exact running mean, minimum and maximum, for plotting
+StrategySummary: all the statistics plotted by simulation.plot_results for one strategy
+
+Every aggregator has a merge(other) method adding the trials of another aggregator with the
+same settings, so each worker process can summarize its own trials and the parent process
+merges the summaries.
+
+Example:
+summary = StrategySummary(steps=100)
+for outcome in outcomes:
+    summary.update(outcome['random_walk'])
+mean,low,high = summary.coverage_band()
+"""
+from statistics import NormalDist
+import numpy as np
+
+
+class RunningStats(object):
+
+    """
+    Running count, mean and variance of arrays of a fixed shape (Welford's algorithm, merged with Chan's formula)
+
+    Attributes:
+
+    count: Number of values added per position
+    mean: Mean of the values, one per position
+    m2: Sum of the squared differences to the mean, one per position
+
+    Methods:
+
+    update(self,values): Add one array of the given shape, or a batch of them stacked on a first axis
+    merge(self,other): Add the values of another RunningStats of the same shape
+    variance(self,ddof): Return the variance of the values
+    std(self,ddof): Return the standard deviation of the values
+    half_width(self,confidence): Return the half-width of the confidence interval of the mean
+    """
+
+    def __init__(self,shape=()):
+        self.shape = tuple(shape)
+        self.count = 0
+        self.mean = np.zeros(self.shape)
+        self.m2 = np.zeros(self.shape)
+
+    def update(self,values):
+        values = np.asarray(values,dtype=float)
+        if values.shape == self.shape:
+            values = values[None]
+        self._combine(len(values),values.mean(axis=0),((values - values.mean(axis=0))**2).sum(axis=0))
+
+    def merge(self,other):
+        if other.shape != self.shape:
+            raise ValueError("cannot merge statistics of shape {0} into {1}".format(other.shape,self.shape))
+        self._combine(other.count,other.mean,other.m2)
+
+    def _combine(self,count,mean,m2):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta*count/total
+        self.m2 = self.m2 + m2 + delta**2*self.count*count/total
+        self.count = total
+
+    def variance(self,ddof=0):
+        return self.m2 / max(self.count - ddof,1)
+
+    def std(self,ddof=0):
+        return np.sqrt(self.variance(ddof))
+
+    def half_width(self,confidence=0.95):
+        """
+        Return the half-width of the normal confidence interval of the mean at the given level, per position
+        """
+        z = NormalDist().inv_cdf(0.5 + confidence/2)
+        return z*self.std(ddof=1)/np.sqrt(max(self.count,1))
+
+
+class QuantileSketch(object):
+
+    """
+    Approximate quantiles of arrays of a fixed shape, from fixed-bin counts over [low, high] at every position.
+    Values outside the range are counted in the first or last bin. Two sketches with the same range,
+    bins and shape merge exactly.
+
+    Attributes:
+
+    edges: The bins+1 edges of the bins
+    counts: Number of values in each bin, shape (shape) + (bins,)
+    count: Number of values added per position
+    minimum, maximum: Exact minimum and maximum per position
+
+    Methods:
+
+    update(self,values): Add one array of the given shape, or a batch of them stacked on a first axis
+    merge(self,other): Add the counts of another sketch with the same settings
+    quantile(self,q): Return the approximate q-th percentile per position, like np.percentile(values,q,axis=0)
+    """
+
+    def __init__(self,low,high,bins=1000,shape=()):
+        self.shape = tuple(shape)
+        self.edges = np.linspace(low,high,bins+1)
+        self.counts = np.zeros(self.shape + (bins,),dtype=np.int64)
+        self.count = 0
+        self.minimum = np.full(self.shape,np.inf)
+        self.maximum = np.full(self.shape,-np.inf)
+
+    def update(self,values):
+        values = np.asarray(values,dtype=float)
+        if values.shape == self.shape:
+            values = values[None]
+        bins = self.counts.shape[-1]
+        width = self.edges[1] - self.edges[0]
+        index = np.clip(((values - self.edges[0]) // width).astype(np.int64),0,bins-1)
+        positions = np.broadcast_to(np.arange(int(np.prod(self.shape,dtype=int))).reshape(self.shape),values.shape)
+        np.add.at(self.counts.reshape(-1,bins),(positions.ravel(),index.ravel()),1)
+        self.count += len(values)
+        self.minimum = np.minimum(self.minimum,values.min(axis=0))
+        self.maximum = np.maximum(self.maximum,values.max(axis=0))
+
+    def merge(self,other):
+        if other.counts.shape != self.counts.shape or not np.array_equal(other.edges,self.edges):
+            raise ValueError("cannot merge sketches with different bins or shapes")
+        self.counts += other.counts
+        self.count += other.count
+        self.minimum = np.minimum(self.minimum,other.minimum)
+        self.maximum = np.maximum(self.maximum,other.maximum)
+
+    def _value_at(self,rank,cumulative):
+        """
+        Return the value of the given 0-based rank, the values of a bin being spread evenly over the bin
+        """
+        width = self.edges[1] - self.edges[0]
+        rank = np.broadcast_to(rank,self.shape)[...,None]
+        b = np.argmax(cumulative > rank,axis=-1)[...,None]
+        before = np.take_along_axis(cumulative,b,axis=-1) - np.take_along_axis(self.counts,b,axis=-1)
+        inside = np.maximum(np.take_along_axis(self.counts,b,axis=-1),1)
+        return (self.edges[b] + width*(rank - before + 0.5)/inside)[...,0]
+
+    def quantile(self,q):
+        """
+        Return the approximate q-th percentile (0 to 100) of the values at every position,
+        with the linear interpolation between ranks of np.percentile
+        """
+        if self.count == 0:
+            return np.full(self.shape,np.nan)
+        cumulative = np.cumsum(self.counts,axis=-1)
+        rank = q/100*(self.count - 1)
+        below = np.floor(rank)
+        above = np.minimum(below + 1,self.count - 1)
+        value = self._value_at(below,cumulative) + (rank - below)*(self._value_at(above,cumulative) -
+                                                                    self._value_at(below,cumulative))
+        return np.clip(value,self.minimum,self.maximum)
+
+
+class Histogram(QuantileSketch):
+
+    """
+    Fixed-bin histogram of scalar values, with their exact running mean, minimum and maximum
+
+    Attributes:
+
+    stats: RunningStats of the values
+
+    Methods:
+
+    mean(self): Return the exact mean of the values
+    rebin(self,bins): Return counts and edges of the histogram regrouped into bins over [minimum, maximum]
+    """
+
+    def __init__(self,low,high,bins=1000):
+        super(Histogram,self).__init__(low,high,bins)
+        self.stats = RunningStats()
+
+    def update(self,values):
+        values = np.atleast_1d(np.asarray(values,dtype=float))
+        super(Histogram,self).update(values)
+        self.stats.update(values)
+
+    def merge(self,other):
+        super(Histogram,self).merge(other)
+        self.stats.merge(other.stats)
+
+    def mean(self):
+        return float(self.stats.mean)
+
+    def rebin(self,bins=10):
+        """
+        Regroup the counts into equal bins between the minimum and the maximum, like the default bins of plt.hist.
+        Every fixed bin goes into the new bin of its left edge, which is exact for integer values and integer bins.
+        Return: the counts and the bins+1 edges
+        """
+        low,high = float(self.minimum),float(self.maximum)
+        if low == high:
+            low,high = low - 0.5,high + 0.5
+        edges = np.linspace(low,high,bins+1)
+        left = np.clip(self.edges[:-1],low,high)
+        index = np.clip(np.searchsorted(edges,left,side='right') - 1,0,bins-1)
+        return np.bincount(index,weights=self.counts,minlength=bins),edges
+
+
+class StrategySummary(object):
+
+    """
+    Constant-memory summary of the trials of one strategy
+
+    Input: the number of steps per trial
+
+    Attributes:
+
+    coverage: RunningStats of the coverage at every step
+    coverage_sketch: QuantileSketch of the coverage at every step
+    repeat: Histogram of the repeated cells
+    dist: Histogram of the distance travelled
+    time_per_cell: RunningStats of the seconds per cell covered
+    moves: RunningStats of the number of steps moved, smaller than the number of steps when the robot stops once clean
+    cache_hits, cache_misses: Total fitness cache hits and misses
+
+    Methods:
+
+    update(self,outcome): Add the outcome of one trial for this strategy, as returned by experiment.run_trial
+    merge(self,other): Add the trials of another summary with the same settings
+    coverage_band(self): Return the mean and the approximate 25th and 75th percentiles of the coverage per step
+    """
+
+    def __init__(self,steps,coverage_bins=1000,dist_bins=1000):
+        self.steps = steps
+        self.coverage = RunningStats((steps,))
+        self.coverage_sketch = QuantileSketch(0,100,coverage_bins,(steps,))
+        # A robot cannot repeat more cells than it makes moves or travel more than sqrt(2) per move
+        self.repeat = Histogram(0,steps+1,steps+1)
+        self.dist = Histogram(0,steps*np.sqrt(2)+1,dist_bins)
+        self.time_per_cell = RunningStats()
+        self.moves = RunningStats()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def count(self):
+        return self.coverage.count
+
+    def update(self,outcome):
+        self.coverage.update(outcome['coverage'])
+        self.coverage_sketch.update(outcome['coverage'])
+        self.repeat.update(outcome['repeat'])
+        self.dist.update(outcome['dist'])
+        self.time_per_cell.update(outcome['time'] / outcome['cells'])
+        self.moves.update(outcome['steps'])
+        self.cache_hits += outcome['cache_hits']
+        self.cache_misses += outcome['cache_misses']
+
+    def merge(self,other):
+        self.coverage.merge(other.coverage)
+        self.coverage_sketch.merge(other.coverage_sketch)
+        self.repeat.merge(other.repeat)
+        self.dist.merge(other.dist)
+        self.time_per_cell.merge(other.time_per_cell)
+        self.moves.merge(other.moves)
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+
+    def coverage_band(self):
+        return self.coverage.mean,self.coverage_sketch.quantile(25),self.coverage_sketch.quantile(75)
@@ -0,0 +1,294 @@
+"""
+Hyperparameter sweep of the genetic and greedy algorithms with successive halving.
+
+A configuration sets the hyperparameters of ga_step / ga_step_array (population, generations,
+cross_over, mutation) and the weights A, B, C and D of the fitness function, passed to the
+robots as Roomba's ga_args and fitness_weights. It is scored by its coverage per second of
+compute: the coverage reached after the given number of steps, summed over its trials, divided
+by the seconds spent stepping the robot. Trial i of every configuration runs in the same room
+with the same seed, so all the configurations are compared on the same rooms.
+
+Successive halving: every configuration first gets min_trials trials, then only the best 1/eta
+of them are promoted to eta times more trials, and so on until one configuration is left or
+max_trials would be exceeded. The trials of each round run on a process pool. The timings are
+only comparable when the workers do not share cores, keep workers at most the number of cores.
+
+The result of every trial is cached on disk, one JSON file per configuration and settings in the
+cache directory, so running a sweep again skips the trials already run and a promoted
+configuration only runs its extra trials. A sweep without a seed uses the seed stored in its
+cache directory (the first one drawn there), so running it again gets the same rooms and hits
+the cache.
+
+Example:
+rungs = run_sweep(configs=27,min_trials=2,eta=3,seed=0,cache='sweep_cache')
+best = rungs[-1][0]['config']
+"""
+from experiment import run_trial
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import argparse
+import hashlib
+import json
+import os
+
+SEED_FILE = 'seed.json'
+# Values tried for every hyperparameter and fitness weight, the defaults of ga_step and evaluate_fitness included
+SEARCH_SPACE = {'population': [10,20,50,100],'generations': [1,10,50,100,300],'cross_over': [0.5,0.7,0.85,0.95],
+                'mutation': [0.05,0.1,0.2,0.4],'A': [-60,-30,-15,-5],'B': [25,50,100],'C': [-24,-12,-6,0],
+                'D': [-5,-1,0]}
+WEIGHTS = ('A','B','C','D')
+
+
+def sample_configs(n,space=SEARCH_SPACE,seed=None):
+    """
+    Draw n different configurations at random from the search space
+    Input:
+    n: number of configurations, at most the number of combinations in the space
+    space: dictionary with the list of values of every parameter
+    seed: seed of the draw
+    Return: a list of configuration dictionaries
+    """
+    rng = np.random.default_rng(seed)
+    n = min(n,int(np.prod([len(values) for values in space.values()])))
+    configs = []
+    seen = set()
+    while len(configs) < n:
+        config = {key: values[rng.integers(len(values))] for key,values in space.items()}
+        key = json.dumps(config,sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+    return configs
+
+def strategy_configs(configs,strategy):
+    """
+    Return the configurations without the parameters the strategy ignores (generations for the greedy
+    algorithm, which always runs one generation), without the duplicates this leaves
+    """
+    unique = []
+    seen = set()
+    for config in configs:
+        if strategy == 'greedy_algorithm':
+            config = {key: value for key,value in config.items() if key != 'generations'}
+        key = json.dumps(config,sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            unique.append(config)
+    return unique
+
+def config_robot_args(config,ga_engine='loop'):
+    """
+    Return the keyword arguments of Roomba for a configuration
+    """
+    return {'ga_engine': ga_engine,'ga_args': {key: value for key,value in config.items() if key not in WEIGHTS},
+            'fitness_weights': {key: value for key,value in config.items() if key in WEIGHTS}}
+
+def run_config_trial(config,seed_seq,room_index,strategy='genetic_algorithm',ga_engine='loop',**trial_args):
+    """
+    Run one trial of a configuration
+    Other keyword arguments are passed to experiment.run_trial
+    Return: a dictionary with the final coverage ('coverage'), the seconds spent stepping the robot ('time')
+    and the repeated cells ('repeat')
+    """
+    outcome = run_trial(seed_seq,room_index,strategies=[strategy],robot_args=config_robot_args(config,ga_engine),
+                        **trial_args)[strategy]
+    return {'coverage': float(outcome['coverage'][-1]),'time': outcome['time'],'repeat': int(outcome['repeat'])}
+
+def sweep_seed(cache=None,seed=None):
+    """
+    Return the seed of a sweep: the given seed, else the one stored in the cache directory, else a new one,
+    which is then stored in the cache directory
+    """
+    if seed is not None:
+        return seed
+    path = None if cache is None else os.path.join(cache,SEED_FILE)
+    if path is not None and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)['seed']
+    seed = np.random.SeedSequence().entropy
+    if path is not None:
+        os.makedirs(cache,exist_ok=True)
+        with open(path,'w') as f:
+            json.dump({'seed': seed},f)
+    return seed
+
+def score(trials):
+    """
+    Return the coverage per second of compute of a list of trial results
+    """
+    return sum(trial['coverage'] for trial in trials) / sum(trial['time'] for trial in trials)
+
+
+class SweepCache(object):
+
+    """
+    Trial results of the configurations of a sweep, stored on disk
+
+    Input: the path of the cache directory (None to keep the results in memory only) and the settings
+    shared by all the configurations (strategy, steps, seed, rooms, ...), part of the key of every file
+
+    Attributes:
+
+    path: Path of the cache directory
+    settings: The settings of the sweep
+
+    Methods:
+
+    trials(self,config): Return the cached trial results of a configuration, {trial index: result}
+    save(self,config,trials): Store the trial results of a configuration
+    """
+
+    def __init__(self,path,settings):
+        self.path = path
+        self.settings = settings
+        self._memory = {}
+        if path is not None:
+            os.makedirs(path,exist_ok=True)
+
+    def _key(self,config):
+        text = json.dumps({'config': config,'settings': self.settings},sort_keys=True)
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def _file(self,config):
+        return os.path.join(self.path,self._key(config) + '.json')
+
+    def trials(self,config):
+        key = self._key(config)
+        if key not in self._memory:
+            self._memory[key] = {}
+            if self.path is not None and os.path.exists(self._file(config)):
+                with open(self._file(config)) as f:
+                    self._memory[key] = {int(i): trial for i,trial in json.load(f)['trials'].items()}
+        return self._memory[key]
+
+    def save(self,config,trials):
+        self._memory[self._key(config)] = trials
+        if self.path is None:
+            return
+        temporary = self._file(config) + '.tmp'
+        with open(temporary,'w') as f:
+            json.dump({'config': config,'settings': self.settings,'trials': trials},f)
+        os.replace(temporary,self._file(config))
+
+
+def successive_halving(configs,min_trials=2,eta=3,max_trials=None,strategy='genetic_algorithm',steps=100,seed=None,
+                       workers=None,room_args=None,sensor_range=1,ga_engine='loop',scenario=None,cache=None,
+                       verbose=False):
+    """
+    Rank configurations by coverage per second of compute, promoting the best ones to more trials
+    Input:
+    configs: list of configuration dictionaries, e.g. from sample_configs, see strategy_configs
+    min_trials: number of trials of every configuration in the first round
+    eta: only the best 1/eta configurations are kept after each round, with eta times more trials
+    max_trials: maximum number of trials of a configuration, None to go on until one configuration is left
+    strategy: 'genetic_algorithm' or 'greedy_algorithm' (generations is then always 1 and dropped from the configurations)
+    seed: seed of the rooms, None to use the one stored in the cache directory (see sweep_seed)
+    workers: number of worker processes, None for one per core and 1 to run in this process
+    cache: path of the cache directory, None to not cache the results on disk
+    Other arguments as for experiment.run_experiment
+    Return:
+    A list with one ranking per round, best first. Every ranking is a list of dictionaries with the
+    configuration ('config'), its score, mean coverage, mean seconds and mean repeated cells over its
+    trials ('score', 'coverage', 'time', 'repeat') and its number of trials ('trials').
+    """
+    seed = sweep_seed(cache,seed)
+    if verbose:
+        print("seed {0}".format(seed))
+    settings = {'strategy': strategy,'steps': steps,'seed': seed,'room_args': room_args,
+                'sensor_range': sensor_range,'ga_engine': ga_engine,'scenario': scenario}
+    store = SweepCache(cache,settings)
+    configs = strategy_configs(configs,strategy)
+    root = np.random.SeedSequence(seed)
+    task = partial(run_config_trial,strategy=strategy,ga_engine=ga_engine,steps=steps,room_args=room_args,
+                   sensor_range=sensor_range,scenario=scenario)
+    rungs = []
+    survivors = list(configs)
+    trials = min_trials
+    pool = ProcessPoolExecutor(workers) if workers != 1 else None
+    try:
+        while True:
+            # Only the trials missing from the cache are run
+            todo = [(j,i) for j,config in enumerate(survivors) for i in range(trials)
+                    if i not in store.trials(config)]
+            remaining = [0 for config in survivors]
+            for j,i in todo:
+                remaining[j] += 1
+            # Child i of the root, the same SeedSequence as np.random.SeedSequence(seed).spawn(...)[i]
+            seeds = [np.random.SeedSequence(root.entropy,spawn_key=root.spawn_key+(i,),pool_size=root.pool_size)
+                     for j,i in todo]
+            results = (pool.map if pool is not None else map)(task,[survivors[j] for j,i in todo],seeds,
+                                                              [i for j,i in todo])
+            for (j,i),result in zip(todo,results):
+                done = store.trials(survivors[j])
+                done[i] = result
+                remaining[j] -= 1
+                if remaining[j] == 0:
+                    store.save(survivors[j],done)
+
+            ranking = []
+            for config in survivors:
+                runs = [store.trials(config)[i] for i in range(trials)]
+                ranking.append({'config': config,'score': score(runs),'trials': trials,
+                                'coverage': float(np.mean([run['coverage'] for run in runs])),
+                                'time': float(np.mean([run['time'] for run in runs])),
+                                'repeat': float(np.mean([run['repeat'] for run in runs]))})
+            ranking.sort(key=lambda record: -record['score'])
+            rungs.append(ranking)
+            if verbose:
+                print("{0} configurations x {1} trials, best {2:.4g} coverage %/s".format(
+                    len(ranking),trials,ranking[0]['score']))
+            if len(survivors) == 1 or (max_trials is not None and trials*eta > max_trials):
+                break
+            survivors = [record['config'] for record in ranking[:max(1,len(ranking)//eta)]]
+            trials *= eta
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return rungs
+
+def run_sweep(configs=27,space=SEARCH_SPACE,seed=None,**kwargs):
+    """
+    Sample configurations from the search space and rank them with successive halving
+    Input:
+    configs: number of configurations to sample, or a list of configurations
+    space: the search space, see SEARCH_SPACE
+    seed: seed of the sampling and of the rooms, None to use the one stored in the cache directory
+    Other keyword arguments are passed to successive_halving
+    Return: the rankings of successive_halving
+    """
+    seed = sweep_seed(kwargs.get('cache'),seed)
+    if isinstance(configs,int):
+        if kwargs.get('strategy') == 'greedy_algorithm':
+            space = {key: values for key,values in space.items() if key != 'generations'}
+        configs = sample_configs(configs,space,seed)
+    return successive_halving(configs,seed=seed,**kwargs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Tune the genetic algorithm with successive halving")
+    parser.add_argument('--configs',type=int,default=27,help="number of configurations to sample")
+    parser.add_argument('--strategy',choices=['genetic_algorithm','greedy_algorithm'],default='genetic_algorithm',
+                        help="strategy to tune")
+    parser.add_argument('--min-trials',type=int,default=2,help="number of trials per configuration in the first round")
+    parser.add_argument('--eta',type=int,default=3,help="only the best 1/eta configurations are promoted")
+    parser.add_argument('--max-trials',type=int,default=None,help="maximum number of trials per configuration")
+    parser.add_argument('--steps',type=int,default=100,help="number of steps per robot")
+    parser.add_argument('--sensor-range',type=int,default=1,help="sensor range of the robots")
+    parser.add_argument('--seed',type=int,default=None,
+                        help="seed of the sweep, by default the one stored in the cache directory")
+    parser.add_argument('--workers',type=int,default=None,help="number of worker processes")
+    parser.add_argument('--ga-engine',choices=['loop','array'],default='loop',help="genetic algorithm implementation")
+    parser.add_argument('--cache',default='sweep_cache',help="directory caching the trial results")
+    parser.add_argument('--output',default=None,help="JSON file to write the rankings of every round to")
+    args = parser.parse_args()
+
+    rungs = run_sweep(args.configs,seed=args.seed,min_trials=args.min_trials,eta=args.eta,max_trials=args.max_trials,
+                      strategy=args.strategy,steps=args.steps,sensor_range=args.sensor_range,workers=args.workers,
+                      ga_engine=args.ga_engine,cache=args.cache,verbose=True)
+    for record in rungs[-1]:
+        print("{0:.4g} coverage %/s ({1:.1f}% in {2:.3g} s, {3} trials): {4}".format(
+            record['score'],record['coverage'],record['time'],record['trials'],record['config']))
+    if args.output is not None:
+        with open(args.output,'w') as f:
+            json.dump(rungs,f,indent=1)
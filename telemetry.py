@@ -0,0 +1,206 @@
+"""
+Opt-in profiling of Roomba robots.
+
+Telemetry(sink).attach(r) wraps the main methods of the robot r with timers, so every
+step produces one record with the wall time and number of calls of each phase:
+
+step: the whole planning of the step (Roomba.step)
+create_minipath: creation of random minipaths (create_minipath and create_minipaths)
+evaluate_fitness: scoring of minipaths (evaluate_fitness_batch)
+selection: selection of the best genes in the genetic algorithm
+move_to: moving the robot
+
+and the genetic algorithm counters: generations run, children produced and the best score
+of every generation. A record covers one call to step and everything until the next one
+(usually the move_to of the planned cell).
+
+Records are passed to a sink, any object with a write(record) method. MemorySink keeps
+running totals in memory and JsonlSink writes one JSON line per step. A robot without
+telemetry attached runs its plain methods, so instrumentation costs nothing when disabled.
+
+Example:
+sink = MemorySink()
+telemetry = Telemetry(sink).attach(r)
+...
+telemetry.detach()
+print(sink.summary())
+"""
+import json
+import math
+import time
+
+# Methods of Roomba timed by Telemetry, and the phase they are recorded under
+PHASES = {'step': 'step','create_minipath': 'create_minipath','create_minipaths': 'create_minipath',
+          'evaluate_fitness_batch': 'evaluate_fitness','move_to': 'move_to'}
+
+
+class Telemetry(object):
+
+    """
+    Records the time spent in each phase of the robot's steps and sends one record per step to a sink
+
+    Attributes:
+
+    sink: Object receiving the records through its write(record) method
+    steps: Number of steps recorded so far
+    robot: The robot the telemetry is attached to
+
+    Methods:
+
+    attach(self,robot): Start recording the given robot
+    detach(self): Stop recording and send the last record
+    add_time(self,phase,seconds): Add the time of one call of a phase to the current record
+    generation(self,seconds,best_score,children): Record one generation of the genetic algorithm
+    flush(self): Send the current record to the sink
+    """
+
+    def __init__(self,sink):
+        self.sink = sink
+        self.steps = 0
+        self.robot = None
+        self._record = None
+
+    def attach(self,robot):
+        """
+        Wrap the methods of the robot listed in PHASES with timers. Return the telemetry itself.
+        """
+        self.robot = robot
+        robot.telemetry = self
+        for method,phase in PHASES.items():
+            setattr(robot,method,self._timed(phase,getattr(robot,method),method == 'step'))
+        return self
+
+    def detach(self):
+        """
+        Restore the plain methods of the robot and send the last record
+        """
+        for method in PHASES:
+            delattr(self.robot,method)
+        self.robot.telemetry = None
+        self.robot = None
+        self.flush()
+
+    def _timed(self,phase,method,new_step):
+        def timed(*args,**kwargs):
+            if new_step:
+                self.flush()
+                self._start_record(args[0] if args else kwargs.get('strategy'))
+            start = time.perf_counter()
+            try:
+                return method(*args,**kwargs)
+            finally:
+                self.add_time(phase,time.perf_counter()-start)
+        return timed
+
+    def _start_record(self,strategy=None):
+        self._record = {'step': self.steps,'strategy': strategy,'phases': {},'generations': 0,'children': 0,
+                        'best_scores': []}
+        self.steps += 1
+
+    def add_time(self,phase,seconds):
+        if self._record is None:
+            self._start_record()
+        timing = self._record['phases'].setdefault(phase,[0.0,0])
+        timing[0] += seconds
+        timing[1] += 1
+
+    def generation(self,seconds,best_score,children):
+        """
+        Record one generation of the genetic algorithm
+        Input:
+        seconds: time spent in the selection
+        best_score: best score of the population after the selection
+        children: number of children produced in this generation
+        """
+        self.add_time('selection',seconds)
+        self._record['generations'] += 1
+        self._record['children'] += children
+        self._record['best_scores'].append(float(best_score))
+
+    def flush(self):
+        if self._record is not None:
+            self.sink.write(self._record)
+            self._record = None
+
+
+class MemorySink(object):
+
+    """
+    Sink aggregating the records in memory
+
+    Attributes:
+
+    phases: Total wall time and number of calls of each phase, {phase: [seconds, calls]}
+    steps: Number of records received
+    generations: Total number of generations run
+    children: Total number of children produced
+    best_scores: Best score of every generation of every step, in order
+    records: All the records received, if keep_records is True
+
+    Methods:
+
+    write(self,record): Add one record to the totals
+    summary(self): Return a text table with the time spent in each phase
+    """
+
+    def __init__(self,keep_records=False):
+        self.phases = {}
+        self.steps = 0
+        self.generations = 0
+        self.children = 0
+        self.best_scores = []
+        self.records = [] if keep_records else None
+
+    def write(self,record):
+        self.steps += 1
+        for phase,(seconds,calls) in record['phases'].items():
+            total = self.phases.setdefault(phase,[0.0,0])
+            total[0] += seconds
+            total[1] += calls
+        self.generations += record['generations']
+        self.children += record['children']
+        self.best_scores.extend(record['best_scores'])
+        if self.records is not None:
+            self.records.append(record)
+
+    def summary(self):
+        lines = ["{0:<18}{1:>12}{2:>10}{3:>14}".format('phase','seconds','calls','ms per step')]
+        for phase,(seconds,calls) in sorted(self.phases.items(),key=lambda item: -item[1][0]):
+            lines.append("{0:<18}{1:>12.4f}{2:>10}{3:>14.3f}".format(phase,seconds,calls,1000*seconds/max(self.steps,1)))
+        lines.append("{0} steps, {1} generations, {2} children".format(self.steps,self.generations,self.children))
+        return '\n'.join(lines)
+
+
+def _json_safe(value):
+    """
+    Return value with the infinite and NaN floats (e.g. the best score -inf of a generation where every gene
+    hits an obstacle) replaced by None, which standard JSON can hold
+    """
+    if isinstance(value,float):
+        return value if math.isfinite(value) else None
+    if isinstance(value,dict):
+        return {key: _json_safe(item) for key,item in value.items()}
+    if isinstance(value,(list,tuple)):
+        return [_json_safe(item) for item in value]
+    return value
+
+
+class JsonlSink(object):
+
+    """
+    Sink writing every record as one JSON line to a file, infinite and NaN scores being written as null
+
+    Methods:
+
+    write(self,record): Write one record
+    close(self): Close the file
+    """
+
+    def __init__(self,path):
+        self.file = open(path,'w')
+
+    def write(self,record):
+        self.file.write(json.dumps(_json_safe(record),allow_nan=False) + '\n')
+
+    def close(self):
+        self.file.close()
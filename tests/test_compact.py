@@ -0,0 +1,51 @@
+"""
+Behavior checks of the compact layout: a compact room runs like a dense one
+"""
+from classes import SetUp, Roomba, CompactLayout
+import numpy as np
+import pytest
+
+
+def run(compact,strategy,steps,nx=20,ny=20,num_obstacle=10,sensor_range=2):
+    room = SetUp(nx=nx,ny=ny,num_obstacle=num_obstacle,compact=compact)
+    room.create_obstacle(rng=np.random.default_rng(4))
+    r = Roomba(room,rng=np.random.default_rng(5),sensor_range=sensor_range,ga_engine='array')
+    path = [r.advance(strategy) for i in range(steps)]
+    return path,np.asarray(r.layout).copy(),np.asarray(r.visits).copy(),r.repeated_cell,r.dist_travelled
+
+
+@pytest.mark.parametrize('strategy,steps',[('random_walk',800),('greedy_algorithm',300),('genetic_algorithm',60),
+                                           ('frontier',400)])
+def test_compact_run_equals_dense_run(strategy,steps):
+    dense = run(False,strategy,steps)
+    compact = run(True,strategy,steps)
+    assert dense[0] == compact[0]
+    for a,b in zip(dense[1:],compact[1:]):
+        assert np.array_equal(a,b)
+
+def test_compact_run_with_many_visits_per_cell():
+    # More than 255 visits per cell on a long run in a small room
+    dense = run(False,'greedy_algorithm',3000,nx=3,ny=3,num_obstacle=0)
+    compact = run(True,'greedy_algorithm',3000,nx=3,ny=3,num_obstacle=0)
+    assert np.max(dense[2]) > 255
+    assert dense[0] == compact[0]
+    assert np.array_equal(dense[2],compact[2])
+
+def test_array_writes_match_dense_array():
+    rng = np.random.default_rng(0)
+    base = rng.choice([0,0,0,2],size=(9,7)).astype(np.uint8)
+    room = base.copy()
+    dense = base.copy()
+    layout = CompactLayout(base)
+    for i in range(20):
+        x = rng.integers(0,9,size=5)
+        y = rng.integers(0,7,size=5)
+        value = int(rng.integers(0,3))
+        dense[x,y] = value
+        layout[x,y] = value
+        assert np.array_equal(np.asarray(layout),dense)
+    layout[2,3] = 1
+    dense[2,3] = 1
+    assert np.array_equal(np.asarray(layout),dense)
+    # The room's layout is copied before the first write, never written to
+    assert np.array_equal(base,room)
@@ -0,0 +1,23 @@
+"""
+Behavior checks of the incremental cell counters
+"""
+from classes import SetUp, Roomba
+import numpy as np
+import pytest
+
+
+def test_counters_follow_the_layout():
+    room = SetUp(10,10,num_obstacle=4)
+    room.create_obstacle(rng=np.random.default_rng(0))
+    r = Roomba(room,rng=np.random.default_rng(0),debug=True)
+    for i in range(50):
+        r.advance('random_walk')
+    layout = np.asarray(r.layout)
+    assert r.cell_count == [int(np.count_nonzero(layout == code)) for code in range(3)]
+
+def test_counters_out_of_sync_message():
+    room = SetUp(6,6,num_obstacle=0)
+    r = Roomba(room,rng=np.random.default_rng(0))
+    r.cell_count[0] += 1
+    with pytest.raises(RuntimeError,match=r"tracked \[36, 1, 0\], recounted \[35, 1, 0\]"):
+        r.check_counters()
@@ -0,0 +1,57 @@
+"""
+Behavior checks of the experiment runners: the results only depend on the seed
+"""
+from experiment import run_experiment, run_campaign
+import numpy as np
+import os
+import pytest
+
+ARGS = {'trials': 4,'steps': 20,'strategies': ['random_walk','greedy_algorithm','frontier'],'seed': 11,
+        'room_args': {'nx': 8,'ny': 8,'num_obstacle': 3},'sensor_range': 2}
+
+
+def same_results(a,b):
+    assert list(a) == list(b)
+    for strategy in a:
+        for key in a[strategy]:
+            # Only the timings depend on how the trials are run
+            if key not in ('time','time_per_cell'):
+                assert np.array_equal(a[strategy][key],b[strategy][key]),(strategy,key)
+
+
+@pytest.mark.parametrize('workers',[2,3])
+def test_results_do_not_depend_on_workers(workers):
+    same_results(run_experiment(workers=1,**ARGS),run_experiment(workers=workers,**ARGS))
+
+
+def damage_nothing(path):
+    pass
+
+def damage_chunk(path):
+    # A chunk cut short in every column and a checkpoint that was being written
+    for root,dirs,files in os.walk(path):
+        for name in files:
+            if name.endswith('.bin'):
+                with open(os.path.join(root,name),'ab') as f:
+                    f.write(b'\x01'*13)
+    with open(os.path.join(path,'checkpoint.json.tmp'),'w') as f:
+        f.write('{"config"')
+
+def damage_checkpoint(path):
+    with open(os.path.join(path,'checkpoint.json'),'r+') as f:
+        f.truncate(len(f.read()) // 2)
+
+def damage_column(path):
+    column = os.path.join(path,'greedy_algorithm','coverage.bin')
+    os.truncate(column,os.path.getsize(column) - 3)
+
+
+@pytest.mark.parametrize('damage',[damage_nothing,damage_chunk,damage_checkpoint,damage_column])
+def test_campaign_resumes_after_interruption(tmp_path,damage):
+    path = str(tmp_path / 'campaign')
+    args = dict(ARGS,workers=1)
+    run_campaign(path,chunk=2,**dict(args,trials=4))
+    damage(path)
+    store = run_campaign(path,chunk=2,**dict(args,trials=6))
+    assert store.trials == 6
+    same_results(run_experiment(**dict(args,trials=6)),store.results())
@@ -0,0 +1,86 @@
+"""
+Behavior checks of the fitness function of the genetic and greedy algorithms
+"""
+from classes import SetUp, Roomba, FitnessCache
+import numpy as np
+import math
+import pytest
+
+
+def scalar_fitness(r,minipath,A=-30,B=50,C=-12,D=-1):
+    """
+    The fitness function scored one minipath at a time, cell by cell
+    """
+    dist = 0
+    uncleaned_cells = 0
+    delta_dist = 0
+    current_x = r.current_x
+    current_y = r.current_y
+    pass_through = []
+    repeat = 0
+    for x,y in minipath:
+        if abs(x-current_x) > 1 or abs(y-current_y) > 1 or r.layout[x,y] == 2:
+            dist += float('inf')
+        else:
+            dist += math.sqrt((current_x-x)**2 + (current_y-y)**2)
+        if r.layout[x,y] == 0 and (x,y) not in pass_through:
+            uncleaned_cells += 1
+            delta_dist += y - current_y
+        current_x = x
+        current_y = y
+        pass_through.append((x,y))
+        repeat += int(r.visits[x,y])
+    return A*dist + B*uncleaned_cells + C*delta_dist + D*repeat
+
+def walked_robot(compact=False,seed=0,sensor_range=4):
+    room = SetUp(12,12,num_obstacle=6,compact=compact)
+    room.create_obstacle(rng=np.random.default_rng(seed))
+    r = Roomba(room,rng=np.random.default_rng(seed),sensor_range=sensor_range)
+    for i in range(60):
+        r.advance('random_walk')
+    return r
+
+def population(r,n,rng):
+    """
+    Minipaths from the robot's position, a third of them with random cells (jumps, obstacles, repeated cells)
+    """
+    paths = r.create_minipaths(n)
+    noisy = rng.random(paths.shape[:2]) < 0.3
+    paths[noisy] = rng.integers(0,12,size=(int(noisy.sum()),2))
+    return paths
+
+
+@pytest.mark.parametrize('compact',[False,True])
+def test_batch_fitness_equals_scalar_fitness(compact):
+    rng = np.random.default_rng(1)
+    for seed in range(4):
+        r = walked_robot(compact,seed)
+        paths = population(r,200,rng)
+        for weights in ({},{'A': -10,'B': 20,'C': 3,'D': -2}):
+            batch = r.evaluate_fitness_batch(paths,**weights)
+            assert np.array_equal(batch,[scalar_fitness(r,path.tolist(),**weights) for path in paths])
+            assert np.array_equal(batch[:5],[r.evaluate_fitness(path,**weights) for path in paths[:5]])
+
+@pytest.mark.parametrize('engine',['loop','array'])
+@pytest.mark.parametrize('strategy',['genetic_algorithm','greedy_algorithm'])
+def test_fitness_cache_does_not_change_runs(engine,strategy):
+    runs = []
+    for cache in (None,64):
+        room = SetUp(12,12,num_obstacle=6)
+        room.create_obstacle(rng=np.random.default_rng(2))
+        r = Roomba(room,rng=np.random.default_rng(3),sensor_range=3,ga_engine=engine,fitness_cache=cache,
+                   ga_args={'generations': 20})
+        runs.append(([r.advance(strategy) for i in range(25)],r.repeated_cell,r.dist_travelled))
+    assert runs[0] == runs[1]
+    assert r.fitness_cache.hits > 0 and len(r.fitness_cache) <= 64
+
+def test_cached_scores_equal_computed_scores():
+    r = walked_robot()
+    r.fitness_cache = FitnessCache(50)
+    paths = population(r,80,np.random.default_rng(4))
+    plain = r._score_paths(paths,-30,50,-12,-1)
+    for weights in ({},{},{'D': -5}):
+        # Twice the same population: misses, then hits, then new weights
+        scores = r.evaluate_fitness_batch(paths,**weights)
+        assert np.array_equal(scores,r._score_paths(paths,**dict({'A': -30,'B': 50,'C': -12,'D': -1},**weights)))
+    assert np.array_equal(r.evaluate_fitness_batch(paths[:10]),plain[:10])
@@ -0,0 +1,34 @@
+"""
+Behavior checks of the fleets: planning on a process pool gives the same run as planning in this thread
+"""
+from classes import SetUp
+from fleet import Fleet
+import numpy as np
+import pytest
+
+
+def run(executor,compact):
+    room = SetUp(nx=20,ny=20,num_obstacle=6,compact=compact)
+    room.create_obstacle(rng=np.random.default_rng(3))
+    rng = np.random.default_rng(5)
+    coverage = []
+    with Fleet(room,['frontier','greedy_algorithm','random_walk'],seed=1,executor=executor,workers=2,
+               robot_args={'ga_engine': 'array'}) as fleet:
+        for tick in range(80):
+            coverage.append(fleet.step())
+            if tick % 20 == 10:
+                # The planning processes get the room again after an obstacle event
+                occupied = {(robot.current_x,robot.current_y) for robot in fleet.robots}
+                room.add_obstacles([cell for cell in map(tuple,rng.integers(0,20,size=(4,2)).tolist())
+                                    if cell not in occupied])
+    # The robots have private copies of the shared arrays again once the fleet is closed
+    return coverage,np.asarray(fleet.robots[0].layout).copy(),[robot.repeated_cell for robot in fleet.robots]
+
+
+@pytest.mark.parametrize('compact',[False,True])
+def test_process_planning_equals_serial_planning(compact):
+    serial = run(None,compact)
+    process = run('process',compact)
+    assert serial[0] == process[0]
+    assert np.array_equal(serial[1],process[1])
+    assert serial[2] == process[2]
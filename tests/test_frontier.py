@@ -0,0 +1,49 @@
+"""
+Behavior checks of the frontier strategy and its incremental distance field
+"""
+from classes import SetUp, Roomba
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize('compact',[False,True])
+def test_repaired_field_equals_rebuilt_field(compact):
+    for seed in range(8):
+        rng = np.random.default_rng(seed)
+        room = SetUp(15,12,num_obstacle=12,compact=compact)
+        room.create_obstacle(rng=rng)
+        try:
+            r = Roomba(room,rng=rng)
+        except RuntimeError:
+            continue
+        for step in range(500):
+            if r.check_clean():
+                break
+            r.advance('frontier')
+            if r._field_changes:
+                r._repair_distance_field()
+            repaired = r.distance.copy()
+            r._build_distance_field()
+            assert np.array_equal(repaired,r.distance),(seed,step)
+        assert r.check_clean()
+        assert r.calculate_coverage() == 100
+
+def test_components_match_flood_fill():
+    room = SetUp(30,30,num_obstacle=25)
+    room.create_obstacle(rng=np.random.default_rng(1))
+    labels = room.components
+    for label in np.unique(labels[labels >= 0]):
+        x,y = np.argwhere(labels == label)[0]
+        assert np.array_equal(room.flood_fill(x*room.ny + y),labels == label)
+
+def test_components_are_labelled_when_needed():
+    room = SetUp(30,30,num_obstacle=25)
+    room.create_obstacle(rng=np.random.default_rng(2))
+    r = Roomba(room,rng=np.random.default_rng(0))
+    for i in range(20):
+        r.advance('random_walk')
+    assert room._components is None
+    r.calculate_coverage()
+    assert room.components.dtype == np.int8
+    reachable = room.flood_fill(r.current_x*room.ny + r.current_y)
+    assert r.unreachable == np.count_nonzero((np.asarray(r.layout) == 0) & ~reachable)
@@ -0,0 +1,17 @@
+"""
+Behavior checks of the genetic algorithm options
+"""
+from classes import SetUp, Roomba
+import numpy as np
+import pytest
+
+
+def test_warm_start_needs_array_engine():
+    room = SetUp(10,10,num_obstacle=2)
+    room.create_obstacle(rng=np.random.default_rng(0))
+    with pytest.raises(ValueError):
+        Roomba(room,rng=np.random.default_rng(0),warm_start=True)
+    r = Roomba(room,rng=np.random.default_rng(0),sensor_range=3,ga_engine='array',warm_start=True,commit=1)
+    for i in range(5):
+        r.advance('genetic_algorithm')
+    assert r._survivors is not None
@@ -0,0 +1,93 @@
+"""
+Behavior checks of the obstacle events: the locally repaired structures equal the ones of a fresh room
+"""
+from classes import SetUp, Roomba, RANDOM_WALK_MOVES
+import numpy as np
+import pytest
+
+
+def same_partition(a,b):
+    if not np.array_equal(a < 0,b < 0):
+        return False
+    free = a >= 0
+    pairs = set(zip(a[free].tolist(),b[free].tolist()))
+    return len(pairs) == len(set(a[free].tolist())) == len(set(b[free].tolist()))
+
+def check_room(room,robots):
+    fresh = SetUp.from_layout(np.array(room.layout),compact=room.compact)
+    for key,value in room._neighbor_index.items():
+        if key[0] == 'mask':
+            assert np.array_equal(value,fresh.neighbor_mask(list(key[1:])))
+        else:
+            indptr,indices = fresh.neighbor_index(list(key))
+            assert np.array_equal(value[0],indptr) and np.array_equal(value[1],indices)
+    if room._free_neighbor_count is not None:
+        assert np.array_equal(room._free_neighbor_count,fresh.free_neighbor_count)
+    assert same_partition(room.components,fresh.components)
+    for r in robots:
+        r.check_counters()
+        layout = np.asarray(r.layout)
+        labels = room.components
+        assert np.array_equal(layout == 2,np.asarray(room.layout) == 2)
+        assert r.unreachable == np.count_nonzero((layout == 0) & (labels != labels[r.current_x,r.current_y]))
+        if r.distance is not None:
+            if r._field_changes:
+                r._repair_distance_field()
+            repaired = r.distance.copy()
+            r._build_distance_field()
+            assert np.array_equal(repaired,r.distance)
+
+
+@pytest.mark.parametrize('compact',[False,True])
+def test_events_repair_like_rebuild(compact):
+    for seed in range(6):
+        rng = np.random.default_rng(seed)
+        room = SetUp(14,13,num_obstacle=8,compact=compact)
+        room.create_obstacle(rng=rng)
+        if seed % 2 == 0:
+            room.layout.flags.writeable = False
+        robots = []
+        for k in range(3):
+            try:
+                robots.append(Roomba(room,rng=rng,ga_engine='array'))
+            except RuntimeError:
+                pass
+        room.neighbor_index(RANDOM_WALK_MOVES)
+        for t in range(30):
+            for r,strategy in zip(robots,['frontier','random_walk','greedy_algorithm']):
+                r.advance(strategy)
+            occupied = {(r.current_x,r.current_y) for r in robots}
+            if t % 2 == 0:
+                cells = [tuple(cell) for cell in rng.integers(0,[14,13],size=(3,2)).tolist() if tuple(cell) not in occupied]
+                room.add_obstacles(cells)
+            else:
+                obstacles = np.argwhere(np.asarray(room.layout) == 2)
+                room.remove_obstacles(obstacles[rng.choice(len(obstacles),min(3,len(obstacles)),replace=False)])
+            check_room(room,robots)
+
+def test_move_obstacles_onto_robot_leaves_room_unchanged():
+    room = SetUp(8,8,num_obstacle=0)
+    room.layout[3,3] = 2
+    room.layout_changed()
+    r = Roomba(room,rng=np.random.default_rng(0))
+    r.move_to(3,4)
+    layout = np.array(room.layout)
+    counts = list(r.cell_count)
+    with pytest.raises(ValueError):
+        room.move_obstacles([(3,3)],0,1)
+    assert np.array_equal(room.layout,layout)
+    assert r.cell_count == counts
+    check_room(room,[r])
+
+@pytest.mark.parametrize('cells',[[(-1,2)],[(2,2),(6,0)],[(0,-3)],[(1,6)]])
+def test_cells_outside_the_room_are_rejected(cells):
+    room = SetUp(6,6,num_obstacle=0)
+    room.layout[1,1] = 2
+    room.layout_changed()
+    r = Roomba(room,rng=np.random.default_rng(0))
+    layout = np.array(room.layout)
+    for event in (room.add_obstacles,room.remove_obstacles,lambda cells: room.move_obstacles(cells,1,0)):
+        with pytest.raises(ValueError):
+            event(cells)
+        assert np.array_equal(room.layout,layout)
+    check_room(room,[r])
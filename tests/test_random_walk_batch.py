@@ -0,0 +1,29 @@
+"""
+Behavior checks of the vectorized random walk engine
+"""
+from random_walk_batch import RandomWalkBatch
+import numpy as np
+import pytest
+
+
+def test_start_cells_have_a_free_neighbor():
+    layouts = np.zeros((50,6,6),dtype=np.uint8)
+    # The corner is free but walled in, and a few other free cells are too
+    layouts[:,0,1] = layouts[:,1,0] = layouts[:,1,1] = 2
+    layouts[:,3:6,3:6] = 2
+    layouts[:,4,4] = 0
+    batch = RandomWalkBatch(layouts,rng=np.random.default_rng(0))
+    starts = set(zip(batch.current_x.tolist(),batch.current_y.tolist()))
+    assert (0,0) not in starts and (4,4) not in starts
+    assert len(starts) > 1
+
+def test_free_corner_is_the_start():
+    batch = RandomWalkBatch(np.zeros((3,5,5),dtype=np.uint8),rng=np.random.default_rng(0))
+    assert np.all(batch.current_x == 0) and np.all(batch.current_y == 0)
+
+def test_room_without_start_cell():
+    layouts = np.full((2,4,4),2,dtype=np.uint8)
+    layouts[:,0,0] = 0
+    layouts[0,0,1] = 0
+    with pytest.raises(RuntimeError):
+        RandomWalkBatch(layouts)
@@ -0,0 +1,87 @@
+"""
+Behavior checks of the trajectory logs: the replayed state equals the live state at every move
+"""
+from classes import SetUp, Roomba
+from trajectory_log import TrajectoryLog, TrajectoryReplay
+import numpy as np
+import os
+import pytest
+
+
+def live_state(r):
+    return {'layout': np.asarray(r.layout).copy(),'visited': np.asarray(r.visits) > 0,
+            'position': (r.current_x,r.current_y),'repeat': r.repeated_cell,'dist': r.dist_travelled,
+            'coverage': r.calculate_coverage()}
+
+def record(path,compact,strategy,steps,chunk,events=False,detach=True):
+    """
+    Run a robot with a log and return the live state after every move
+    """
+    room = SetUp(nx=20,ny=20,num_obstacle=6,compact=compact)
+    room.create_obstacle(rng=np.random.default_rng(2))
+    r = Roomba(room,rng=np.random.default_rng(3),sensor_range=2,ga_engine='array')
+    log = TrajectoryLog(path,seed=7,room_id=2,meta={'strategy': strategy},chunk=chunk).attach(r)
+    truth = [live_state(r)]
+    event_rng = np.random.default_rng(9)
+    for i in range(steps):
+        moved = log.steps
+        r.advance(strategy)
+        if log.steps == moved:
+            continue
+        truth.append(live_state(r))
+        if events and i % 37 == 5:
+            free = [tuple(cell) for cell in np.argwhere(np.asarray(r.layout) == 0).tolist()
+                    if tuple(cell) != (r.current_x,r.current_y)]
+            room.add_obstacles([free[j] for j in event_rng.choice(len(free),2,replace=False)])
+            # The state of a move includes the events that followed it, its coverage in the log does not
+            truth[-1]['move_coverage'] = truth[-1]['coverage']
+            truth[-1]['layout'] = np.asarray(r.layout).copy()
+            truth[-1]['coverage'] = r.calculate_coverage()
+    if detach:
+        log.detach()
+    return log,truth
+
+def check_replay(replay,truth):
+    positions = replay.positions()
+    coverage = replay.coverage()
+    for step,state in enumerate(replay.states(range(replay.steps+1))):
+        live = truth[step]
+        assert np.array_equal(state['layout'],live['layout']),step
+        assert np.array_equal(state['visited'],live['visited']),step
+        assert state['position'] == live['position'] == tuple(positions[step]),step
+        assert state['repeat'] == live['repeat'] and state['dist'] == live['dist'],step
+        # The log stores the coverage after every move as float32
+        assert abs(state['coverage'] - live['coverage']) < 1e-4,step
+        assert abs(coverage[step] - live.get('move_coverage',live['coverage'])) < 1e-4,step
+
+
+@pytest.mark.parametrize('compact,strategy,steps,chunk,events',[(False,'random_walk',600,100,False),
+                                                                (True,'genetic_algorithm',80,16,False),
+                                                                (False,'frontier',300,50,True),
+                                                                (True,'frontier',300,50,True)])
+def test_replay_equals_live_state(tmp_path,compact,strategy,steps,chunk,events):
+    path = str(tmp_path / 'run.trj')
+    log,truth = record(path,compact,strategy,steps,chunk,events)
+    replay = TrajectoryReplay(path)
+    assert (replay.seed,replay.room_id,replay.meta) == (7,2,{'strategy': strategy})
+    assert replay.steps == len(truth) - 1
+    check_replay(replay,truth)
+
+def test_log_without_index_is_scanned(tmp_path):
+    path = str(tmp_path / 'run.trj')
+    log,truth = record(path,False,'random_walk',500,64,detach=False)
+    # A writer stopped in the middle of a chunk: no index, and a last chunk cut short
+    log.flush()
+    log._file.close()
+    os.truncate(path,os.path.getsize(path) - 5)
+    replay = TrajectoryReplay(path)
+    assert 0 < replay.steps < len(truth) - 1
+    assert replay.steps % 64 == 0
+    check_replay(replay,truth)
+
+def test_step_outside_log(tmp_path):
+    path = str(tmp_path / 'run.trj')
+    record(path,False,'random_walk',50,16)
+    replay = TrajectoryReplay(path)
+    with pytest.raises(ValueError):
+        replay.state(replay.steps + 1)
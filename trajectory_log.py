@@ -0,0 +1,327 @@
+"""
+Compact binary trajectory logs of Roomba runs, with replay and seek.
+
+TrajectoryLog(path).attach(r) records every move of the robot r, so a run can be looked at
+again, drawn (see render.render_log) or its metrics recomputed without running its strategy
+again. Like telemetry.py, the log wraps the methods of the robot, a robot without a log runs
+its plain methods.
+
+The log is one binary file:
+
+header: magic, then a JSON object with the room size, the seed and room id of the run and
+other metadata
+chunks: every chunk starts with a snapshot of the robot's state before its first move (position,
+repeated cells, distance travelled, coverage, and the cleaned, obstacle and visited cells as
+bit masks), followed by the cells moved to (int16 x,y pairs) and the coverage after every move
+(float32)
+index: the offset and first move of every chunk, followed by a trailer pointing to it
+
+A new chunk is started every chunk moves and after every obstacle event of the room, so the
+layout at any move is rebuilt by seeking to the snapshot of its chunk and applying at most
+chunk moves to it. A log whose writer stopped before the index was written (e.g. a crash)
+is read by scanning its complete chunks.
+
+Example:
+log = TrajectoryLog('run.trj',seed=0,room_id=3).attach(r)
+for i in range(1000):
+    r.advance('genetic_algorithm')
+log.detach()
+replay = TrajectoryReplay('run.trj')
+state = replay.state(500)
+"""
+import numpy as np
+import json
+import struct
+
+MAGIC = b'RMBTRAJ1'
+# Magic and length of the JSON header
+HEADER = struct.Struct('<8sI')
+# Tag, first move, number of moves, repeated cells, position, distance travelled and coverage of a chunk
+CHUNK = struct.Struct('<4sIIIhhdd')
+# Offset of the index and end tag
+TRAILER = struct.Struct('<Q8s')
+END = b'RMBTEND1'
+
+
+class TrajectoryLog(object):
+
+    """
+    Records the moves of a robot to a trajectory log file
+
+    Input: the path of the log file, and the seed and room id of the run
+
+    Attributes:
+
+    path: Path of the log file
+    seed: Seed of the run (an integer, e.g. the entropy of its SeedSequence), None if unknown
+    room_id: Id of the room, e.g. its index in a scenario file, None if unknown
+    meta: Dictionary of other JSON serializable information stored in the header, e.g. the strategy
+    chunk: Maximum number of moves per chunk
+    steps: Number of moves recorded so far
+    robot: The robot the log is attached to
+
+    Methods:
+
+    attach(self,robot): Start recording the moves of the robot
+    detach(self): Stop recording and close the file
+    flush(self): Write the moves recorded since the last chunk as a new chunk
+    """
+
+    def __init__(self,path,seed=None,room_id=None,meta=None,chunk=4096):
+        self.path = path
+        self.seed = seed
+        self.room_id = room_id
+        self.meta = meta or {}
+        self.chunk = chunk
+        self.steps = 0
+        self.robot = None
+        self._file = None
+        self._offsets = []
+        self._firsts = []
+        self._moves = []
+        self._coverage = []
+        self._snapshot = None
+        self._changed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        if self.robot is not None:
+            self.detach()
+
+    def attach(self,robot):
+        """
+        Write the header and wrap move_to and obstacles_changed of the robot. Return the log itself.
+        """
+        self.robot = robot
+        header = json.dumps({'nx': robot.room.nx,'ny': robot.room.ny,'seed': self.seed,'room_id': self.room_id,
+                             'meta': self.meta,'chunk': self.chunk}).encode()
+        self._file = open(self.path,'wb')
+        self._file.write(HEADER.pack(MAGIC,len(header)))
+        self._file.write(header)
+        robot.move_to = self._logged_move(robot.move_to)
+        robot.obstacles_changed = self._logged_event(robot.obstacles_changed)
+        return self
+
+    def detach(self):
+        """
+        Restore the plain methods of the robot, write the last chunk and the index and close the file
+        """
+        del self.robot.move_to
+        del self.robot.obstacles_changed
+        self.flush()
+        if self._changed or not self._offsets:
+            # The final state is not the snapshot of any chunk yet, store it in a chunk without moves
+            self._snapshot = self._take_snapshot()
+            self._write_chunk()
+        offset = self._file.tell()
+        self._file.write(b'INDX' + struct.pack('<I',len(self._offsets)))
+        self._file.write(np.array(self._offsets,dtype='<u8').tobytes())
+        self._file.write(np.array(self._firsts,dtype='<u4').tobytes())
+        self._file.write(TRAILER.pack(offset,END))
+        self._file.close()
+        self._file = None
+        self.robot = None
+
+    def _take_snapshot(self):
+        r = self.robot
+        layout = np.asarray(r.layout)
+        masks = np.stack((layout == 1,layout == 2,np.asarray(r.visits) > 0)).reshape(3,-1)
+        return (CHUNK.pack(b'CHNK',self.steps,0,r.repeated_cell,r.current_x,r.current_y,r.dist_travelled,
+                           r.calculate_coverage()),np.packbits(masks,axis=1,bitorder='little').tobytes())
+
+    def _write_chunk(self):
+        fields,masks = self._snapshot
+        fields = list(CHUNK.unpack(fields))
+        fields[2] = len(self._moves)
+        self._offsets.append(self._file.tell())
+        self._firsts.append(fields[1])
+        self._file.write(CHUNK.pack(*fields))
+        self._file.write(masks)
+        self._file.write(np.array(self._moves,dtype='<i2').reshape(-1,2).tobytes())
+        self._file.write(np.array(self._coverage,dtype='<f4').tobytes())
+        self._file.flush()
+        self._moves = []
+        self._coverage = []
+        self._snapshot = None
+
+    def flush(self):
+        if self._moves:
+            self._write_chunk()
+
+    def _logged_move(self,move_to):
+        def logged(x,y):
+            if not self._moves:
+                # The snapshot of a chunk is the state before its first move
+                self._snapshot = self._take_snapshot()
+                self._changed = False
+            move_to(x,y)
+            self._moves.append((x,y))
+            self._coverage.append(self.robot.calculate_coverage())
+            self.steps += 1
+            if len(self._moves) >= self.chunk:
+                self.flush()
+        return logged
+
+    def _logged_event(self,obstacles_changed):
+        def logged(*args,**kwargs):
+            # The moves before the event are replayed on the layout before it
+            self.flush()
+            result = obstacles_changed(*args,**kwargs)
+            self._changed = True
+            return result
+        return logged
+
+
+class TrajectoryReplay(object):
+
+    """
+    Reads a trajectory log and rebuilds the state of the robot at any move
+
+    Input: the path of the log file
+
+    Attributes:
+
+    nx, ny: Size of the room
+    seed, room_id, meta: The information given to the TrajectoryLog
+    steps: Number of moves in the log
+
+    Methods:
+
+    positions(self): Return the cell of the robot before the first move and after every move
+    coverage(self): Return the coverage before the first move and after every move
+    state(self,step): Return the state of the robot after the given number of moves
+    states(self,steps): Iterate over the states after the given numbers of moves
+    """
+
+    def __init__(self,path):
+        self.path = path
+        with open(path,'rb') as f:
+            magic,length = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError("{0} is not a trajectory log".format(path))
+            header = json.loads(f.read(length))
+            self._start = HEADER.size + length
+            self.nx = header['nx']
+            self.ny = header['ny']
+            self.seed = header['seed']
+            self.room_id = header['room_id']
+            self.meta = header['meta']
+            self._mask_bytes = -(-self.nx*self.ny // 8)
+            f.seek(0,2)
+            size = f.tell()
+            f.seek(size - TRAILER.size)
+            offset,end = TRAILER.unpack(f.read(TRAILER.size))
+            if end == END:
+                f.seek(offset + 4)
+                count = struct.unpack('<I',f.read(4))[0]
+                self._offsets = np.frombuffer(f.read(8*count),dtype='<u8').astype(np.int64)
+                self._firsts = np.frombuffer(f.read(4*count),dtype='<u4').astype(np.int64)
+            else:
+                self._scan(f,size)
+            self._counts = []
+            for offset in self._offsets:
+                f.seek(offset)
+                self._counts.append(CHUNK.unpack(f.read(CHUNK.size))[2])
+        if len(self._offsets) == 0:
+            raise ValueError("{0} has no complete chunk".format(path))
+        self.steps = int(self._firsts[-1] + self._counts[-1])
+        self._cached = None
+
+    def _scan(self,f,size):
+        """
+        Find the complete chunks of a log without index
+        """
+        offsets = []
+        firsts = []
+        offset = self._start
+        while offset + CHUNK.size <= size:
+            f.seek(offset)
+            tag,first,count = CHUNK.unpack(f.read(CHUNK.size))[:3]
+            end = offset + CHUNK.size + 3*self._mask_bytes + 8*count
+            if tag != b'CHNK' or end > size:
+                break
+            offsets.append(offset)
+            firsts.append(first)
+            offset = end
+        self._offsets = np.array(offsets,dtype=np.int64)
+        self._firsts = np.array(firsts,dtype=np.int64)
+
+    def _read_chunk(self,i):
+        """
+        Return the snapshot fields, masks, moves and coverage of chunk i, the last chunk read being cached
+        """
+        if self._cached is not None and self._cached[0] == i:
+            return self._cached[1]
+        with open(self.path,'rb') as f:
+            f.seek(self._offsets[i])
+            fields = CHUNK.unpack(f.read(CHUNK.size))
+            masks = np.frombuffer(f.read(3*self._mask_bytes),dtype=np.uint8).reshape(3,-1)
+            masks = np.unpackbits(masks,axis=1,count=self.nx*self.ny,bitorder='little').astype(bool)
+            moves = np.frombuffer(f.read(4*fields[2]),dtype='<i2').reshape(-1,2).astype(np.int64)
+            coverage = np.frombuffer(f.read(4*fields[2]),dtype='<f4')
+        chunk = {'fields': fields,'masks': masks,'moves': moves,'coverage': coverage}
+        self._cached = (i,chunk)
+        return chunk
+
+    def positions(self):
+        """
+        Return: an int16 array of shape (steps+1, 2) with the cell of the robot before the first move
+        and after every move
+        """
+        start = self._read_chunk(0)['fields'][4:6]
+        moves = [self._read_chunk(i)['moves'] for i in range(len(self._offsets))]
+        return np.concatenate([np.array([start])] + moves).astype(np.int16)
+
+    def coverage(self):
+        """
+        Return: a float array of shape (steps+1,) with the coverage before the first move and right after every
+        move (before the obstacle events that followed it, unlike state)
+        """
+        start = self._read_chunk(0)['fields'][7]
+        parts = [self._read_chunk(i)['coverage'] for i in range(len(self._offsets))]
+        return np.concatenate([[start]] + parts)
+
+    def state(self,step):
+        """
+        Rebuild the state of the robot after the given number of moves, and the obstacle events that followed
+        the last of them, from the snapshot of its chunk
+        Return:
+        A dictionary with the move number ('step'), the layout array ('layout', 0 uncleaned, 1 cleaned,
+        2 obstacle), the cells visited so far ('visited'), the position of the robot ('position'), the
+        repeated cells ('repeat'), the distance travelled ('dist') and the coverage ('coverage')
+        """
+        if not 0 <= step <= self.steps:
+            raise ValueError("step {0} is outside the log, which has {1} moves".format(step,self.steps))
+        # Last chunk starting at or before the step, the one written after an obstacle event if there are two
+        i = int(np.searchsorted(self._firsts,step,side='right')) - 1
+        chunk = self._read_chunk(i)
+        tag,first,count,repeat,x,y,dist,coverage = chunk['fields']
+        cleaned,obstacle,visited = chunk['masks']
+        layout = np.where(obstacle,2,cleaned.astype(np.uint8)).astype(np.uint8)
+        visited = visited.copy()
+        moves = chunk['moves'][:step-first]
+        if len(moves):
+            path = np.concatenate(([[x,y]],moves))
+            # Added one move at a time like Roomba.move_to, to get the same rounding
+            for length in np.sqrt(np.sum(np.diff(path,axis=0)**2,axis=1)).tolist():
+                dist += length
+            cells = moves[:,0]*self.ny + moves[:,1]
+            # Every move is a repeat except the first visit of a cell not visited before the chunk
+            unique = np.unique(cells)
+            repeat += len(cells) - int(np.count_nonzero(~visited[unique]))
+            layout.reshape(-1)[cells] = 1
+            visited[cells] = True
+            x,y = (int(value) for value in moves[-1])
+            coverage = float(chunk['coverage'][step-first-1])
+        return {'step': step,'layout': layout.reshape(self.nx,self.ny),'visited': visited.reshape(self.nx,self.ny),
+                'position': (x,y),'repeat': repeat,'dist': dist,'coverage': coverage}
+
+    def states(self,steps):
+        """
+        Iterate over the states after the given numbers of moves, see state. Steps in increasing order
+        only read every chunk once.
+        """
+        for step in steps:
+            yield self.state(step)
@@ -1,5 +1,3 @@
-import turtle
-from turtle import *
 from classes import SetUp, Roomba
 import time
 
@@ -26,8 +24,19 @@ def draw_room(r,start_x,start_y,board,box_size):
             square_color = 'grey' if room[i,j] == 2 else 'white' # toggle after a column
             draw_box(board,start_x+j*box_size,start_y+i*box_size,box_size,square_color)
 
-def visualize(r,strategy,box_size=30,steps=1000):
-    wn = Screen()
+def visualize(r,strategy,box_size=30,steps=1000,backend='turtle',output='run.gif',**render_args):
+    """
+    Animate the robot cleaning the room with the given strategy
+    backend: 'turtle' to draw it in an interactive turtle window, 'raster' to render it without a display
+    to output (a .gif, .mp4, .png pattern or directory, see render.py)
+    render_args: other keyword arguments of render.record for the raster backend, e.g. max_frames
+    """
+    if backend == 'raster':
+        import render
+        return render.record(r,strategy,output,steps=steps,**render_args)
+    # turtle needs a display, it is only imported for the interactive backend
+    import turtle
+    wn = turtle.Screen()
     board = turtle.Turtle()
     board.hideturtle()
     board.speed(0)
@@ -52,7 +61,7 @@ def visualize(r,strategy,box_size=30,steps=1000):
         y_coor = start_y+x*box_size - box_size/2
         turtle.goto(x_coor,y_coor)
     else:
-        r.layout[0,0] = 0
+        r.set_cell(0,0,0)
         r.x_start = 0
         r.y_start = 0
         r.current_x = 0